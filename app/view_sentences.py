@@ -31,7 +31,8 @@ except NameError:
     src_path = None
 
 
-from supply_chain_extract.utils import get_database,  get_knowledge_base_from_value_chain_data
+from supply_chain_extract.utils import get_database
+from supply_chain_extract.knowledge_base import load_kb
 from supply_chain_extract import get_configs_path, get_data_path
 
 pd.set_option("display.max_columns", 200)
@@ -69,10 +70,8 @@ art_db = client["news_articles"]
 # read in value chain data / knowledge base
 # ---
 
-# read in locally stored valued chains
-vc = pd.read_csv(get_data_path("VCHAINS.csv"))
-# get knowledge base
-kb = get_knowledge_base_from_value_chain_data(vc)
+# get knowledge base, from locally stored valued chains - cached after the first time
+kb = load_kb(get_data_path("VCHAINS.csv"))
 
 print("kb built")
 # ---
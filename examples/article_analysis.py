@@ -30,7 +30,8 @@ except NameError:
     print('issue with adding to path, probably due to __file__ not being defined')
     src_path = None
     
-from supply_chain_extract.utils import get_database
+from supply_chain_extract.utils import get_database, niave_long_to_short_name
+from supply_chain_extract.sentences import alternating_mentions, sentence_index
 from supply_chain_extract import get_configs_path, get_data_path
 
 from collections import Counter
@@ -43,31 +44,10 @@ def find_all_articles_with_name(articles, name):
     return [v for k, v in articles.items() if re.search(name, v["maintext"])]
 
 
-def remove_suffix(name, suffixes):
-    for s in suffixes:
-        # regex: space, word, space then any character to end
-        # or
-        name = re.sub(f" {s} .*$| {s}$", "", name)
-    return name
-
-
 def get_start_end(a, b, aname="a", bname="b"):
-
-    assert len(np.intersect1d(a, b)) == 0, f"some elements found in both 'a' and 'b'"
-
-    c = np.sort(np.concatenate([a, b]))
-    is_a = np.in1d(c, a)
-
-    res = []
-    names = []
-    for i in range(len(c)-1):
-        if is_a[i] != is_a[i+1]:
-            res.append((c[i], c[i+1]))
-            if is_a[i]:
-                names.append((aname, bname))
-            else:
-                names.append((bname, aname))
-
+    pts, a_first = alternating_mentions(a, b)
+    res = [tuple(p) for p in pts]
+    names = [(aname, bname) if af else (bname, aname) for af in a_first]
     return res, names
 
 if __name__ == "__main__":
@@ -299,37 +279,11 @@ if __name__ == "__main__":
     # ---
     # TODO: Replace this with MongoDB Mapping
 
-    # TODO: short_name_map needs to be reviewed!, preferable to use some NLP package (spacy?)
-    # This is pretty hard coded list of company name 'suffixes'
-    # - some of these were taken by counting suffixes occrances, removing those and repeating
-    # - others were just a gues
-    suffixes = ['Inc', 'Corp', 'Ltd', 'Co', 'PLC', 'SA', 'AG', 'LLC', 'NV', 'SE',
-                'ASA', 'Bhd', 'SpA', 'Association', 'Aerospace', 'AB', 'Oyj', "Plc"] + \
-               ['Co', 'Holdings', 'Group', 'Technologies', 'International',
-                'Systems', 'Energy', 'Communications', 'Airlines', 'Motor',
-                'Technology', 'Oil', 'Motors', 'Corp', 'Industries', 'Steel',
-                'Holding', 'Airways', 'Aviation', 'Automotive', 'Networks',
-                'Electronics', 'Digital', 'BP', 'Electric', 'Aircraft',
-                'US', 'Mobile', 'Software', 'Broadcom', 'Brands',
-                'Service', 'Semiconductor', 'Petroleum'] + \
-               ['Platforms', 'Precision', 'Industry', 'AeroSystems', 'Media', 'Petrochemical']
-
-
-
-    #  'International Business Machines Corp' -> 'IBM'
-    # 'News Corp' -> 'News Corp'
-    # NOTE: if it starts with air it needs two words
-
+    # suffixes are removed from names - see NAME_SUFFIXES in utils
     all_names = np.unique(np.concatenate([v["names_in_text"] for k, v in articles.items()]))
 
-    short_name = pd.DataFrame([(n, remove_suffix(n, suffixes)) for n in all_names],
-                              columns=["name", "short"])
-    # look at longer names
-    short_name["len"] = [len(n) for n in short_name["short"]]
-    short_name.sort_values("len", ascending=False, inplace=True)
-
     # making a mapping dictionary
-    short_name_map = {i[0]: i[1] for i in zip(short_name["name"], short_name["short"])}
+    short_name_map = niave_long_to_short_name(all_names)
 
     # HARDCODED!
     short_name_map['International Business Machines Corp'] = "IBM"
@@ -508,9 +462,9 @@ if __name__ == "__main__":
                 # - by taking the start of the first entity, identify the sentences
                 # - where that is before the end and take the maximum
                 # TODO: this should be double checked/validated
-                sloc = np.argmax(sp[0] < sent_end)
+                sloc = sentence_index(sp[0], sent_end)
                 # end sentence location
-                eloc = np.argmax(sp[1] < sent_end)
+                eloc = sentence_index(sp[1], sent_end)
 
                 # s = sent_list[0]
                 # s.char_span(start_idx=0, end_idx=200)
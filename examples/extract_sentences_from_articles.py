@@ -16,8 +16,6 @@ import sys
 import numpy as np
 import pandas as pd
 
-import spacy
-
 
 
 try:
@@ -30,7 +28,10 @@ except NameError:
     print('issue with adding to path, probably due to __file__ not being defined')
     src_path = None
 
-from supply_chain_extract.utils import get_database, niave_long_to_short_name, get_knowledge_base_from_value_chain_data
+from supply_chain_extract.utils import get_database, niave_long_to_short_name
+from supply_chain_extract.knowledge_base import load_kb, KBPairIndex
+from supply_chain_extract.sentences import get_sentence_splitter, entity_pair_windows, map_sentence_offsets
+from supply_chain_extract.name_matcher import LongToShortNameRewriter
 from supply_chain_extract import get_configs_path, get_data_path
 
 
@@ -42,26 +43,6 @@ def find_all_articles_with_name(articles, name):
 
 
 
-def get_start_end(a, b, aname="a", bname="b"):
-
-    assert len(np.intersect1d(a, b)) == 0, f"some elements found in both 'a' and 'b'"
-
-    c = np.sort(np.concatenate([a, b]))
-    is_a = np.in1d(c, a)
-
-    res = []
-    names = []
-    for i in range(len(c)-1):
-        if is_a[i] != is_a[i+1]:
-            res.append((c[i], c[i+1]))
-            if is_a[i]:
-                names.append((aname, bname))
-            else:
-                names.append((bname, aname))
-
-    return res, names
-
-
 def correct_names_in_main_text(articles):
     """
     there are instances where two companies with overlapping names with listed
@@ -157,46 +138,6 @@ def articles_containing_company_pair(articles, kb):
     return cpairs
 
 
-def replace_longer_names_with_shortest(text,
-                                       replace_names,
-                                       short_name_map,
-                                       verbose=False):
-    """given an article / text and set of names to replace (with shorter ones)"""
-
-    replace_dict = {rn: [rn] + short_name_map.get(rn, [])
-                    for rn in replace_names}
-
-    # shortest_name_dict
-
-    # replace the longest names first
-    replace_names.sort(key=lambda x: len(x))
-    replace_names = replace_names[::-1]
-
-    # for each name to replace in article - will replace with the shortest name
-    # replace each name with the shoartest name
-    replaced_names_dict = {}
-    for rn in replace_names:
-        # if the name to replace is no longer in the text - just skip
-        # i.e. if Exxon Mobil Corp -> Exxon Mobil then Mobil Corp won't be found
-        if re.search(rn, text) is None:
-            if verbose:
-                print(f"{rn} no longer found in text")
-            continue
-        # get the names to replace
-        names = replace_dict[rn]
-        shortest_name = names[-1]
-        longer_names = names[:-1]
-
-        replaced_names_dict[rn] = shortest_name
-        for ln in longer_names:
-            # search for long name in text - it's possible it may no longer exist
-            text = re.sub(ln, shortest_name, text)
-
-    # return the text with longer name(s) replaced with short name
-    # - along with dictionary for that mapping
-    return text, replaced_names_dict
-
-
 if __name__ == "__main__":
 
     pd.set_option("display.max_columns", 200)
@@ -212,6 +153,17 @@ if __name__ == "__main__":
     # make number of sentences to combine
     max_num_sentences_to_combine = 5
 
+    # sentence segmentation backend: 'spacy' or 'regex' (rule based, much faster, no model needed)
+    # - compare with: python -m supply_chain_extract.sentences
+    sentence_backend = "spacy"
+    # spacy: number of articles per batch and number of processes
+    sentence_batch_size = 64
+    # cache sentence offsets for each article's (original) text - so re-runs (i.e. after knowledge base or short
+    # name changes) don't segment articles again, the offsets are mapped to the modified text
+    # set to None to not cache
+    sentence_cache_path = get_data_path("sentence_cache.sqlite")
+    sentence_n_process = 4
+
     # ----
     # connect to database
     # ----
@@ -263,12 +215,11 @@ if __name__ == "__main__":
     # vc = pd.DataFrame(list(client["knowledge_base"]["KB"].find(filter={})))
     # vc.drop("_id", axis=1, inplace=True)
     # vc.to_csv(get_data_path("KB.csv"), index=False)
-    vc = pd.read_csv(get_data_path("KB.csv"))
-
-    # there are some missing comany names? exclude those
-    # vc = vc.loc[~pd.isnull(vc['Company Name'])]
+    # built from data/KB.csv - cached after the first time
+    kb = load_kb(get_data_path("KB.csv"))
 
-    kb = get_knowledge_base_from_value_chain_data(vc)
+    # look up relations by entity pair
+    pair_index = KBPairIndex(kb)
 
     # ---
     # filter: keep only articles that mention two (known) companies
@@ -304,6 +255,11 @@ if __name__ == "__main__":
         short_name_map[k].sort(key=lambda x: len(x))
         short_name_map[k] = short_name_map[k][::-1]
 
+    # replaces all the long names (and longer short names) with the shortest name in a single pass
+    # - names are matched literally, longest first, and replaced text is not matched again
+    # i.e. 'Exxon Mobil Corp' -> 'Exxon Mobil' then 'Mobil Corp' won't be found
+    name_rewriter = LongToShortNameRewriter(short_name_map)
+
     # for each article - replace the longer names with the short names
     # and store the long_to_short_names mapping (dict)
     for i, _ in enumerate(articles.items()):
@@ -311,11 +267,11 @@ if __name__ == "__main__":
         if i % 1000 == 0:
             print(f"{i}/{len(articles)}")
 
-        text, replace_dict = replace_longer_names_with_shortest(text=v['maintext'],
-                                                                replace_names=v['names_in_text'],
-                                                                short_name_map=short_name_map)
+        text, replace_dict, spans = name_rewriter.rewrite(v['maintext'], names=v['names_in_text'])
         # add modified text
         articles[k]['mod_maintext'] = text
+        # and where the names were replaced - to map sentence offsets from maintext
+        articles[k]['name_spans'] = spans
         # add the long name to short name mapping used
         # - NOTE: some other names may have been mapped
         articles[k]["long_to_short_names"] = replace_dict
@@ -327,14 +283,6 @@ if __name__ == "__main__":
 
     keys = list(articles.keys())
 
-    # ---
-    # remove carriage returns - to better separate sentences
-    # ---
-
-    for k in articles.keys():
-        articles[k]["mod_maintext"] = re.sub("\n", " ", articles[k]["mod_maintext"])
-        # articles[k]["mod_maintext"] = re.sub("“", "\"", articles[k]["mod_maintext"])
-
     # ----
     # get sentences
     # ----
@@ -342,25 +290,36 @@ if __name__ == "__main__":
     # TODO: perhaps want to get rid of sentences that start with \nFILE PHOTO
     #  - and end with \nFILE PHOTO
 
-    # use SpaCy to get sentences
+    # use SpaCy (or the regex splitter) to get sentences
     # - https://spacy.io/usage/spacy-101#annotations
-    # - requires:$ python -m spacy download en_core_web_md
-    nlp = spacy.load("en_core_web_sm")
-    # supply_chain_extract = spacy.load("en_core_web_lg")
-    # supply_chain_extract = spacy.load("en_core_web_md")
+    # - spacy requires:$ python -m spacy download en_core_web_sm
+    # - only the components needed for sentence boundaries are run
+    # - texts are given with their new lines: the regex splitter uses them (paragraphs, bullet '* ' lines),
+    #   spacy replaces them with spaces (to better separate sentences)
+    if sentence_backend == "spacy":
+        splitter = get_sentence_splitter("spacy", model="en_core_web_sm", cache_path=sentence_cache_path,
+                                         batch_size=sentence_batch_size, n_process=sentence_n_process)
+    else:
+        splitter = get_sentence_splitter(sentence_backend, cache_path=sentence_cache_path)
+
+    # sentence start and end positions for each article - articles are processed in batches as they are needed
+    # - the original text is segmented (it does not change with the knowledge base / short names,
+    #   so is found in the cache on re-runs) then mapped to the modified text
+    sentence_offsets = splitter.pipe(v["maintext"] for v in articles.values())
 
     # store results (sentences) in a list
     out = []
     # keep track of cases that fall over - investigate later
     investigate = []
     # increment over each of the articles that reference supply
-    for ii, _ in enumerate(articles.items()):
+    for ii, _ in enumerate(zip(articles.items(), sentence_offsets)):
 
         if ii % 1000 == 0:
             print(f"{ii}/{len(articles)}")
 
-        # get article key and details
-        k, v = _
+        # get article key and details, and it's sentence start and end positions (in mod_maintext)
+        (k, v), (sent_start, sent_end) = _
+        sent_start, sent_end = map_sentence_offsets(sent_start, sent_end, v["name_spans"])
 
         # ---
         # get the relations from the knowledge base
@@ -371,35 +330,19 @@ if __name__ == "__main__":
         # - store in dict
         combs = [(c[0], c[1]) for c in itertools.combinations(lnames, 2)]
 
-        relations = []
-        for cc in combs:
-            has_connection = np.in1d(kb['entity1'].values, cc) & np.in1d(kb['entity2'].values, cc)
-            # if there is a connection anywhere select it
-            # - this should pick up relations that go either way i.e. A supplies B and B supplies A
-            if has_connection.any():
-                relations.append(kb[has_connection].copy())
-            # otherwise, it is a negative case - set relation to NA (not available)
-            else:
-                relations.append(pd.DataFrame({"entity1": cc[0], "entity2": cc[1], "rel": "NA"}, index=[0]))
-
-        relations = pd.concat(relations)
+        # if there is a connection anywhere select it
+        # - this should pick up relations that go either way i.e. A supplies B and B supplies A
+        # otherwise, it is a negative case - set relation to NA (not available)
+        relations = [r for cc in combs for r in pair_index.relations_or_na(*cc)]
 
         # ---
         # for each entity pair get the sentences
         # ---
 
-        # provide text to spacy - just to get the sentences
-        text = articles[k]["mod_maintext"]
-
-        # apply spacy to text - just to get sentences
-        doc = nlp(text)
-
-        # get start and end positions
-        sent_list = list(doc.sents)
-        sent_start = np.array([sent.start_char for sent in doc.sents])
-        sent_end = np.array([sent.end_char for sent in doc.sents])
+        # remove carriage returns - one character for one, so the sentence offsets still apply
+        text = articles[k]["mod_maintext"].replace("\n", " ")
 
-        for idx, row in relations.iterrows():
+        for row in relations:
 
             # get the entities - mapped to their short names
             e1 = row["entity1"]
@@ -416,43 +359,23 @@ if __name__ == "__main__":
                 b = np.array([(m.start(), m.end()) for m in re.finditer(e2_short, text)])
 
                 # find points in the text to connect the two, via sentence
-                start_pts, start_names = get_start_end(a=a[:, 0], b=b[:, 0], aname=e1_short, bname=e2_short)
-                end_pts, end_names = get_start_end(a=a[:, 1], b=b[:, 1], aname=e1_short, bname=e2_short)
+                # - by taking the start of each entity, identify the sentences they are in
+                windows = entity_pair_windows(a, b, sent_start, sent_end)
             except Exception as e:
                 print(e)
                 investigate.append([k, (e1, e2)])
                 print(e1, e2)
                 continue
 
-            if len(start_pts) != len(end_pts):
-                print("starting points and end points not to the, expect them to be")
-                investigate.append([k, (e1, e2)])
-                print((e1, e2))
-                continue
-
             # TODO: check start, end names are the same
             # ---
             # get the full sentence
             # ---
-            for i, sp in enumerate(start_pts):
-                nme = start_names[i]
-                sp = start_pts[i]
-                ep = end_pts[i]
-
-                # --
-                # find the start sentence location
-                # --
-                # - by taking the start of the first entity, identify the sentences
-                # - where that is before the end and take the maximum
-
-                # TODO: this should be double checked/validated
-                # start sentence location
-                sloc = np.argmax(sp[0] < sent_end)
-                # end sentence location
-                eloc = np.argmax(sp[1] < sent_end)
-
-                left_start_char = sent_list[sloc].start_char
-                right_end_char = sent_list[eloc].end_char
+            for sloc, eloc, left_start_char, right_end_char in zip(windows["start_sent"],
+                                                                  windows["end_sent"],
+                                                                  windows["start_char"],
+                                                                  windows["end_char"]):
+
                 full_sentence = text[left_start_char: right_end_char]
 
                 #
@@ -483,6 +406,8 @@ if __name__ == "__main__":
                 #     too_long_count += 1
                 #     # print("sentence too long")
 
+    if sentence_cache_path is not None:
+        print(f"sentence cache: {splitter.hits} articles read from cache, {splitter.misses} segmented")
 
     # ----
     # write to file
@@ -26,7 +26,8 @@ except NameError:
     src_path = None
 
 
-from supply_chain_extract.utils import get_bidirectional_suppliers, get_knowledge_base_from_value_chain_data
+from supply_chain_extract.utils import get_bidirectional_suppliers
+from supply_chain_extract.knowledge_base import load_kb
 from supply_chain_extract import get_data_path
 
 if __name__ == "__main__":
@@ -37,11 +38,8 @@ if __name__ == "__main__":
     # read in value chain data / knowledge base
     # ---
 
-    # read in locally stored valued chaines
-    vc = pd.read_csv(get_data_path("KB.csv"))
-
-    # make knowledge base
-    kb = get_knowledge_base_from_value_chain_data(vc)
+    # make knowledge base from locally stored valued chaines - cached after the first time
+    kb = load_kb(get_data_path("KB.csv"))
 
     # ---
     # get bi-directional pairs
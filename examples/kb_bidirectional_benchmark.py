@@ -0,0 +1,110 @@
+# benchmark get_bidirectional_suppliers against the previous (loop based) implementation
+# - checks both return the same frame
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+
+try:
+    # python package (supply_chain_extract) location - two levels up from this file
+    src_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    # add package to sys.path if it's not already there
+    if src_path not in sys.path:
+        sys.path.extend([src_path])
+except NameError:
+    print('issue with adding to path, probably due to __file__ not being defined')
+    src_path = None
+
+
+from supply_chain_extract.utils import get_bidirectional_suppliers, get_knowledge_base_from_value_chain_data
+from supply_chain_extract import get_data_path
+
+
+def get_bidirectional_suppliers_loop(kb, verbose=False):
+    """previous implementation of get_bidirectional_suppliers - for comparison"""
+
+    e1s = kb["entity1"].values
+    e2s = kb["entity2"].values
+
+    # get the unique entities 1
+    e1s_u = np.unique(e1s)
+
+    bi_dir = []
+
+    # for each entity1 - get all the entity 2
+    # - then for each of those entity2 see if when
+    # - it's entity1 does it contain the other (org e1)
+    for i, e1 in enumerate(np.unique(e1s_u)):
+        if (i % 100 == 0) & verbose:
+            print(f"{i}/{len(e1s_u)}")
+
+        # all of e1's e2s
+        e1_e2s = e2s[e1s == e1]
+
+        # for each of the entity2, check if / when it's e1
+        for e1_e2 in e1_e2s:
+            if e1 in e2s[e1s == e1_e2]:
+                bi_dir.append((e1, e1_e2))
+
+    # for each bi-directional entity pair
+    out = []
+    for bd in bi_dir:
+        e1, e2 = bd
+        k1 = kb.loc[(kb["entity1"] == e1) & (kb["entity2"] == e2)]
+        k2 = kb.loc[(kb["entity1"] == e2) & (kb["entity2"] == e1)]
+        out.append(pd.concat([k1, k2]))
+
+    res = pd.concat(out)
+
+    # due to bi-directional nature there will be duplicates
+    # - drop those!
+    res = res.drop_duplicates()
+
+    return res
+
+
+if __name__ == "__main__":
+
+    # ---
+    # read in value chain data / knowledge base
+    # ---
+
+    vc = pd.read_csv(get_data_path("KB.csv"))
+    kb = get_knowledge_base_from_value_chain_data(vc, verbose=False)
+    print(f"knowledge base has: {len(kb)} rows, {len(np.unique(kb[['entity1', 'entity2']].values))} entities")
+
+    # ---
+    # time each
+    # ---
+
+    t0 = time.perf_counter()
+    res_loop = get_bidirectional_suppliers_loop(kb)
+    t1 = time.perf_counter()
+    res = get_bidirectional_suppliers(kb, verbose=False)
+    t2 = time.perf_counter()
+
+    print(f"loop: {t1 - t0:.3f}s, vectorized: {t2 - t1:.4f}s, speed up: {(t1 - t0) / (t2 - t1):.0f}x")
+    print(f"bi-directional rows: {len(res)}")
+
+    # same rows, in the same order
+    pd.testing.assert_frame_equal(res, res_loop)
+    print("results match")
+
+    # ---
+    # larger knowledge base: replicate with renamed entities (no pairs across copies)
+    # ---
+
+    copies = 20
+    big_kb = pd.concat([kb.assign(entity1=kb["entity1"] + f"_{i}",
+                                  entity2=kb["entity2"] + f"_{i}")
+                        for i in range(copies)], ignore_index=True)
+
+    t0 = time.perf_counter()
+    big_res = get_bidirectional_suppliers(big_kb, verbose=False)
+    t1 = time.perf_counter()
+    print(f"vectorized on: {len(big_kb)} rows: {t1 - t0:.4f}s, bi-directional rows: {len(big_res)}")
+    assert len(big_res) == copies * len(res)
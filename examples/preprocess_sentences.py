@@ -27,61 +27,13 @@ except NameError:
     src_path = None
 
 
-from supply_chain_extract.utils import get_database, niave_long_to_short_name, get_knowledge_base_from_value_chain_data
+from supply_chain_extract.utils import get_database, niave_long_to_short_name
+from supply_chain_extract.knowledge_base import load_kb
+from supply_chain_extract.dedupe import drop_near_duplicates
+from supply_chain_extract.preprocess import add_sentence_ids, drop_non_unique_ids, keep_non_overlapping, \
+    short_text, clean_sentences
 from supply_chain_extract import get_configs_path, get_data_path
 
-# https://stackoverflow.com/questions/17388213/find-the-similarity-metric-between-two-strings
-from difflib import SequenceMatcher
-import Levenshtein
-
-def similar(a, b):
-    return SequenceMatcher(None, a, b).ratio()
-
-
-# https://stackoverflow.com/questions/6690739/high-performance-fuzzy-string-comparison-in-python-use-levenshtein-or-difflib
-def keep_only_unique_text(e1, e2, fs, sim_thresh=0.9, verbose=True):
-    """"""
-
-
-    b = (fs['entity1_full'] == e1) & (fs['entity2_full'] == e2)
-    tmp = fs.loc[b, :]
-    short_text = tmp["short_text"].values
-
-    if verbose:
-        print(e1, e2)
-        print(f"started with {b.sum()}")
-
-    # keep array - initially all True
-    keep = np.ones(len(short_text), dtype=bool)
-    # store values for keeping track of / investigating
-    # chk = []
-    # for each entry compare to others
-    for i in range(len(short_text)):
-        # if the keep flag has been changed to False just contine
-        if keep[i]:
-            # for all the follow 'short_text' check how similar strings are
-            for j in range(i+1, len(keep)):
-                # if the one to check still has keep flag = True
-                if keep[j]:
-                    # measure distance
-                    # s = similar(short_text[i], short_text[j])
-                    s = Levenshtein.ratio(short_text[i], short_text[j])
-                    # if above threshold, set keep flag to False (i.e. drop it)
-                    if s > sim_thresh:
-                        keep[j] = False
-                        # print(s)
-                        # chk += [(i, j)]
-                else:
-                    pass
-        else:
-            pass
-
-    if verbose:
-        print(f"keeping: {keep.sum()}")
-
-    res = tmp.loc[keep]
-    return res
-
 
 if __name__ == "__main__":
 
@@ -107,15 +59,15 @@ if __name__ == "__main__":
     # - values to keep must be below this one
     sim_thresh = 0.9
 
+    # number of processes to split the entity pairs over when dropping similar sentences
+    dedupe_processes = 4
+
     # ---
     # read in value chain data / knowledge base
     # ---
 
-    # read in locally stored valued chaines
-    vc = pd.read_csv(get_data_path("KB.csv"))
-
-    # the knowledge base
-    kb = get_knowledge_base_from_value_chain_data(vc)
+    # the knowledge base, from locally stored valued chaines - cached after the first time
+    kb = load_kb(get_data_path("KB.csv"))
 
     # ---
     # read in full_sentences store locally
@@ -141,34 +93,13 @@ if __name__ == "__main__":
 
     print("adding a sentence 'id'")
 
-    # generate a condensed name - used for generating sentence id
-    # NOTE: some companies may map to the same abbreviated name
-    fs['e1'] = ["".join([i[:abbrv_char] for i in e.split(" ") if len(i) > 0])
-                for e in fs["entity1_full"].values]
-    fs['e2'] = ["".join([i[:abbrv_char] for i in e.split(" ") if len(i) > 0])
-                for e in fs["entity2_full"].values]
-    fs["sentence_range"] = fs[["start_sent", "end_sent"]].apply(lambda x: "|".join([str(i) for i in x]), axis=1)
-
-    id_col = ["article", "date_publish", "source_domain", "e1", "e2", "sentence_range"]
-    fs['id'] = fs[id_col].apply(lambda x: "_".join([re.sub(" |:|-", "", i) for i in x]), axis=1)
+    # id from: article, date_publish, source_domain, (condensed) entity names and sentence_range
+    # - also id_: the id without the sentence range
+    fs = add_sentence_ids(fs, abbrv_char=abbrv_char)
 
     # check the uniqueness of id
-    id_count = pd.pivot_table(fs,
-                              index='id',
-                              values='full_sentence',
-                              aggfunc='count')
-
     print("checking for none unique sentence 'id'")
-    id_count.sort_values('full_sentence', ascending=False, inplace=True)
-    id_count.reset_index(inplace=True)
-
-    print(f"there are {(id_count['full_sentence'] > 1).sum()} / {len(id_count['full_sentence'])} 'id's "
-          f"that have more than one sentence")
-    print("These will be dropped for now")
-
-    drop_id = id_count.loc[id_count["full_sentence"] > 1, "id"].values
-
-    fs = fs.loc[~fs['id'].isin(drop_id)]
+    fs = drop_non_unique_ids(fs)
 
     # ---
     # overlapping sentences
@@ -176,76 +107,35 @@ if __name__ == "__main__":
 
     print("handling overlapping sentences")
 
-    # for a given article - source - date - entity pair
-    fs['id_'] = fs['id'].apply(lambda x: "_".join(x.split("_")[:-1]))
-
-    id2_count = pd.pivot_table(fs,
-                               index='id_',
-                               values='full_sentence',
-                               aggfunc='count')
-    id2_count.sort_values('full_sentence', ascending=False, inplace=True)
-    id2_count.reset_index(inplace=True)
-
     # for each id_ find all the text that start with a given sentence
     # by taking the min of the end_sent we're finding the shortest text
     # that starts at start_sent for the given id_ (article, source, date, pair)
-    start_sent = pd.pivot_table(fs,
-                                index=["id_", "start_sent"],
-                                values=["end_sent"],
-                                aggfunc=over_lap_aggfunc).reset_index()
-    # take a subset of the data
-    fs = start_sent.merge(fs,
-                          on=['id_', "start_sent", "end_sent"],
-                          how="left")
+    fs = keep_non_overlapping(fs, aggfunc=over_lap_aggfunc)
 
     # ----
     # for each entity pair / triple - try to get only unique text
     # ----
 
-    fs['short_text'] = ["".join([i[0] for i in e.split(" ") if len(i) > 0])
-                        for e in fs['full_sentence']]
-
-    e_pairs = fs[['entity1_full', 'entity2_full']].drop_duplicates()
+    # first character of each word
+    fs['short_text'] = short_text(fs['full_sentence'])
 
     # store a dataframe (subset) of unique* sentences (per entity pair)
-    u_sent = []
-    e_pairs.index = np.arange(len(e_pairs))
-    for idx, row in e_pairs.iterrows():
-        print(f"{idx+1}/{len(e_pairs)}")
-        e1, e2 = row['entity1_full'], row['entity2_full']
-        u_sent += [keep_only_unique_text(e1, e2, fs)]
-
-    us = pd.concat(u_sent)
+    # - a sentence is dropped if it's 'short_text' is too similar (Levenshtein ratio > sim_thresh)
+    #   to an earlier one kept for the entity pair
+    us = drop_near_duplicates(fs,
+                              group_cols=['entity1_full', 'entity2_full'],
+                              text_col="short_text",
+                              sim_thresh=sim_thresh,
+                              processes=dedupe_processes)
 
     # ---
     # format full_sentence strings
     # ---
 
-    # us_tmp = us.copy(True)
-
-    # drop everything between () and/or {}, including the brackets
-    us["full_sentence"] = [re.sub("[\{\(].*?[\}\)]", "", i)
-                           for i in us["full_sentence"]]
-
-    # standardise the quotes ” -> " and ’ -> '
-    us["full_sentence"] = [re.sub("’", "'", i)
-                           for i in us["full_sentence"]]
-
-    us["full_sentence"] = [re.sub('”', '"', i)
-                           for i in us["full_sentence"]]
-    # double space
-    us["full_sentence"] = [re.sub('  ', ' ', i)
-                           for i in us["full_sentence"]]
-
-    # ---
-    # add some additional metrics
-    # ---
-
-    # number of characters
-    us["num_chars"] = [len(i) for i in us['full_sentence']]
-
-    # (approximate) number of tokens
-    us["num_tokens"] = [len(i.split(" ")) for i in us['full_sentence']]
+    # drop everything between () and/or {}, including the brackets, standardise the quotes ” -> " and ’ -> '
+    # and replace double spaces
+    # - also add some additional metrics: number of characters, (approximate) number of tokens
+    us = clean_sentences(us)
 
     # --
     # drop short_text
@@ -0,0 +1,136 @@
+# benchmark the sentence id / overlap / cleanup stage of preprocess_sentences
+# - columnar transforms (supply_chain_extract.preprocess) against the previous row wise implementation
+# - on a synthetic corpus of full sentences (default 1M), checks both give the same result
+#
+# usage: python preprocess_sentences_benchmark.py [num_sentences]
+
+import os
+import re
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+
+try:
+    # python package (supply_chain_extract) location - two levels up from this file
+    src_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    # add package to sys.path if it's not already there
+    if src_path not in sys.path:
+        sys.path.extend([src_path])
+except NameError:
+    print('issue with adding to path, probably due to __file__ not being defined')
+    src_path = None
+
+
+from supply_chain_extract.preprocess import add_sentence_ids, drop_non_unique_ids, keep_non_overlapping, \
+    short_text, clean_sentences
+
+
+def preprocess_rowwise(fs, abbrv_char=4, over_lap_aggfunc="min"):
+    """previous implementation (from preprocess_sentences) - for comparison"""
+
+    fs = fs.copy()
+    fs['e1'] = ["".join([i[:abbrv_char] for i in e.split(" ") if len(i) > 0])
+                for e in fs["entity1_full"].values]
+    fs['e2'] = ["".join([i[:abbrv_char] for i in e.split(" ") if len(i) > 0])
+                for e in fs["entity2_full"].values]
+    fs["sentence_range"] = fs[["start_sent", "end_sent"]].apply(lambda x: "|".join([str(i) for i in x]), axis=1)
+
+    id_col = ["article", "date_publish", "source_domain", "e1", "e2", "sentence_range"]
+    fs['id'] = fs[id_col].apply(lambda x: "_".join([re.sub(" |:|-", "", i) for i in x]), axis=1)
+
+    id_count = pd.pivot_table(fs, index='id', values='full_sentence', aggfunc='count')
+    id_count.reset_index(inplace=True)
+    drop_id = id_count.loc[id_count["full_sentence"] > 1, "id"].values
+    fs = fs.loc[~fs['id'].isin(drop_id)].copy()
+
+    fs['id_'] = fs['id'].apply(lambda x: "_".join(x.split("_")[:-1]))
+    start_sent = pd.pivot_table(fs,
+                                index=["id_", "start_sent"],
+                                values=["end_sent"],
+                                aggfunc=over_lap_aggfunc).reset_index()
+    fs = start_sent.merge(fs, on=['id_', "start_sent", "end_sent"], how="left")
+
+    fs['short_text'] = ["".join([i[0] for i in e.split(" ") if len(i) > 0])
+                        for e in fs['full_sentence']]
+    return fs
+
+
+def clean_rowwise(us):
+    """previous implementation (from preprocess_sentences) - for comparison"""
+    us = us.copy()
+    us["full_sentence"] = [re.sub("[\\{\\(].*?[\\}\\)]", "", i) for i in us["full_sentence"]]
+    us["full_sentence"] = [re.sub("’", "'", i) for i in us["full_sentence"]]
+    us["full_sentence"] = [re.sub('”', '"', i) for i in us["full_sentence"]]
+    us["full_sentence"] = [re.sub('  ', ' ', i) for i in us["full_sentence"]]
+    us["num_chars"] = [len(i) for i in us['full_sentence']]
+    us["num_tokens"] = [len(i.split(" ")) for i in us['full_sentence']]
+    return us
+
+
+def preprocess_columnar(fs, abbrv_char=4, over_lap_aggfunc="min"):
+    fs = add_sentence_ids(fs, abbrv_char=abbrv_char)
+    fs = drop_non_unique_ids(fs, verbose=False)
+    fs = keep_non_overlapping(fs, aggfunc=over_lap_aggfunc)
+    fs["short_text"] = short_text(fs["full_sentence"])
+    return fs
+
+
+def synthetic_sentences(n, seed=0):
+    """full sentences like those from extract_sentences_from_articles - with repeated ids and overlapping
+    sentence ranges, brackets, quotes and double spaces in the text"""
+    rng = np.random.default_rng(seed)
+
+    words = np.array(["Apple", "supplier", "chips", "the", "said", "on", "Tuesday", "(AAPL.O)", "{AAPL.O;-PCTCHNG:2}",
+                      "shares", "rose", "”quote”", "it’s", " ", "percent", "Foxconn", "orders", "iPhone", "demand"])
+    names = np.array(["Apple Inc", "Hon Hai Precision Industry Co Ltd", "Corning Inc", "Taiwan Semiconductor "
+                      "Manufacturing Co Ltd", "Samsung Electronics Co Ltd", "Qualcomm Inc", "Boeing Co",
+                      "General Electric Co", "Amazon.com Inc", "Microsoft Corp"])
+
+    num_articles = max(n // 8, 1)
+    article = rng.integers(0, num_articles, n)
+    e = rng.integers(0, len(names), (n, 2))
+    start_sent = rng.integers(0, 20, n)
+    num_words = rng.integers(5, 40, n)
+    word_idx = rng.integers(0, len(words), num_words.sum())
+    sentences = [" ".join(w) for w in np.split(words[word_idx], np.cumsum(num_words)[:-1])]
+
+    return pd.DataFrame({"full_sentence": sentences,
+                         "entity1": names[e[:, 0]],
+                         "entity2": names[e[:, 1]],
+                         "relation": "Supplier",
+                         "entity1_full": names[e[:, 0]],
+                         "entity2_full": names[e[:, 1]],
+                         "start_sent": start_sent,
+                         "end_sent": start_sent + rng.integers(0, 3, n),
+                         "num_sentence": 1,
+                         "article": [f"2019-01-{a % 28 + 1:02d}_article-{a}" for a in article],
+                         "date_publish": [f"2019-01-{a % 28 + 1:02d} 10:{a % 60:02d}:00" for a in article],
+                         "source_domain": "www.reuters.com"})
+
+
+if __name__ == "__main__":
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+    t0 = time.perf_counter()
+    fs = synthetic_sentences(n)
+    print(f"synthetic sentences: {len(fs)}, made in {time.perf_counter() - t0:.1f}s")
+
+    # ---
+    # time each
+    # ---
+
+    t0 = time.perf_counter()
+    res_rowwise = clean_rowwise(preprocess_rowwise(fs))
+    t1 = time.perf_counter()
+    res = clean_sentences(preprocess_columnar(fs))
+    t2 = time.perf_counter()
+
+    print(f"row wise: {t1 - t0:.2f}s, columnar: {t2 - t1:.2f}s, speed up: {(t1 - t0) / (t2 - t1):.1f}x")
+    print(f"sentences kept: {len(res)}")
+
+    pd.testing.assert_frame_equal(res, res_rowwise, check_dtype=False)
+    print("results match")
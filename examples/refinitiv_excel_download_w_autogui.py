@@ -28,6 +28,7 @@ except NameError:
 from supply_chain_extract.browser import start_browser
 from supply_chain_extract import get_configs_path, get_data_path, get_image_path
 from supply_chain_extract.utils import get_database, search_company
+from supply_chain_extract.graph import SupplyChainGraph
 
 
 
@@ -259,34 +260,15 @@ def get_all_suppliers(page_info, parent_ticker, client=None, data_dir=None, sele
     # given a parent ticker - get its suppliers, and theirs, and theirs, and so on
     # ---
 
-    # given the parent - get
-    keep_looking = True
-    # get track of parents where already 'got suppliers'
-    got_suppliers = []
-    parents = np.array([parent_ticker])
-    # TODO: could put in a max_depth into get_all_suppliers
-    depth = 0
-    while keep_looking:
-        depth += 1
-        parents_len = len(parents)
-        print(f"number of parents: {parents_len}")
-        # for each 'parent'/customer get their suppliers
-        all_suppliers = []
-        for p in parents:
-            if p not in got_suppliers:
-                b = (prev_fetched["Relationship"] == "Supplier") & (prev_fetched["Parent Id"] == p)
-                supplies = np.unique(prev_fetched.loc[b, "Identifier"].values)
-                got_suppliers += [p]
-                all_suppliers += [supplies]
-        # concatenate all suppliers to parents
-        parents = np.concatenate([parents] + all_suppliers)
-        parents = np.unique(parents)
-
-        if parents_len == len(parents):
-            keep_looking = False
-        elif depth >= max_depth:
-            print("hit max depth down the chain, stopping here")
-            keep_looking = False
+    # supplier (Identifier) -> customer (Parent Id) graph of the selected entries
+    sup = prev_fetched.loc[prev_fetched["Relationship"] == "Supplier"]
+    g = SupplyChainGraph.from_edges(suppliers=sup["Identifier"].values,
+                                    customers=sup["Parent Id"].values)
+
+    # suppliers, and theirs, and so on - up to max_depth tiers up the chain
+    tiers = g.tiers([parent_ticker], direction="upstream", max_depth=max_depth)
+    print(f"number of suppliers, by tier:\n{tiers['tier'].value_counts().sort_index().to_string()}")
+    parents = np.unique(np.concatenate([[parent_ticker], tiers["entity"].values.astype(str)]))
 
     # ----
     # return
@@ -27,7 +27,8 @@ except NameError:
     src_path = None
 
 
-from supply_chain_extract.utils import get_database, niave_long_to_short_name, get_knowledge_base_from_value_chain_data
+from supply_chain_extract.utils import get_database, niave_long_to_short_name
+from supply_chain_extract.knowledge_base import load_kb
 from supply_chain_extract import get_configs_path, get_data_path
 
 
@@ -64,13 +65,9 @@ if __name__ == "__main__":
     # read in value chain data / knowledge base
     # ---
 
-    vc = pd.DataFrame(list(client["knowledge_base"]["KB"].find(filter={})))
-
-    # there are some missing comany names? exclude those
-    vc = vc.loc[~pd.isnull(vc['Company Name'])]
-
-    # the knowledge base
-    kb = get_knowledge_base_from_value_chain_data(vc)
+    # the knowledge base - only built (from the whole collection) if the collection has changed
+    # - entries with missing company names are dropped when building
+    kb = load_kb(client["knowledge_base"]["KB"])
 
     # ---
     # read in full_sentences store locally
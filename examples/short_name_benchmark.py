@@ -0,0 +1,78 @@
+# benchmark niave_long_to_short_name against the previous implementation (one re.sub per suffix per name)
+# - on all the names in the value chain data (data/KB.csv)
+# - checks both return the same mapping
+
+import os
+import re
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+
+try:
+    # python package (supply_chain_extract) location - two levels up from this file
+    src_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    # add package to sys.path if it's not already there
+    if src_path not in sys.path:
+        sys.path.extend([src_path])
+except NameError:
+    print('issue with adding to path, probably due to __file__ not being defined')
+    src_path = None
+
+
+from supply_chain_extract.utils import niave_long_to_short_name, NAME_SUFFIXES
+from supply_chain_extract import get_data_path
+
+
+def remove_suffix_loop(name, suffixes):
+    """previous implementation of remove_suffix - for comparison"""
+    for s in suffixes:
+        # regex: space, word, space then any character to end
+        # or
+        name = re.sub(f" {s} .*$| {s}$", "", name)
+    return name
+
+
+def niave_long_to_short_name_loop(all_names, suffixes):
+    """previous implementation of niave_long_to_short_name - for comparison"""
+    short_name = pd.DataFrame([(n, remove_suffix_loop(n, suffixes)) for n in all_names],
+                              columns=["name", "short"])
+    # look at longer names
+    short_name["len"] = [len(n) for n in short_name["short"]]
+    short_name.sort_values("len", ascending=False, inplace=True)
+
+    # making a mapping dictionary
+    short_name_map = {i[0]: i[1] for i in zip(short_name["name"], short_name["short"])}
+
+    return short_name_map
+
+
+if __name__ == "__main__":
+
+    # ---
+    # all names in the value chain data
+    # ---
+
+    vc = pd.read_csv(get_data_path("KB.csv"))
+    all_names = np.unique(np.concatenate([vc["Parent Name"].dropna().astype(str),
+                                          vc["Company Name"].dropna().astype(str)]))
+    print(f"names: {len(all_names)}")
+
+    # ---
+    # time each
+    # ---
+
+    t0 = time.perf_counter()
+    res_loop = niave_long_to_short_name_loop(all_names, NAME_SUFFIXES)
+    t1 = time.perf_counter()
+    res = niave_long_to_short_name(all_names)
+    t2 = time.perf_counter()
+
+    print(f"loop: {t1 - t0:.3f}s, compiled: {t2 - t1:.4f}s, speed up: {(t1 - t0) / (t2 - t1):.0f}x")
+
+    # same mapping - ordered by the length of the short name
+    assert res == res_loop
+    assert [len(v) for v in res.values()] == sorted([len(v) for v in res_loop.values()], reverse=True)
+    print("results match")
@@ -9,7 +9,6 @@ import itertools
 from collections import OrderedDict
 
 
-from snorkel.labeling import labeling_function
 from snorkel.labeling import PandasLFApplier
 from snorkel.augmentation import PandasTFApplier
 from snorkel.labeling.model import MajorityLabelVoter
@@ -38,7 +37,9 @@ except NameError:
     src_path = None
 
 
-from supply_chain_extract.utils import get_database, niave_long_to_short_name, get_knowledge_base_from_value_chain_data
+from supply_chain_extract.utils import get_database, niave_long_to_short_name
+from supply_chain_extract.knowledge_base import load_kb
+from supply_chain_extract.labeling import RegexLF, ThresholdLF, apply_lfs, to_snorkel_lfs
 from supply_chain_extract import get_configs_path, get_data_path
 
 
@@ -69,6 +70,9 @@ if __name__ == "__main__":
     #
     min_score_for_pos = 0.995
 
+    # check the (column wise) label matrix against snorkel's PandasLFApplier - slow, calls each lf on each row
+    check_with_pandas_applier = False
+
     # output file
     output_file = get_data_path(f"weak_labels{'' if class_balance is None else '_w_class_balance' }.csv")
 
@@ -76,10 +80,8 @@ if __name__ == "__main__":
     # read in value chain data / knowledge base
     # ---
 
-    # read in locally stored valued chains
-    vc = pd.read_csv(get_data_path("KB.csv"))
-
-    kb = get_knowledge_base_from_value_chain_data(vc)
+    # from locally stored valued chains - cached after the first time
+    kb = load_kb(get_data_path("KB.csv"))
 
     # ---
     # read in full_sentences store locally
@@ -184,183 +186,55 @@ if __name__ == "__main__":
     # using a leading ' ' is to avoid matching in the middle of words
 
 
-    from snorkel.labeling import LabelingFunction
-
     # ---
-    # build labels in systematic way
+    # label functions as specs - applied column wise with apply_lfs
     # ---
 
-    # def regex_search(x, regex, label):
-    #     return label if re.search(regex, x.text, flags=re.I) else ABSTAIN
-    #
-    #
-    # def make_regex_lf(regex, label=None):
-    #     assert label is not None, "for wlabel is None, please provide a label"
-    #     name_suffix = re.sub("\|", "_", regex)
-    #     name_suffix = name_suffix.lstrip().rstrip()
-    #     name_suffix = re.sub(" ", "_", name_suffix)
-    #     return LabelingFunction(
-    #         name=f"regex_{name_suffix}",
-    #         f=regex_search,
-    #         resources=dict(keywords=regex, label=label),
-    #     )
-    #
-    #
-    # tmp = make_regex_lf(" buy | buys | buyer", label=1)
-    #
-    # regex_list = [r" supply",
-    #               r" supplier",
-    #               r" supplies",
-    #               r" buy | buys | buyer",
-    #               r" customer| client",
-    #               r" make| makes| maker",
-    #               r" made by| made for",
-    #               r" sell | sells | seller ",
-    #               r" sales",
-    #               r" provide| provides",
-    #               r" produce| produces",
-    #               r" contract",
-    #               r" shipment",
-    #               r" order| ordered",
-    #               r" agreement",
-    #               r" offer",
-    #               r" serve| serves",
-    #               r" delivered| delivers",
-    #               r" used by"]
-
-    @labeling_function()
-    def regex_supply(x):
-        return SUPPLIER if re.search(r" supply", x.text, flags=re.I) else ABSTAIN
-
-    @labeling_function()
-    def regex_supplier(x):
-        return SUPPLIER if re.search(r" supplier", x.text, flags=re.I) else ABSTAIN
-
-    @labeling_function()
-    def regex_supplies(x):
-        return SUPPLIER if re.search(r" supplies", x.text, flags=re.I) else ABSTAIN
-
-    @labeling_function()
-    def regex_buys(x):
-        return SUPPLIER if re.search(r" buy | buys | buyer ", x.text, flags=re.I) else ABSTAIN
-
-    @labeling_function()
-    def regex_customer(x):
-        return SUPPLIER if re.search(r" customer| client", x.text, flags=re.I) else ABSTAIN
-
-    @labeling_function()
-    def regex_make(x):
-        return SUPPLIER if re.search(r" make| makes| maker", x.text, flags=re.I) else ABSTAIN
-
-    @labeling_function()
-    def regex_made(x):
-        return SUPPLIER if re.search(r" made by| made for", x.text, flags=re.I) else ABSTAIN
-
-    @labeling_function()
-    def regex_sells(x):
-        return SUPPLIER if re.search(r" sell | sells | seller ", x.text, flags=re.I) else ABSTAIN
-
-    @labeling_function()
-    def regex_sales(x):
-        return SUPPLIER if re.search(r" sales", x.text, flags=re.I) else ABSTAIN
-
-    @labeling_function()
-    def regex_provides(x):
-        return SUPPLIER if re.search(r" provide| provides", x.text, flags=re.I) else ABSTAIN
-
-    @labeling_function()
-    def regex_produces(x):
-        return SUPPLIER if re.search(r" produce| produces", x.text, flags=re.I) else ABSTAIN
-
-    @labeling_function()
-    def regex_contract(x):
-        return SUPPLIER if re.search(r" contract", x.text, flags=re.I) else ABSTAIN
-
-    @labeling_function()
-    def regex_shipments(x):
-        return SUPPLIER if re.search(r" shipment", x.text, flags=re.I) else ABSTAIN
-
-    @labeling_function()
-    def regex_order(x):
-        return SUPPLIER if re.search(r" order| ordered", x.text, flags=re.I) else ABSTAIN
-
-    @labeling_function()
-    def regex_agreement(x):
-        return SUPPLIER if re.search(r" agreement", x.text, flags=re.I) else ABSTAIN
-
-    @labeling_function()
-    def regex_offer(x):
-        return SUPPLIER if re.search(r" offer", x.text, flags=re.I) else ABSTAIN
-
-    @labeling_function()
-    def regex_serves(x):
-        return SUPPLIER if re.search(r" serve| serves", x.text, flags=re.I) else ABSTAIN
-
-    @labeling_function()
-    def regex_deliver(x):
-        return SUPPLIER if re.search(r" delivered| delivers", x.text, flags=re.I) else ABSTAIN
-
-    @labeling_function()
-    def regex_used_by(x):
-        return SUPPLIER if re.search(r" used by", x.text, flags=re.I) else ABSTAIN
-
-
-    @labeling_function()
-    def relation_na(x):
-        """if there is not relation - that's probably the case so use it"""
-        return NO_REL if x['Confidence Score (%)'] == 0 else ABSTAIN
-
-    @labeling_function()
-    def relation_pos(x):
-        """if there is not relation - that's probably the case so use it"""
-        return SUPPLIER if x['Confidence Score (%)'] >= min_score_for_pos else ABSTAIN
-
-    @labeling_function()
-    def astrix_count(x):
-        """reuters specific - if there are many *'s (more than 1) assume
-        they represent bullet points - which are often unrelated (new bulletins)"""
-        return NO_REL if len(re.findall("\* ", x.text)) >= 2 else ABSTAIN
-
-    @labeling_function()
-    def dash_count(x):
-        """reuters specific - if there are many *'s (more than 1) assume
-        they represent bullet points - which are often unrelated (new bulletins)"""
-        return NO_REL if len(re.findall(" - ", x.text)) >= 3 else ABSTAIN
-
-    @labeling_function()
-    def dollar_sign_count(x):
-        """reuters specific - if there are many *'s (more than 1) assume
-        they represent bullet points - which are often unrelated (new bulletins)"""
-        return NO_REL if len(re.findall("\$ ", x.text)) >= 4 else ABSTAIN
-
-    @labeling_function()
-    def arrow_count(x):
-        """sometimes > are used for bullets, which are short, unrelated market comments"""
-        return NO_REL if len(re.findall(" >", x.text)) >= 2 else ABSTAIN
-
-    @labeling_function()
-    def cap_q_count(x):
-        """if there are many capital Q's in article then it's probably an earnings report"""
-        return NO_REL if len(re.findall(" Q", x.text)) >= 10 else ABSTAIN
-
-    @labeling_function()
-    def percent_symbol_count(x):
-        """articles with many % symbols are often market commentary"""
-        return NO_REL if len(re.findall(" \%", x.text)) >= 2 else ABSTAIN
-
-    @labeling_function()
-    def percent_word_count(x):
-        """articles with the word percent many time are often market commentary"""
-        return NO_REL if len(re.findall(" percent", x.text, re.IGNORECASE)) >= 3 else ABSTAIN
-
-
-    @labeling_function()
-    def companies_in_text(x):
-        """consider only the number of sentence e2 is in, with the idea the fewer the better
-        - less popular suggests a relationship will be mentioned?
-        NOTE: often all companies are not identified (using our KB) """
-        return NO_REL if x.companies_in_text >= 5 else ABSTAIN
-
+    # RegexLF(name, pattern, label, min_count=1, flags=0):
+    # - label if pattern is found at least min_count times (min_count=1 is the same as re.search)
+    # ThresholdLF(name, column, op, value, label):
+    # - label if x[column] <op> value
+
+    regex_supply = RegexLF("regex_supply", r" supply", SUPPLIER, flags=re.I)
+    regex_supplier = RegexLF("regex_supplier", r" supplier", SUPPLIER, flags=re.I)
+    regex_supplies = RegexLF("regex_supplies", r" supplies", SUPPLIER, flags=re.I)
+    regex_buys = RegexLF("regex_buys", r" buy | buys | buyer ", SUPPLIER, flags=re.I)
+    regex_customer = RegexLF("regex_customer", r" customer| client", SUPPLIER, flags=re.I)
+    regex_make = RegexLF("regex_make", r" make| makes| maker", SUPPLIER, flags=re.I)
+    regex_made = RegexLF("regex_made", r" made by| made for", SUPPLIER, flags=re.I)
+    regex_sells = RegexLF("regex_sells", r" sell | sells | seller ", SUPPLIER, flags=re.I)
+    regex_sales = RegexLF("regex_sales", r" sales", SUPPLIER, flags=re.I)
+    regex_provides = RegexLF("regex_provides", r" provide| provides", SUPPLIER, flags=re.I)
+    regex_produces = RegexLF("regex_produces", r" produce| produces", SUPPLIER, flags=re.I)
+    regex_contract = RegexLF("regex_contract", r" contract", SUPPLIER, flags=re.I)
+    regex_shipments = RegexLF("regex_shipments", r" shipment", SUPPLIER, flags=re.I)
+    regex_order = RegexLF("regex_order", r" order| ordered", SUPPLIER, flags=re.I)
+    regex_agreement = RegexLF("regex_agreement", r" agreement", SUPPLIER, flags=re.I)
+    regex_offer = RegexLF("regex_offer", r" offer", SUPPLIER, flags=re.I)
+    regex_serves = RegexLF("regex_serves", r" serve| serves", SUPPLIER, flags=re.I)
+    regex_deliver = RegexLF("regex_deliver", r" delivered| delivers", SUPPLIER, flags=re.I)
+    regex_used_by = RegexLF("regex_used_by", r" used by", SUPPLIER, flags=re.I)
+
+    # if there is not relation - that's probably the case so use it
+    relation_na = ThresholdLF("relation_na", "Confidence Score (%)", "==", 0, NO_REL)
+    relation_pos = ThresholdLF("relation_pos", "Confidence Score (%)", ">=", min_score_for_pos, SUPPLIER)
+
+    # reuters specific - if there are many *'s (more than 1) assume
+    # they represent bullet points - which are often unrelated (new bulletins)
+    astrix_count = RegexLF("astrix_count", r"\* ", NO_REL, min_count=2)
+    dash_count = RegexLF("dash_count", r" - ", NO_REL, min_count=3)
+    dollar_sign_count = RegexLF("dollar_sign_count", r"\$ ", NO_REL, min_count=4)
+    # sometimes > are used for bullets, which are short, unrelated market comments
+    arrow_count = RegexLF("arrow_count", r" >", NO_REL, min_count=2)
+    # if there are many capital Q's in article then it's probably an earnings report
+    cap_q_count = RegexLF("cap_q_count", r" Q", NO_REL, min_count=10)
+    # articles with many % symbols, or the word percent, are often market commentary
+    percent_symbol_count = RegexLF("percent_symbol_count", r" \%", NO_REL, min_count=2)
+    percent_word_count = RegexLF("percent_word_count", r" percent", NO_REL, min_count=3, flags=re.I)
+
+    # the more companies in the text the less likely it's describing a supplier relation
+    # NOTE: often all companies are not identified (using our KB)
+    companies_in_text = ThresholdLF("companies_in_text", "companies_in_text", ">=", 5, NO_REL)
 
     # drop these ?
     # @labeling_function()
@@ -440,8 +314,13 @@ if __name__ == "__main__":
     # df_train = df.sample(20000, random_state=2)
     df_train = df.copy(True)
 
-    applier = PandasLFApplier(lfs=lfs)
-    L_train = applier.apply(df=df_train)
+    t0 = time.time()
+    L_train = apply_lfs(df_train, lfs, text_col="text")
+    print(f"applied {len(lfs)} label functions to {len(df_train)} rows in: {time.time() - t0:.2f}s")
+
+    if check_with_pandas_applier:
+        applier = PandasLFApplier(lfs=to_snorkel_lfs(lfs))
+        assert (applier.apply(df=df_train) == L_train).all(), "label matrix differs from PandasLFApplier's"
 
     print((L_train != ABSTAIN).mean(axis=0))
 
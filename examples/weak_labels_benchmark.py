@@ -0,0 +1,223 @@
+# benchmark applying the weak label functions (from weak_labels.py)
+# - column wise with supply_chain_extract.labeling.apply_lfs against snorkel's PandasLFApplier
+#   with the previous (python, row wise) label functions
+# - on a synthetic set of sentences (default 100k), checks both give the same label matrix
+#
+# usage: python weak_labels_benchmark.py [num_sentences]
+
+import os
+import re
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from snorkel.labeling import labeling_function
+from snorkel.labeling import PandasLFApplier
+
+
+try:
+    # python package (supply_chain_extract) location - two levels up from this file
+    src_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    # add package to sys.path if it's not already there
+    if src_path not in sys.path:
+        sys.path.extend([src_path])
+except NameError:
+    print('issue with adding to path, probably due to __file__ not being defined')
+    src_path = None
+
+
+from supply_chain_extract.labeling import RegexLF, ThresholdLF, apply_lfs
+
+
+SUPPLIER = 1
+NO_REL = 0
+ABSTAIN = -1
+
+min_score_for_pos = 0.995
+
+
+# ---
+# previous label functions (from weak_labels.py) - for comparison
+# ---
+
+@labeling_function()
+def regex_supply(x):
+    return SUPPLIER if re.search(r" supply", x.text, flags=re.I) else ABSTAIN
+
+@labeling_function()
+def regex_supplier(x):
+    return SUPPLIER if re.search(r" supplier", x.text, flags=re.I) else ABSTAIN
+
+@labeling_function()
+def regex_supplies(x):
+    return SUPPLIER if re.search(r" supplies", x.text, flags=re.I) else ABSTAIN
+
+@labeling_function()
+def regex_buys(x):
+    return SUPPLIER if re.search(r" buy | buys | buyer ", x.text, flags=re.I) else ABSTAIN
+
+@labeling_function()
+def regex_customer(x):
+    return SUPPLIER if re.search(r" customer| client", x.text, flags=re.I) else ABSTAIN
+
+@labeling_function()
+def regex_make(x):
+    return SUPPLIER if re.search(r" make| makes| maker", x.text, flags=re.I) else ABSTAIN
+
+@labeling_function()
+def regex_made(x):
+    return SUPPLIER if re.search(r" made by| made for", x.text, flags=re.I) else ABSTAIN
+
+@labeling_function()
+def regex_sells(x):
+    return SUPPLIER if re.search(r" sell | sells | seller ", x.text, flags=re.I) else ABSTAIN
+
+@labeling_function()
+def regex_provides(x):
+    return SUPPLIER if re.search(r" provide| provides", x.text, flags=re.I) else ABSTAIN
+
+@labeling_function()
+def regex_produces(x):
+    return SUPPLIER if re.search(r" produce| produces", x.text, flags=re.I) else ABSTAIN
+
+@labeling_function()
+def regex_order(x):
+    return SUPPLIER if re.search(r" order| ordered", x.text, flags=re.I) else ABSTAIN
+
+@labeling_function()
+def regex_deliver(x):
+    return SUPPLIER if re.search(r" delivered| delivers", x.text, flags=re.I) else ABSTAIN
+
+@labeling_function()
+def regex_used_by(x):
+    return SUPPLIER if re.search(r" used by", x.text, flags=re.I) else ABSTAIN
+
+@labeling_function()
+def regex_agreement(x):
+    return SUPPLIER if re.search(r" agreement", x.text, flags=re.I) else ABSTAIN
+
+@labeling_function()
+def relation_na(x):
+    return NO_REL if x['Confidence Score (%)'] == 0 else ABSTAIN
+
+@labeling_function()
+def relation_pos(x):
+    return SUPPLIER if x['Confidence Score (%)'] >= min_score_for_pos else ABSTAIN
+
+@labeling_function()
+def astrix_count(x):
+    return NO_REL if len(re.findall(r"\* ", x.text)) >= 2 else ABSTAIN
+
+@labeling_function()
+def arrow_count(x):
+    return NO_REL if len(re.findall(" >", x.text)) >= 2 else ABSTAIN
+
+@labeling_function()
+def dash_count(x):
+    return NO_REL if len(re.findall(" - ", x.text)) >= 3 else ABSTAIN
+
+@labeling_function()
+def dollar_sign_count(x):
+    return NO_REL if len(re.findall(r"\$ ", x.text)) >= 4 else ABSTAIN
+
+@labeling_function()
+def cap_q_count(x):
+    return NO_REL if len(re.findall(" Q", x.text)) >= 10 else ABSTAIN
+
+@labeling_function()
+def percent_symbol_count(x):
+    return NO_REL if len(re.findall(r" \%", x.text)) >= 2 else ABSTAIN
+
+@labeling_function()
+def percent_word_count(x):
+    return NO_REL if len(re.findall(" percent", x.text, re.IGNORECASE)) >= 3 else ABSTAIN
+
+@labeling_function()
+def companies_in_text(x):
+    return NO_REL if x.companies_in_text >= 5 else ABSTAIN
+
+
+row_wise_lfs = [regex_supply, regex_supplier, regex_supplies, regex_buys, regex_customer, regex_make,
+                regex_made, regex_sells, regex_provides, regex_produces, regex_order, regex_deliver,
+                regex_used_by, regex_agreement, relation_na, relation_pos, astrix_count, arrow_count,
+                dash_count, dollar_sign_count, cap_q_count, percent_symbol_count, percent_word_count,
+                companies_in_text]
+
+# ---
+# the same as specs - as in weak_labels.py
+# ---
+
+lf_specs = [
+    RegexLF("regex_supply", r" supply", SUPPLIER, flags=re.I),
+    RegexLF("regex_supplier", r" supplier", SUPPLIER, flags=re.I),
+    RegexLF("regex_supplies", r" supplies", SUPPLIER, flags=re.I),
+    RegexLF("regex_buys", r" buy | buys | buyer ", SUPPLIER, flags=re.I),
+    RegexLF("regex_customer", r" customer| client", SUPPLIER, flags=re.I),
+    RegexLF("regex_make", r" make| makes| maker", SUPPLIER, flags=re.I),
+    RegexLF("regex_made", r" made by| made for", SUPPLIER, flags=re.I),
+    RegexLF("regex_sells", r" sell | sells | seller ", SUPPLIER, flags=re.I),
+    RegexLF("regex_provides", r" provide| provides", SUPPLIER, flags=re.I),
+    RegexLF("regex_produces", r" produce| produces", SUPPLIER, flags=re.I),
+    RegexLF("regex_order", r" order| ordered", SUPPLIER, flags=re.I),
+    RegexLF("regex_deliver", r" delivered| delivers", SUPPLIER, flags=re.I),
+    RegexLF("regex_used_by", r" used by", SUPPLIER, flags=re.I),
+    RegexLF("regex_agreement", r" agreement", SUPPLIER, flags=re.I),
+    ThresholdLF("relation_na", "Confidence Score (%)", "==", 0, NO_REL),
+    ThresholdLF("relation_pos", "Confidence Score (%)", ">=", min_score_for_pos, SUPPLIER),
+    RegexLF("astrix_count", r"\* ", NO_REL, min_count=2),
+    RegexLF("arrow_count", r" >", NO_REL, min_count=2),
+    RegexLF("dash_count", r" - ", NO_REL, min_count=3),
+    RegexLF("dollar_sign_count", r"\$ ", NO_REL, min_count=4),
+    RegexLF("cap_q_count", r" Q", NO_REL, min_count=10),
+    RegexLF("percent_symbol_count", r" \%", NO_REL, min_count=2),
+    RegexLF("percent_word_count", r" percent", NO_REL, min_count=3, flags=re.I),
+    ThresholdLF("companies_in_text", "companies_in_text", ">=", 5, NO_REL),
+]
+
+
+def synthetic_sentences(n, seed=0):
+    """sentences with the words / symbols the label functions look for (in different cases), with
+    overlapping symbols (i.e. '* - >') and a confidence score and companies_in_text like weak_labels.py's"""
+    rng = np.random.default_rng(seed)
+
+    words = np.array(["Apple", "SUPPLY", "supplier", "Supplies", "buy", "buys", "buyer", "customer", "clients",
+                      "make", "maker", "made", "by", "for", "sell", "seller", "provides", "produce", "order",
+                      "ordered", "delivers", "used", "agreement", "*", "-", ">", "$", "Q", "Q3", "%", "Percent",
+                      "percent", "the", "said", "on", "shares", "rose", "Foxconn", "chips", "iPhone"])
+
+    num_words = rng.integers(5, 60, n)
+    word_idx = rng.integers(0, len(words), num_words.sum())
+    sentences = [" ".join(w) for w in np.split(words[word_idx], np.cumsum(num_words)[:-1])]
+
+    conf = rng.choice([0, 0.5, 0.99, 0.995, 1.0], n)
+    return pd.DataFrame({"text": sentences,
+                         "Confidence Score (%)": conf,
+                         "companies_in_text": rng.integers(2, 8, n)})
+
+
+if __name__ == "__main__":
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+    df = synthetic_sentences(n)
+    print(f"synthetic sentences: {len(df)}")
+
+    # ---
+    # time each
+    # ---
+
+    t0 = time.perf_counter()
+    L_row_wise = PandasLFApplier(lfs=row_wise_lfs).apply(df=df, progress_bar=False)
+    t1 = time.perf_counter()
+    L = apply_lfs(df, lf_specs, text_col="text")
+    t2 = time.perf_counter()
+
+    print(f"PandasLFApplier: {t1 - t0:.2f}s, apply_lfs: {t2 - t1:.2f}s, speed up: {(t1 - t0) / (t2 - t1):.1f}x")
+    print(f"label matrix: {L.shape}, {L.dtype}, fraction labelled (by lf):")
+    print(pd.Series((L != ABSTAIN).mean(axis=0), index=[lf.name for lf in lf_specs]).round(3).to_string())
+
+    assert [lf.name for lf in row_wise_lfs] == [lf.name for lf in lf_specs]
+    assert (L == L_row_wise).all()
+    print("label matrices match")
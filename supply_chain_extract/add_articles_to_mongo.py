@@ -9,6 +9,8 @@ import time
 import json
 import os
 import sys
+import argparse
+import multiprocessing
 import pandas as pd
 import numpy as np
 
@@ -27,10 +29,84 @@ except NameError:
     src_path = None
 
 
-from supply_chain_extract.utils import get_database, get_list_from_tree, make_reg_tree, get_config
+from supply_chain_extract.utils import get_database, get_config, get_company_names, get_set_name
+from supply_chain_extract.name_matcher import CompanyNameMatcher
+from supply_chain_extract.article_store import ArticleStore
 from supply_chain_extract import get_configs_path, get_data_path
 
 
+# set in each (pool) worker process by init_scan_worker
+# - to avoid sending the name matchers with every batch
+_scan_root = None
+_scan_matchers = None
+_scan_setname = None
+
+
+def init_scan_worker(root, matchers, setname=None):
+    """initialise a worker process with the directory of articles, the company name matchers
+    and the current set name"""
+    global _scan_root, _scan_matchers, _scan_setname
+    _scan_root = root
+    _scan_matchers = matchers
+    _scan_setname = setname
+
+
+def read_article(root, json_file):
+    """read in an article (json file), adding the 'json_file' name to it
+    root is either a directory of json files or an ArticleStore"""
+    if isinstance(root, ArticleStore):
+        a = root.get(json_file)
+    else:
+        with open(os.path.join(root, json_file), "r") as _:
+            a = json.load(_)
+    a["json_file"] = json_file
+    return a
+
+
+def scan_article_batch(batch, root=None, matchers=None, setname=None, keep_articles=False):
+    """read in a batch of articles and find the company names in each
+
+    batch: list of (json_file, combined set name) - the set name selects the matcher used
+    root, matchers: if None will use those set by init_scan_worker
+    setname: the current set name - articles already searched with this set
+    during extraction (see news_please.py) are not searched again
+    keep_articles: if True the article (dict) is returned for those with names found, so it does not need to be
+    read again (i.e. to insert) - otherwise None, to keep results small (i.e. returned from a worker process)
+
+    returns a list of (json_file, names_found, article) for every article read
+    and a list of the files that could not be read
+    """
+    root = _scan_root if root is None else root
+    matchers = _scan_matchers if matchers is None else matchers
+    setname = _scan_setname if setname is None else setname
+
+    results = []
+    bad_files = []
+    for jf, csn in batch:
+        try:
+            a = read_article(root, jf)
+        except json.decoder.JSONDecodeError:
+            bad_files.append(jf)
+            continue
+
+        # HACK: if matcher is None - i.e. company names were already found
+        # in previous set(s) then just skip
+        if matchers[csn] is None:
+            results.append((jf, [], None))
+            continue
+
+        # names found during extraction, with the current set of names, for an article not searched before
+        if (csn == "current_set") and (setname is not None) and (a.get("set_name") == setname):
+            names = a["names_in_text"]
+        else:
+            # get the company names found in the article - single pass over the text
+            # - this could return an empty list
+            names = matchers[csn].names_in_text(a["maintext"])
+        results.append((jf, names, a if keep_articles and (len(names) > 0) else None))
+
+    return results, bad_files
+
+
 if __name__ == "__main__":
 
     # TODO: review this script and clean up
@@ -44,9 +120,17 @@ if __name__ == "__main__":
     # common crawl config
     # ----
 
+    parser = argparse.ArgumentParser(description="add articles with company names (from knowledge base) to mongodb")
+    parser.add_argument("config", nargs="?", default=None,
+                        help="commoncrawl config (json), if not provided will use configs/commoncrawl.json")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes used to read and search articles for company names. "
+                             "if more than 1, writing to mongodb will overlap with searching the next batches")
+    args = parser.parse_args()
+
     # read in configuration file
-    # TODO: use parseargs instead of this!
-    cc_config = get_config(sysargv=sys.argv, argpos=1, verbose=True)
+    cc_config = get_config(sysargv=sys.argv[:1] + ([args.config] if args.config else []),
+                           argpos=1, verbose=True)
 
     print("*" * 50)
     print("using config file")
@@ -111,15 +195,7 @@ if __name__ == "__main__":
     # select company names from data
     # ---
 
-    if parents_only:
-        company_names = vc["Parent Name"].unique()
-    else:
-        # TODO: remove confidence score
-        company_names = np.concatenate([vc["Parent Name"].unique(),
-                                        vc.loc[vc['Confidence Score (%)'] > 0.9, "Company Name"].unique()])
-        # there are some nans in the data, on the Company Name side?
-        company_names = company_names[~pd.isnull(company_names)]
-        company_names = np.unique(company_names)
+    company_names = get_company_names(vc, parents_only=parents_only)
 
     print(f"have: {len(company_names)} to search")
 
@@ -129,6 +205,9 @@ if __name__ == "__main__":
 
     #  is it possible multiple articles are found on multiple days, and if yes, can we skip some days?
 
+    # articles are either stored one json file per article, or packed in a store (see article_store.py)
+    use_article_store = cc_config.get("my_article_store", "json") == "packed"
+
     # get the 'route directory'
     root = os.path.join(data_dir, host)
 
@@ -141,13 +220,19 @@ if __name__ == "__main__":
     # TODO: avoid using effectively duplicated variable here
     source = host
 
-    # identify the files in the directory
-    files = os.listdir(root)
     print("*" * 50)
     print(f"checking source:\n{source}")
 
-    # find all json files
-    json_files = [i for i in files if re.search("\.json$", i, re.IGNORECASE)]
+    if use_article_store:
+        # read articles from the store (by json_file name) instead of the directory
+        root = ArticleStore(data_dir, domains=[host])
+        json_files = root.json_files(host)
+    else:
+        # identify the files in the directory
+        files = os.listdir(root)
+
+        # find all json files
+        json_files = [i for i in files if re.search("\.json$", i, re.IGNORECASE)]
 
     print(f"there are {len(json_files)} (json) articles found in\n{root}")
 
@@ -159,31 +244,7 @@ if __name__ == "__main__":
     # refer to the 'set name' searched in article
     # - to avoid storing many long arrays in database which can slow things down
 
-    set_names = art_db["articles_searched"].find_one(filter={"docname": "setnames"})
-    # determine if the current set of names matches exactly another set previously used
-    # to search files
-    found_matching_set = False
-    for k, v in set_names["sets"].items():
-        # TODO: double check this logic, could use interest1d or union1d and then check size
-        if np.in1d(company_names, v).all() & (len(company_names) == len(v)):
-            print(f"current name set matched exactly: {k}")
-            found_matching_set = True
-            setname = k
-            break
-
-    if not found_matching_set:
-        # get the largest number in set name
-        largest_set_name = max([int(re.sub("\D", "", k)) for k in set_names["sets"].keys()])
-        setname = f"set_names{largest_set_name+1}"
-
-        # add the names in the current set to the 'setnames' doc
-        set_names['sets'][setname] = company_names.tolist()
-        doc_filter = {"docname": "setnames"}
-        print(f"adding: {setname} to document containing:\n{json.dumps(doc_filter, indent=4)}\nunder 'sets'")
-        # TODO: is there are more efficient way to update a nest field, than setting entire document? probably
-        art_db["articles_searched"].update_one(filter={"docname": "setnames"},
-                                               update={"$set": set_names},
-                                               upsert=True)
+    setname = get_set_name(art_db, company_names)
 
     # get all the documents that have been previously searched for
     # some set of company names already
@@ -210,20 +271,28 @@ if __name__ == "__main__":
     all_files = {}
 
     # increment over all the json_files found in the source
+    # - from the store articles are read sequentially (segment by segment)
     print("reading in json files")
     bad_files = []
-    for i, jf in enumerate(json_files):
+    if use_article_store:
+        articles_iter = root.iter_articles(host)
+    else:
+        articles_iter = ((jf, None) for jf in json_files)
+
+    for i, _ in enumerate(articles_iter):
+        jf, a = _
 
         if i % 10000 == 0:
             print(f"{i} / {len(json_files)}")
 
         # read in article - very quick (~1ms)
-        try:
-            with open(os.path.join(root, jf), "r") as _:
-                a = json.load(_)
-        except json.decoder.JSONDecodeError:
-            bad_files.append(jf)
-            continue
+        if a is None:
+            try:
+                with open(os.path.join(root, jf), "r") as _:
+                    a = json.load(_)
+            except json.decoder.JSONDecodeError:
+                bad_files.append(jf)
+                continue
 
         # if there is no 'maintext' skip
         if a['maintext'] is None:
@@ -311,8 +380,9 @@ if __name__ == "__main__":
     comp_not_in_set = {k: company_names[~np.in1d(company_names, v)]
                        for k, v in set_name_comb_dict.items()}
 
-    # for each of the above make a dict containing a 'regular expression tree'
+    # for each of the above make a dict containing a CompanyNameMatcher
     # use to search article for remaining articles
+    # - previously used a 'regular expression tree' (make_reg_tree), which was slow for many names
     rtree_dict = {}
     for k, cnames in comp_not_in_set.items():
         # if there are no company names to search - as some combination of previous searched
@@ -320,12 +390,10 @@ if __name__ == "__main__":
         if len(cnames) == 0:
             rtree_dict[k] = None
         else:
-            max_node = np.floor(1 + np.log(len(cnames)/50) / np.log(2))
-            rtree_dict[k] = make_reg_tree(c=cnames.tolist(), max_node=max_node)
-    # add rtree for the current set_name - to be used for articles that have not been searched at all
+            rtree_dict[k] = CompanyNameMatcher(cnames.tolist())
+    # add matcher for the current set_name - to be used for articles that have not been searched at all
     # - thus have no previous setnames
-    max_node = np.floor(1 + np.log(len(company_names)/50) / np.log(2))
-    rtree_dict["current_set"] = make_reg_tree(c=company_names.tolist(), max_node=max_node)
+    rtree_dict["current_set"] = CompanyNameMatcher(company_names.tolist())
 
     # get all the file names (articles) - with duplicates removed above
     all_files_names = np.array(list(use_files.keys()))
@@ -343,6 +411,13 @@ if __name__ == "__main__":
     batch_data = {i: files_to_search[i*batch_size: (i+1) * batch_size]
                   for i in range(num_batches + 1)}
 
+    # for each file in a batch get the previously searched (combined) set name
+    # - articles not previously searched use the 'current_set' - for getting the matcher
+    batch_data = {i: [(jf, article_searched_setname[jf]["comb_set_name"]
+                       if jf in article_searched_setname else "current_set")
+                      for jf in bd]
+                  for i, bd in batch_data.items()}
+
     print(f"there are: {len(files_to_search)} articles to be searched "
           f"with company name set: {setname}")
 
@@ -367,23 +442,28 @@ if __name__ == "__main__":
     found_count = 0
     t0 = time.perf_counter()
     td_ave = None
-    # TODO: create 'batches' of articles to read in at a time
 
-    # increment over data
-    for i, bd in batch_data.items():
-        # read in the files
-        batch_files = {}
-        print("reading in files for batch")
-        for jf in bd:
-            try:
-                with open(os.path.join(root, jf), "r") as _:
-                    a = json.load(_)
-            except json.decoder.JSONDecodeError:
-                bad_files.append(jf)
-                continue
-            a["json_file"] = jf
+    # read and search batches - either in this process or with a pool of workers
+    # - with a pool: workers continue searching the next batches while results of
+    # - a batch are being written to mongodb (below), results are returned in batch order
+    pool = None
+    if args.workers > 1:
+        print(f"searching articles with: {args.workers} worker processes")
+        pool = multiprocessing.Pool(args.workers,
+                                    initializer=init_scan_worker,
+                                    initargs=(root, rtree_dict, setname))
+        batch_results = pool.imap(scan_article_batch, batch_data.values())
+    else:
+        # articles with names are kept from the search (not read again to be inserted)
+        batch_results = (scan_article_batch(bd, root=root, matchers=rtree_dict, setname=setname,
+                                            keep_articles=True)
+                         for bd in batch_data.values())
 
-            batch_files[jf] = a
+    # increment over data
+    for i, _ in enumerate(batch_results):
+        # the (json_file, names_found, article) for each file read in the batch
+        results, batch_bad_files = _
+        bad_files += batch_bad_files
 
         # print progress information - after first batch
         if i > 0:
@@ -406,46 +486,13 @@ if __name__ == "__main__":
         bulk_update = []
 
         # for each file in batch read
-        for j, jf in enumerate(batch_files.keys()):
-
-            # TODO: here want to be able to get the previously searched company names
-            #  - NOTE: if the number of company names isn't too large (~500) it will run in a reasonable amount of time
-            #  - looks like there might be some O(n^2) element in the calculation
-
-            # get the articles
-            a = batch_files[jf]
-
-            # create a list to track the names in the articles
-            names_found_in_article = []
-
-            # get the previously searched sets -
-            if jf in article_searched_setname:
-                # get the previously searched combined set name
-                csn = article_searched_setname[jf]["comb_set_name"]
-            # otherwise, the articles was not searched previously
-            else:
-                # so use the 'current_set' - for getting the regression tree
-                csn = "current_set"
-
-            # HACK: if rtree would be None - i.e. company names were already found
-            # in previous set(s) then just skip
-            if rtree_dict[csn] is None:
-                continue
-
-            # determine a subset of company names to search for - to avoid for searching all names
-            # - this could return an empty list
-            cnames = get_list_from_tree(text=a["maintext"],
-                                        rtree=rtree_dict[csn])
+        for j, _ in enumerate(results):
+            jf, names_found_in_article, a = _
 
-            if len(cnames) > 0:
+            if len(names_found_in_article) > 0:
                 counter += 1
                 # print(f"{j}: {counter/(j+1):.2f}")
 
-            # search for specific names in article
-            for cn in cnames:
-                if re.search(cn, a["maintext"]):
-                    names_found_in_article.append(cn)
-
             # if found some names in article : add as value, and add to articles
             if len(names_found_in_article) > 0:
 
@@ -461,7 +508,11 @@ if __name__ == "__main__":
                                                               {"names_in_text": {"$each": names_found_in_article}}
                                                           })]
                 # otherwise, add to list bulk insert the article
+                # - from worker processes, articles with names are read in (again) here,
+                #   to keep the results from searching small
                 else:
+                    if a is None:
+                        a = read_article(root, jf)
                     a["names_in_text"] = names_found_in_article
                     articles_with_names.append(a)
                     bulk_insert.append(a)
@@ -487,7 +538,7 @@ if __name__ == "__main__":
         # NOTE: this is slow - but kind of unavoidable?
         # - should avoid searches in the future
         # update / insert setname for articles searched for in batch
-        batch_jf_files = list(batch_files.keys())
+        batch_jf_files = [jf for jf, _, _ in results]
 
         # get the _id for the json files (will exist if already searched)
         # - use to add to 'sets_searched' array
@@ -516,6 +567,10 @@ if __name__ == "__main__":
 
         print(f"time for (bulk) inserts and updates: {t1_ - t0_:.2f} seconds")
 
+    if pool is not None:
+        pool.close()
+        pool.join()
+
 
 
 
@@ -0,0 +1,263 @@
+# packed, indexed store of (news) articles - an alternative to writing one json file per article
+# - one directory per source domain (as with the json files), each containing 'segment' files
+# - a segment is append only: articles are json lines, compressed in blocks (of up to block_size articles)
+#   each block a zstd frame - articles of a few KB compress poorly on their own, much better together
+#   (the frames concatenated are a valid zstd stream - can be decompressed in one go)
+# - each segment has an index file: json_file, offset and (compressed) length of the frame, and the line
+#   within the frame of each article (segments written with one article per frame have no line - it's 0)
+# - articles are buffered until their block is written (or flush / close is called), only then are they indexed
+# - json_file is the same name used for the one json file per article: <sha256 of filename>.json
+#
+# to pack previously extracted articles (one json file per article) into a store:
+#   python -m supply_chain_extract.article_store <article_dir> <store_dir>
+
+import os
+import re
+import sys
+import json
+import mmap
+import time
+import socket
+
+import zstandard
+
+
+SEGMENT_SUFFIX = ".jsonl.zst"
+INDEX_SUFFIX = ".idx"
+
+
+class ArticleStoreWriter:
+    """append articles to a store, one segment per domain is open at a time
+
+    segment names include host name and process id, so multiple processes (and machines)
+    can write to the same store without writing to the same file
+
+    block_size: number of articles compressed together (as one zstd frame)
+    - written articles are buffered until there are block_size (for the domain), call flush() or close()
+      to write any remaining
+    """
+
+    def __init__(self, root, max_segment_bytes=256 * 2**20, level=3, block_size=64):
+        self.root = root
+        self.max_segment_bytes = max_segment_bytes
+        self.block_size = block_size
+        self.pid = os.getpid()
+        self._prefix = f"{socket.gethostname()}-{self.pid}-{int(time.time() * 1000)}"
+        self._cctx = zstandard.ZstdCompressor(level=level)
+        self._count = 0
+        # domain -> (segment file, index file)
+        self._open = {}
+        # domain -> [(json_file, line)] - articles not yet written
+        self._pending = {}
+        os.makedirs(root, exist_ok=True)
+
+    def _segment(self, domain):
+        seg = self._open.get(domain)
+        if (seg is not None) and (seg[0].tell() < self.max_segment_bytes):
+            return seg
+
+        # start a new segment - close the previous one (if any)
+        if seg is not None:
+            for f in seg:
+                f.close()
+        self._count += 1
+        domain_dir = os.path.join(self.root, domain)
+        os.makedirs(domain_dir, exist_ok=True)
+        name = os.path.join(domain_dir, f"{self._prefix}-{self._count:05d}")
+        seg = (open(name + SEGMENT_SUFFIX, "ab"), open(name + INDEX_SUFFIX, "a", encoding="utf-8"))
+        self._open[domain] = seg
+        return seg
+
+    def write(self, article, json_file, domain):
+        """append an article (dict) to the segment for domain, under the name json_file"""
+        line = json.dumps(article, default=str, separators=(',', ':'), ensure_ascii=False) + "\n"
+        pending = self._pending.setdefault(domain, [])
+        pending.append((json_file, line))
+        if len(pending) >= self.block_size:
+            self._write_block(domain)
+
+    def _write_block(self, domain):
+        pending = self._pending.pop(domain, [])
+        if len(pending) == 0:
+            return
+        frame = self._cctx.compress("".join([line for _, line in pending]).encode("utf-8"))
+
+        seg_file, idx_file = self._segment(domain)
+        offset = seg_file.tell()
+        seg_file.write(frame)
+        seg_file.flush()
+        # index is only written once the articles are - a (partially) written block won't be indexed
+        idx_file.write("".join([f"{jf}\t{offset}\t{len(frame)}\t{i}\n" for i, (jf, _) in enumerate(pending)]))
+        idx_file.flush()
+
+    def flush(self):
+        """write any buffered articles"""
+        for domain in list(self._pending.keys()):
+            self._write_block(domain)
+
+    def close(self):
+        self.flush()
+        for seg in self._open.values():
+            for f in seg:
+                f.close()
+        self._open = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ArticleStore:
+    """read articles from a store - either by json_file (random access) or all of a domain (sequentially)
+
+    domains: if provided will only consider those domains (sub directories), otherwise all are used
+    """
+
+    def __init__(self, root, domains=None):
+        assert os.path.exists(root), f"root:\n{root}\ndoes not exist"
+        self.root = root
+        self._domains = domains
+        # domain -> {json_file: (segment, offset, length, line)}
+        self._index = {}
+        self._mmaps = {}
+        self._dctx = zstandard.ZstdDecompressor()
+        # the most recently decompressed frame: ((segment, offset), lines)
+        self._frame = (None, None)
+
+    def __getstate__(self):
+        # only the location is needed - indexes will be read again as required (i.e. in another process)
+        return {"root": self.root, "domains": self._domains}
+
+    def __setstate__(self, state):
+        self.__init__(state["root"], domains=state["domains"])
+
+    def domains(self):
+        if self._domains is not None:
+            return list(self._domains)
+        return sorted([d for d in os.listdir(self.root)
+                       if os.path.isdir(os.path.join(self.root, d))])
+
+    def index(self, domain):
+        """get the index for a domain: dict of json_file -> (segment, offset, length, line)
+        if the same json_file was written more than once, the most recent is used"""
+        if domain in self._index:
+            return self._index[domain]
+
+        domain_dir = os.path.join(self.root, domain)
+        idx = {}
+        if os.path.exists(domain_dir):
+            # segment names start with host and process id, followed by time started - sort by time
+            idx_files = [f for f in os.listdir(domain_dir) if f.endswith(INDEX_SUFFIX)]
+            idx_files.sort(key=lambda x: x.split("-")[-2:])
+            for f in idx_files:
+                seg = os.path.join(domain_dir, f[:-len(INDEX_SUFFIX)] + SEGMENT_SUFFIX)
+                with open(os.path.join(domain_dir, f), "r", encoding="utf-8") as _:
+                    for line in _:
+                        # skip any partially written lines
+                        if not line.endswith("\n"):
+                            continue
+                        parts = line[:-1].split("\t")
+                        # one article per frame (no line given), or a block of articles
+                        if len(parts) == 3:
+                            parts.append("0")
+                        if len(parts) != 4:
+                            continue
+                        idx[parts[0]] = (seg, int(parts[1]), int(parts[2]), int(parts[3]))
+
+        self._index[domain] = idx
+        return idx
+
+    def json_files(self, domain=None):
+        """list the json_file names in the store (for a given domain)"""
+        domains = self.domains() if domain is None else [domain]
+        return [jf for d in domains for jf in self.index(d).keys()]
+
+    def _read(self, segment, offset, length, line):
+        # articles in the same frame are usually read together - keep the last frame decompressed
+        key, lines = self._frame
+        if key != (segment, offset):
+            mm = self._mmaps.get(segment)
+            # segments may be appended to - re-map if reading past the end of the current map
+            if (mm is None) or (offset + length > len(mm)):
+                if mm is not None:
+                    mm.close()
+                with open(segment, "rb") as f:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._mmaps[segment] = mm
+            lines = self._dctx.decompress(mm[offset: offset + length]).split(b"\n")
+            self._frame = ((segment, offset), lines)
+        return json.loads(lines[line])
+
+    def get(self, json_file, domain=None):
+        """get an article (dict) by it's json_file name, raises KeyError if not found"""
+        domains = self.domains() if domain is None else [domain]
+        for d in domains:
+            loc = self.index(d).get(json_file)
+            if loc is not None:
+                return self._read(*loc)
+        raise KeyError(json_file)
+
+    def __contains__(self, json_file):
+        return any(json_file in self.index(d) for d in self.domains())
+
+    def iter_articles(self, domain=None):
+        """yield (json_file, article) for all articles in the store (for a given domain)
+        reading each segment sequentially"""
+        domains = self.domains() if domain is None else [domain]
+        for d in domains:
+            # group by segment, read in order of offset
+            by_segment = {}
+            for jf, (seg, offset, length, line) in self.index(d).items():
+                by_segment.setdefault(seg, []).append((offset, line, length, jf))
+            for seg, locs in by_segment.items():
+                locs.sort()
+                for offset, line, length, jf in locs:
+                    yield jf, self._read(seg, offset, length, line)
+
+    def close(self):
+        for mm in self._mmaps.values():
+            mm.close()
+        self._mmaps = {}
+        self._frame = (None, None)
+
+
+def pack_json_articles(article_dir, store_dir, domains=None, verbose=True):
+    """pack articles stored as one json file per article (in a directory per domain) into a store"""
+
+    if domains is None:
+        domains = sorted([d for d in os.listdir(article_dir)
+                          if os.path.isdir(os.path.join(article_dir, d))])
+
+    bad_files = []
+    with ArticleStoreWriter(store_dir) as writer:
+        for domain in domains:
+            src = os.path.join(article_dir, domain)
+            json_files = [i for i in os.listdir(src) if re.search("\.json$", i, re.IGNORECASE)]
+            if verbose:
+                print(f"packing: {len(json_files)} articles from\n{src}")
+            for i, jf in enumerate(json_files):
+                if verbose & (i % 10000 == 0):
+                    print(f"{i} / {len(json_files)}")
+                try:
+                    with open(os.path.join(src, jf), "r", encoding="utf-8") as f:
+                        a = json.load(f)
+                except json.decoder.JSONDecodeError:
+                    bad_files.append(jf)
+                    continue
+                writer.write(a, json_file=jf, domain=domain)
+
+    if verbose:
+        print(f"there were issues reading in: {len(bad_files)} files")
+
+    return bad_files
+
+
+if __name__ == "__main__":
+
+    assert len(sys.argv) >= 3, "usage: python -m supply_chain_extract.article_store <article_dir> <store_dir> [domain ...]"
+
+    pack_json_articles(article_dir=sys.argv[1],
+                       store_dir=sys.argv[2],
+                       domains=sys.argv[3:] if len(sys.argv) > 3 else None)
@@ -0,0 +1,195 @@
+# metrics for crawling (common crawl) warc files - to see where the time goes and tune the number of
+# download threads / extraction processes
+# - per warc file: download time and MB/s, extraction time, records scanned per second,
+#   articles kept (per host), discarded and errors
+# - each warc file is appended as a line to a jsonl file
+# - cumulative totals are written to a prometheus textfile (i.e. for node_exporter's textfile collector)
+# - a rolling summary (over the most recent warc files) is printed
+#
+# to summarise a metrics (jsonl) file:
+#   python -m supply_chain_extract.crawl_metrics <metrics.jsonl>
+
+import os
+import sys
+import json
+import time
+import datetime
+from collections import deque
+
+import pandas as pd
+
+
+class CrawlMetrics:
+    """record metrics for each warc file crawled
+
+    jsonl_path: if provided each warc file's metrics are appended to this file
+    prom_path: if provided totals are written to this (prometheus) textfile after each warc file
+    window: number of (most recent) warc files the rolling summary covers
+    summary_every: print a rolling summary every this many warc files (0 for never)
+    """
+
+    def __init__(self, jsonl_path=None, prom_path=None, window=20, summary_every=1):
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path
+        self.summary_every = summary_every
+        self.recent = deque(maxlen=window)
+        self.started = time.time()
+        self.totals = {"warc_files": 0, "errors": 0,
+                       "download_seconds": 0.0, "download_bytes": 0,
+                       "extraction_seconds": 0.0, "records": 0,
+                       "passed": 0, "discarded": 0, "error": 0}
+        self.host_totals = {}
+
+        for p in [jsonl_path, prom_path]:
+            if p is not None:
+                os.makedirs(os.path.dirname(os.path.abspath(p)), exist_ok=True)
+
+    def record(self, warc_file, extraction, download_seconds=None, download_bytes=None):
+        """record a (successfully) extracted warc file
+
+        extraction: dict with extraction_seconds, passed, discarded, error, total and hosts (host -> articles kept)
+        download_seconds, download_bytes: None if not downloaded (i.e. streamed or already on disk)
+        """
+        m = {"time": datetime.datetime.now().isoformat(timespec="seconds"),
+             "warc_file": warc_file,
+             "download_seconds": download_seconds,
+             "download_bytes": download_bytes,
+             "download_mb_per_second": _rate(download_bytes, download_seconds, 2**20),
+             "extraction_seconds": extraction.get("extraction_seconds"),
+             "bytes": extraction.get("bytes"),
+             "records": extraction.get("total", 0),
+             "records_per_second": _rate(extraction.get("total", 0), extraction.get("extraction_seconds")),
+             "passed": extraction.get("passed", 0),
+             "discarded": extraction.get("discarded", 0),
+             "error": extraction.get("error", 0),
+             "hosts": extraction.get("hosts", {})}
+
+        self.recent.append(m)
+        t = self.totals
+        t["warc_files"] += 1
+        t["download_seconds"] += download_seconds or 0.0
+        t["download_bytes"] += download_bytes or 0
+        t["extraction_seconds"] += m["extraction_seconds"] or 0.0
+        t["records"] += m["records"]
+        for k in ["passed", "discarded", "error"]:
+            t[k] += m[k]
+        for h, n in m["hosts"].items():
+            self.host_totals[h] = self.host_totals.get(h, 0) + n
+
+        if self.jsonl_path is not None:
+            with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(m) + "\n")
+        self.write_prometheus()
+
+        if self.summary_every and (t["warc_files"] % self.summary_every == 0):
+            self.print_summary()
+        return m
+
+    def record_error(self, warc_file, error=None):
+        """record a warc file that failed to download or extract"""
+        self.totals["errors"] += 1
+        if self.jsonl_path is not None:
+            with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"time": datetime.datetime.now().isoformat(timespec="seconds"),
+                                    "warc_file": warc_file,
+                                    "failed": str(error)}) + "\n")
+        self.write_prometheus()
+
+    def write_prometheus(self):
+        """write totals to prometheus textfile - to a temporary file first, so it's never read half written"""
+        if self.prom_path is None:
+            return
+        t = self.totals
+        lines = []
+
+        def add(name, help, value, type="counter", labels=None):
+            lines.append(f"# HELP cc_crawl_{name} {help}")
+            lines.append(f"# TYPE cc_crawl_{name} {type}")
+            if labels is None:
+                lines.append(f"cc_crawl_{name} {value}")
+            else:
+                for l, v in labels.items():
+                    lines.append(f'cc_crawl_{name}{{host="{l}"}} {v}')
+
+        add("warc_files_total", "warc files extracted", t["warc_files"])
+        add("warc_file_errors_total", "warc files failed to download or extract", t["errors"])
+        add("download_seconds_total", "time spent downloading warc files", t["download_seconds"])
+        add("download_bytes_total", "bytes of warc files downloaded", t["download_bytes"])
+        add("extraction_seconds_total", "time spent extracting warc files", t["extraction_seconds"])
+        add("records_total", "warc (response) records scanned", t["records"])
+        add("articles_passed_total", "articles kept", t["passed"])
+        add("articles_discarded_total", "articles discarded", t["discarded"])
+        add("articles_error_total", "articles failed to extract", t["error"])
+        add("host_articles_total", "articles kept, by host", None, labels=self.host_totals)
+        add("uptime_seconds", "seconds since the crawl started", time.time() - self.started, type="gauge")
+
+        tmp_path = self.prom_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.prom_path)
+
+    def summary(self):
+        """rolling summary over the most recent warc files"""
+        return summarise_metrics(list(self.recent))
+
+    def print_summary(self):
+        s = self.summary()
+        elapsed = time.time() - self.started
+        print("-" * 50)
+        print(f"crawl metrics - last {s['warc_files']} warc files "
+              f"(total: {self.totals['warc_files']} extracted, {self.totals['errors']} failed, "
+              f"{elapsed / 60:.1f} minutes)")
+        print(f"download: {s['download_mb_per_second']} MB/s, "
+              f"{s['download_seconds_per_file']}s per file")
+        print(f"extraction: {s['extraction_seconds_per_file']}s per file, "
+              f"{s['records_per_second']} records/s")
+        print(f"articles: {s['passed']} kept, {s['discarded']} discarded, {s['error']} errors")
+        top_hosts = sorted(s["hosts"].items(), key=lambda x: -x[1])[:10]
+        print("kept by host: " + ", ".join(f"{h}: {n}" for h, n in top_hosts))
+        print("-" * 50)
+
+
+def _rate(n, seconds, unit=1):
+    if (n is None) or (not seconds):
+        return None
+    return round(n / unit / seconds, 2)
+
+
+def summarise_metrics(metrics):
+    """summarise a list of (per warc file) metrics - as written by CrawlMetrics"""
+    metrics = [m for m in metrics if "failed" not in m]
+    downloaded = [m for m in metrics if m.get("download_seconds") is not None]
+    download_seconds = sum(m["download_seconds"] for m in downloaded)
+    extraction_seconds = sum(m["extraction_seconds"] or 0.0 for m in metrics)
+    hosts = {}
+    for m in metrics:
+        for h, n in m.get("hosts", {}).items():
+            hosts[h] = hosts.get(h, 0) + n
+
+    return {"warc_files": len(metrics),
+            "download_mb_per_second": _rate(sum(m["download_bytes"] or 0 for m in downloaded),
+                                            download_seconds, 2**20),
+            "download_seconds_per_file": _rate(download_seconds, len(downloaded)),
+            "extraction_seconds_per_file": _rate(extraction_seconds, len(metrics)),
+            "records_per_second": _rate(sum(m["records"] for m in metrics), extraction_seconds),
+            "passed": sum(m["passed"] for m in metrics),
+            "discarded": sum(m["discarded"] for m in metrics),
+            "error": sum(m["error"] for m in metrics),
+            "hosts": hosts}
+
+
+if __name__ == "__main__":
+
+    assert len(sys.argv) >= 2, "usage: python -m supply_chain_extract.crawl_metrics <metrics.jsonl>"
+
+    with open(sys.argv[1], "r", encoding="utf-8") as f:
+        metrics = [json.loads(line) for line in f if line.strip()]
+
+    failed = [m for m in metrics if "failed" in m]
+    print(f"warc files: {len(metrics) - len(failed)} extracted, {len(failed)} failed")
+
+    s = summarise_metrics(metrics)
+    hosts = s.pop("hosts")
+    print(pd.Series(s).to_string())
+    print("\narticles kept by host:")
+    print(pd.Series(hosts, dtype=int).sort_values(ascending=False).to_string())
@@ -0,0 +1,86 @@
+# drop near duplicate texts (i.e. the same sentence from syndicated / updated articles)
+# - texts are compared with the (normalised) indel similarity, the same as Levenshtein.ratio:
+#   (len(a) + len(b) - indel distance) / (len(a) + len(b))
+# - going through the texts in order, each text kept drops all later texts more similar than sim_thresh
+#   (the same result as comparing every pair in a loop)
+# - distances are computed in blocks with rapidfuzz's cdist (C++, bit parallel), so the pairwise loop is
+#   not done in python, and groups (i.e. entity pairs) can be processed in parallel
+
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+from rapidfuzz.distance import Indel
+from rapidfuzz.process import cdist
+
+
+def unique_text_mask(texts, sim_thresh=0.9, block_size=1000, workers=1):
+    """keep flags for texts - False for texts too similar (similarity > sim_thresh) to an earlier kept text
+
+    texts: list / array of str
+    block_size: number of texts (rows) the distances are computed for at a time - memory is (at most)
+      block_size * len(texts) int32s, the distances for a block
+    workers: threads used by cdist, -1 for all cores
+    """
+    texts = [str(t) for t in texts]
+    n = len(texts)
+    keep = np.ones(n, dtype=bool)
+    lens = np.array([len(t) for t in texts], dtype=np.int64)
+
+    for b0 in range(0, n, block_size):
+        b1 = min(b0 + block_size, n)
+        # only texts not already dropped (by earlier blocks) are compared
+        rows = b0 + np.flatnonzero(keep[b0:b1])
+        if len(rows) == 0:
+            continue
+        cols = b0 + np.flatnonzero(keep[b0:])
+        dist = cdist([texts[i] for i in rows], [texts[j] for j in cols],
+                     scorer=Indel.distance, dtype=np.int32, workers=workers)
+
+        for r, i in enumerate(rows):
+            if not keep[i]:
+                continue
+            # drop later texts too similar to this one
+            c0 = np.searchsorted(cols, i, side="right")
+            later = cols[c0:]
+            lensum = lens[i] + lens[later]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                sim = np.where(lensum > 0, (lensum - dist[r, c0:]) / lensum, 1.0)
+            keep[later[sim > sim_thresh]] = False
+    return keep
+
+
+def _unique_text_mask_star(args):
+    return unique_text_mask(*args)
+
+
+def drop_near_duplicates(df, group_cols, text_col, sim_thresh=0.9, processes=1, verbose=True):
+    """within each group (i.e. entity pair) keep only the rows whose text is not a near duplicate of an
+    earlier row's (see unique_text_mask)
+
+    df: DataFrame
+    group_cols: columns identifying groups, i.e. ["entity1_full", "entity2_full"]
+    text_col: column of text to compare
+    processes: number of processes groups are split over (1 to do all in this process)
+
+    returns the rows kept - ordered by group (in order of first appearance) then by their order in df
+    """
+    groups = list(df.groupby(group_cols, sort=False, dropna=False).indices.values())
+    texts = df[text_col].values
+    args = [(texts[idx], sim_thresh) for idx in groups]
+
+    if verbose:
+        sizes = np.array([len(idx) for idx in groups])
+        print(f"dropping near duplicates: {len(df)} rows in {len(groups)} groups, "
+              f"largest group: {sizes.max() if len(sizes) else 0}")
+
+    if processes > 1:
+        with multiprocessing.Pool(processes) as pool:
+            masks = pool.map(_unique_text_mask_star, args, chunksize=max(1, len(args) // (processes * 16)))
+    else:
+        masks = [unique_text_mask(*a) for a in args]
+
+    keep_idx = np.concatenate([idx[m] for idx, m in zip(groups, masks)] + [np.array([], dtype=int)])
+    if verbose:
+        print(f"keeping: {len(keep_idx)} rows")
+    return df.iloc[keep_idx]
@@ -0,0 +1,299 @@
+# supply chain graph built from the knowledge base: supplier -> customer
+# - in the knowledge base (entity1, entity2, rel='Supplier') means entity2 is a supplier of entity1
+# - entity names are interned to int32 ids
+# - supplier -> customer edges are stored as CSR arrays (indptr, indices), along with a transpose
+#   (customer -> supplier), each with the edge attributes: confidence and last update date
+# - neighbours and degrees are slices / differences of the CSR arrays, pair existence is a hash lookup
+# - pandas is only used to build the graph from a knowledge base (DataFrame) and to return tiers
+# - multi-hop (n-tier) supply chains: breadth first search, upstream (suppliers) or downstream (customers),
+#   expanding a whole frontier (tier) at a time with array operations on the CSR arrays
+#
+# to build the graph for data/KB.csv and time some queries:
+#   python -m supply_chain_extract.graph
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from supply_chain_extract.knowledge_base import load_kb
+
+
+class SupplyChainGraph:
+    """graph of supplier -> customer relationships, see from_kb
+
+    queries take entity names (str) or ids (int), neighbours are returned as ids - use .name(s) to get names
+    """
+
+    def __init__(self, names, suppliers, customers, confidence, last_update):
+        """build from edges: arrays of supplier and customer ids (int) with their confidence and last_update
+        (datetime64[D]) - there should be at most one edge per (supplier, customer) pair"""
+        self.names = np.asarray(names, dtype=object)
+        self.ids = {n: i for i, n in enumerate(self.names)}
+        n = len(self.names)
+
+        suppliers = np.asarray(suppliers, dtype=np.int32)
+        customers = np.asarray(customers, dtype=np.int32)
+        confidence = np.asarray(confidence, dtype=np.float32)
+        last_update = np.asarray(last_update, dtype="datetime64[D]")
+
+        # supplier -> customers (out edges), rows sorted by customer
+        order = np.lexsort((customers, suppliers))
+        self.out_indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(suppliers, minlength=n), out=self.out_indptr[1:])
+        self.out_indices = customers[order]
+        self.out_confidence = confidence[order]
+        self.out_last_update = last_update[order]
+
+        # customer -> suppliers (in edges), rows sorted by supplier
+        order = np.lexsort((suppliers, customers))
+        self.in_indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(customers, minlength=n), out=self.in_indptr[1:])
+        self.in_indices = suppliers[order]
+        self.in_confidence = confidence[order]
+        self.in_last_update = last_update[order]
+
+        # (supplier, customer) -> position in out edges
+        out_suppliers = np.repeat(np.arange(n, dtype=np.int64), np.diff(self.out_indptr))
+        keys = (out_suppliers << 32) | self.out_indices.astype(np.int64)
+        self._edges = dict(zip(keys.tolist(), range(len(keys))))
+        assert len(self._edges) == len(keys), "expected at most one edge per (supplier, customer) pair"
+
+    @classmethod
+    def from_edges(cls, suppliers, customers, confidence=None, last_update=None):
+        """build from arrays of supplier and customer names (or any hashable labels, i.e. ids)
+        if a pair has more than one edge the highest confidence is used"""
+        edges = pd.DataFrame({"supplier": suppliers,
+                              "customer": customers,
+                              "confidence": np.nan if confidence is None else confidence,
+                              "last_update": pd.NaT if last_update is None else pd.to_datetime(last_update)})
+        edges = edges.sort_values("confidence", ascending=False, kind="mergesort")
+        edges = edges.drop_duplicates(["supplier", "customer"])
+
+        names, codes = np.unique(np.concatenate([edges["supplier"].values, edges["customer"].values]),
+                                 return_inverse=True)
+        m = len(edges)
+        return cls(names=names,
+                   suppliers=codes[:m],
+                   customers=codes[m:],
+                   confidence=edges["confidence"].values,
+                   last_update=edges["last_update"].values.astype("datetime64[D]"))
+
+    @classmethod
+    def from_kb(cls, kb):
+        """build from a knowledge base (as from get_knowledge_base_from_value_chain_data / load_kb)
+        entity2 is the supplier of entity1 (the customer)
+        if a pair has more than one entry (with different confidence) the highest confidence is used"""
+        kb = kb.loc[kb["rel"] == "Supplier"]
+        return cls.from_edges(suppliers=kb["entity2"].values,
+                              customers=kb["entity1"].values,
+                              confidence=kb["Confidence Score (%)"].values,
+                              last_update=kb["Last Update Date"].values)
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def num_edges(self):
+        return len(self.out_indices)
+
+    def entity_id(self, entity):
+        """id of an entity (name or id), raises KeyError if not in graph"""
+        if isinstance(entity, (int, np.integer)):
+            if not (0 <= entity < len(self.names)):
+                raise KeyError(entity)
+            return int(entity)
+        return self.ids[entity]
+
+    def __contains__(self, entity):
+        return entity in self.ids
+
+    def name(self, ids):
+        """entity name(s) for id(s)"""
+        return self.names[ids]
+
+    def customers(self, entity):
+        """ids of the entities the entity supplies (out neighbours)"""
+        i = self.entity_id(entity)
+        return self.out_indices[self.out_indptr[i]: self.out_indptr[i + 1]]
+
+    def suppliers(self, entity):
+        """ids of the entities supplying the entity (in neighbours)"""
+        i = self.entity_id(entity)
+        return self.in_indices[self.in_indptr[i]: self.in_indptr[i + 1]]
+
+    def out_degree(self, entity):
+        """number of customers"""
+        i = self.entity_id(entity)
+        return int(self.out_indptr[i + 1] - self.out_indptr[i])
+
+    def in_degree(self, entity):
+        """number of suppliers"""
+        i = self.entity_id(entity)
+        return int(self.in_indptr[i + 1] - self.in_indptr[i])
+
+    def out_degrees(self):
+        return np.diff(self.out_indptr)
+
+    def in_degrees(self):
+        return np.diff(self.in_indptr)
+
+    def _edge(self, supplier, customer):
+        # position of edge in out edges, None if there is no edge (or either entity is not in the graph)
+        try:
+            key = (self.entity_id(supplier) << 32) | self.entity_id(customer)
+        except KeyError:
+            return None
+        return self._edges.get(key)
+
+    def has_edge(self, supplier, customer):
+        """does supplier supply customer"""
+        return self._edge(supplier, customer) is not None
+
+    def edge(self, supplier, customer):
+        """(confidence, last update date) of supplier -> customer, None if there is no such edge"""
+        e = self._edge(supplier, customer)
+        if e is None:
+            return None
+        return float(self.out_confidence[e]), self.out_last_update[e]
+
+    def _expand(self, frontier, upstream=True, min_confidence=None):
+        # all neighbours (with repeats) of the entities in frontier (array of ids)
+        if upstream:
+            indptr, indices, confidence = self.in_indptr, self.in_indices, self.in_confidence
+        else:
+            indptr, indices, confidence = self.out_indptr, self.out_indices, self.out_confidence
+        starts = indptr[frontier]
+        lens = indptr[frontier + 1] - starts
+        # positions of the edges of each frontier entity: starts[i], starts[i] + 1, ..., starts[i] + lens[i] - 1
+        pos = np.arange(lens.sum()) + np.repeat(starts - (np.cumsum(lens) - lens), lens)
+        if min_confidence is not None:
+            pos = pos[confidence[pos] >= min_confidence]
+        return indices[pos]
+
+    def traverse(self, sources, direction="upstream", max_depth=None, min_confidence=None):
+        """breadth first search from (multiple) sources
+
+        sources: entity names or ids, those not in the graph are ignored
+        direction: 'upstream' (suppliers, suppliers of suppliers, ...) or 'downstream' (customers, ...)
+        max_depth: maximum number of hops (tiers) from the sources, None for no limit
+        min_confidence: only follow edges with at least this confidence
+
+        returns (ids, tiers): arrays of entities reached and the tier (hops from nearest source) each is in
+        - sources are tier 0, in order of tier
+        """
+        assert direction in ("upstream", "downstream"), f"direction: {direction} not understood"
+        upstream = direction == "upstream"
+
+        tier = np.full(len(self.names), -1, dtype=np.int32)
+        frontier = []
+        for s in sources:
+            try:
+                frontier.append(self.entity_id(s))
+            except KeyError:
+                continue
+        frontier = np.unique(np.array(frontier, dtype=np.int64))
+        tier[frontier] = 0
+        reached = [frontier]
+
+        depth = 0
+        while len(frontier) and ((max_depth is None) or (depth < max_depth)):
+            depth += 1
+            nb = self._expand(frontier, upstream=upstream, min_confidence=min_confidence)
+            frontier = np.unique(nb[tier[nb] < 0]).astype(np.int64)
+            tier[frontier] = depth
+            reached.append(frontier)
+
+        ids = np.concatenate(reached)
+        return ids, tier[ids]
+
+    def tiers(self, sources, direction="upstream", max_depth=None, min_confidence=None):
+        """as traverse, returns a DataFrame with columns: entity, id, tier"""
+        ids, tiers = self.traverse(sources, direction=direction, max_depth=max_depth, min_confidence=min_confidence)
+        return pd.DataFrame({"entity": self.names[ids], "id": ids, "tier": tiers})
+
+    def all_tiers(self, direction="upstream", max_depth=2, min_confidence=None, entities=None, verbose=True):
+        """n-tier supply chain for each entity (separately)
+
+        entities: names or ids to get supply chains for, default: all
+        returns a DataFrame with columns: source, entity, tier - sources themselves (tier 0) are not included
+        """
+        entities = np.arange(len(self.names)) if entities is None else [self.entity_id(e) for e in entities]
+        source_ids, ids, tiers = [], [], []
+        for i, e in enumerate(entities):
+            if verbose and (i % 1000 == 0):
+                print(f"{i}/{len(entities)}")
+            reached, t = self.traverse([e], direction=direction, max_depth=max_depth,
+                                       min_confidence=min_confidence)
+            source_ids.append(np.full(len(reached) - 1, e, dtype=np.int32))
+            ids.append(reached[1:])
+            tiers.append(t[1:])
+
+        source_ids, ids = np.concatenate(source_ids), np.concatenate(ids)
+        return pd.DataFrame({"source": self.names[source_ids],
+                             "entity": self.names[ids],
+                             "tier": np.concatenate(tiers)})
+
+    def save(self, path):
+        """save arrays to a (.npz) file - the edge lookup is rebuilt on load"""
+        out_suppliers = np.repeat(np.arange(len(self.names), dtype=np.int32), np.diff(self.out_indptr))
+        np.savez(path,
+                 names=self.names.astype(str),
+                 suppliers=out_suppliers,
+                 customers=self.out_indices,
+                 confidence=self.out_confidence,
+                 last_update=self.out_last_update)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            return cls(names=f["names"].astype(object),
+                       suppliers=f["suppliers"],
+                       customers=f["customers"],
+                       confidence=f["confidence"],
+                       last_update=f["last_update"])
+
+
+if __name__ == "__main__":
+
+    kb = load_kb()
+
+    t0 = time.perf_counter()
+    g = SupplyChainGraph.from_kb(kb)
+    t1 = time.perf_counter()
+    print(f"graph has: {len(g)} entities, {g.num_edges} edges, built in: {t1 - t0:.3f}s")
+
+    # entities with the most customers / suppliers
+    for label, deg in [("customers", g.out_degrees()), ("suppliers", g.in_degrees())]:
+        top = np.argsort(-deg)[:5]
+        print(f"most {label}: " + ", ".join(f"{g.name(i)}: {deg[i]}" for i in top))
+
+    # ---
+    # time queries: graph vs pandas
+    # ---
+
+    rng = np.random.default_rng(0)
+    pairs = kb[["entity1", "entity2"]].values[rng.integers(0, len(kb), 1000)]
+
+    t0 = time.perf_counter()
+    g_res = [(g.has_edge(e2, e1), len(g.suppliers(e1)), len(g.customers(e2))) for e1, e2 in pairs]
+    t1 = time.perf_counter()
+    pd_res = [(((kb["entity1"] == e1) & (kb["entity2"] == e2)).any(),
+               kb.loc[kb["entity1"] == e1, "entity2"].nunique(),
+               kb.loc[kb["entity2"] == e2, "entity1"].nunique()) for e1, e2 in pairs]
+    t2 = time.perf_counter()
+
+    assert g_res == pd_res
+    print(f"1000 (pair exists, num suppliers, num customers) queries - "
+          f"graph: {t1 - t0:.4f}s, pandas: {t2 - t1:.3f}s")
+
+    # ---
+    # n-tier supply chains for every entity
+    # ---
+
+    for direction in ["upstream", "downstream"]:
+        t0 = time.perf_counter()
+        chains = g.all_tiers(direction=direction, max_depth=3, verbose=False)
+        t1 = time.perf_counter()
+        print(f"{direction} supply chains (up to 3 tiers) for all {len(g)} entities: {t1 - t0:.2f}s, "
+              f"entries per tier:\n{chains['tier'].value_counts().sort_index().to_string()}")
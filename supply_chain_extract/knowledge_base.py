@@ -0,0 +1,286 @@
+# knowledge base (entity1 supplies entity2) built from (refinitiv) value chain data
+# - IncrementalKnowledgeBase keeps a materialised knowledge base and applies only new value chain rows
+#   (those with a fetch_time after the last applied, or at it but not yet applied), the result is the same as
+#   a full rebuild with get_knowledge_base_from_value_chain_data
+# - load_kb caches the knowledge base built from a source (csv file or mongodb collection) as an (uncompressed)
+#   arrow / feather file, named by a fingerprint of the source - so it's only built once per version of the
+#   source, and loads memory map the file. string columns are returned arrow backed (string[pyarrow]) so their
+#   buffers stay memory mapped (not copied into python objects) - processes loading the same file share them
+# - KBPairIndex looks up knowledge base entries by entity pair (either way round)
+#
+# to build / update a knowledge base state file from a value chain file (i.e. data/KB.csv):
+#   python -m supply_chain_extract.knowledge_base <state_file> [<value_chain.csv>]
+
+import os
+import sys
+import time
+import hashlib
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from supply_chain_extract import get_data_path
+from supply_chain_extract.utils import most_recent_value_chain, flip_value_chain_to_suppliers, \
+    get_knowledge_base_from_value_chain_data
+
+
+VC_KEY = ["Parent Name", "Company Name", "Relationship"]
+KB_KEY = ["entity1", "entity2", "rel"]
+
+# change if the way the knowledge base is built changes - so cached files are not used
+KB_CACHE_VERSION = 1
+
+
+def get_source_fingerprint(source):
+    """fingerprint of a value chain source
+    - for a file: sha256 of it's content
+    - for a (mongodb) collection: number of documents and the most recent _id
+      (documents are inserted, not updated, as value chain tables are fetched)"""
+    h = hashlib.sha256(f"kb_cache_version:{KB_CACHE_VERSION}".encode())
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            for chunk in iter(lambda: f.read(2**20), b""):
+                h.update(chunk)
+    else:
+        last = source.find_one(filter={}, projection={"_id": 1}, sort=[("_id", -1)])
+        h.update(f"{source.full_name}:{source.count_documents({})}:{None if last is None else last['_id']}".encode())
+    return h.hexdigest()
+
+
+def _arrow_string_dtype(arrow_type):
+    # types_mapper for to_pandas: keep strings as arrow arrays (zero copy), other types as default
+    if arrow_type in (pa.string(), pa.large_string()):
+        return pd.StringDtype("pyarrow")
+    return None
+
+
+def load_kb(source=None, cache_dir=None, verbose=True):
+    """load the knowledge base for a value chain source, building (and caching) it if needed
+
+    source: path to a value chain csv file (default: data/KB.csv) or a (mongodb) collection, i.e.
+      client["knowledge_base"]["KB"]
+    cache_dir: where cached knowledge bases are stored, default: data/kb_cache
+
+    returns the same as get_knowledge_base_from_value_chain_data on the source - read from the (memory mapped)
+    cache file, with string columns as string[pyarrow] rather than object
+    """
+    if source is None:
+        source = get_data_path("KB.csv")
+    if cache_dir is None:
+        cache_dir = get_data_path("kb_cache")
+
+    t0 = time.perf_counter()
+    fingerprint = get_source_fingerprint(source)
+    cache_file = os.path.join(cache_dir, f"kb-{fingerprint[:24]}.arrow")
+
+    if os.path.exists(cache_file):
+        if verbose:
+            print(f"reading knowledge base from cache:\n{cache_file}")
+    else:
+        if verbose:
+            print(f"building knowledge base, will be cached in:\n{cache_file}")
+        if isinstance(source, str):
+            vc = pd.read_csv(source)
+        else:
+            vc = pd.DataFrame(list(source.find(filter={}, projection={"_id": 0})))
+        kb = get_knowledge_base_from_value_chain_data(vc, verbose=verbose)
+
+        # feather requires a default index - keep the index as a column
+        # write to a temporary file first, so a partially written file is never read (i.e. by another process)
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_file = f"{cache_file}.{os.getpid()}.part"
+        feather.write_feather(kb.rename_axis("__index__").reset_index(), tmp_file, compression="uncompressed")
+        os.replace(tmp_file, cache_file)
+
+    # read from the file even if just built - so the result is the same either way
+    kb = feather.read_table(cache_file, memory_map=True).to_pandas(types_mapper=_arrow_string_dtype)
+    if verbose:
+        print(f"read knowledge base in {time.perf_counter() - t0:.3f}s")
+
+    kb = kb.set_index("__index__") if "__index__" in kb.columns else kb
+    kb.index.name = None
+    return kb
+
+
+class KBPairIndex:
+    """hash index of knowledge base entries by entity pair - in both orientations
+
+    pair_index = KBPairIndex(kb)
+    pair_index.relations("A", "B")  # entries for (A, B) and (B, A), as dicts, in knowledge base order
+    """
+
+    def __init__(self, kb):
+        self.columns = list(kb.columns)
+        self._index = {}
+        for r in kb.to_dict("records"):
+            key = (r["entity1"], r["entity2"])
+            records = self._index.get(key)
+            if records is None:
+                # both orientations share the same list
+                records = []
+                self._index[key] = records
+                self._index[(key[1], key[0])] = records
+            records.append(r)
+
+    def __contains__(self, pair):
+        return tuple(pair) in self._index
+
+    def relations(self, e1, e2):
+        """knowledge base entries (dicts) between e1 and e2 - either way, empty list if there are none"""
+        return self._index.get((e1, e2), [])
+
+    def relations_or_na(self, e1, e2):
+        """as relations, but if there are none returns a single 'NA' (not available) relation for (e1, e2)"""
+        return self.relations(e1, e2) or [{"entity1": e1, "entity2": e2, "rel": "NA"}]
+
+
+class IncrementalKnowledgeBase:
+    """knowledge base that can be updated with only the new / changed value chain rows
+
+    keeps:
+    - the most recent value chain rows for each (Parent Name, Company Name, Relationship)
+    - the knowledge base (including self supplying entries, which are dropped by .kb)
+    - the latest fetch_time applied, and the rows (as hashes, with a count) applied with that fetch_time
+      - so rows arriving later with the same fetch_time are still applied, and those already applied are not
+
+    each knowledge base (entity1, entity2, rel) entry only depends on the value chain rows for
+    (entity1, entity2, Supplier) and (entity2, entity1, Customer) - so only entries for pairs in the new rows
+    are recomputed. value chain data is assumed to be appended to (i.e. re-fetched tables added with a new
+    fetch_time), the result is then the same as get_knowledge_base_from_value_chain_data on all the rows
+    """
+
+    def __init__(self):
+        self.recent_vc = None
+        self._kb = None
+        self.last_fetch_time = None
+        # row hash -> number of rows applied with fetch_time == last_fetch_time
+        self.boundary_counts = {}
+
+    @property
+    def kb(self):
+        """the knowledge base - as returned by get_knowledge_base_from_value_chain_data"""
+        if self._kb is None:
+            return None
+        return self._kb.loc[self._kb["entity1"] != self._kb["entity2"]]
+
+    @staticmethod
+    def _row_hashes(vc):
+        return pd.util.hash_pandas_object(vc, index=False).values
+
+    def new_rows(self, vc):
+        """the rows of value chain data not yet applied - fetched after last_fetch_time, or fetched at
+        last_fetch_time and not already applied (rows are compared on all their values)"""
+        if self.last_fetch_time is None:
+            return vc
+        fetch_time = pd.to_datetime(vc["fetch_time"])
+        new = (fetch_time > self.last_fetch_time).to_numpy(copy=True)
+        at = np.flatnonzero((fetch_time == self.last_fetch_time).values)
+        if len(at) > 0:
+            h = pd.Series(self._row_hashes(vc.iloc[at]))
+            # the n-th copy of a row is new if fewer than n copies have been applied
+            nth = h.groupby(h.values).cumcount().values
+            applied = h.map(self.boundary_counts).fillna(0).values
+            new[at[nth >= applied]] = True
+        return vc.loc[new]
+
+    def update(self, vc, verbose=True):
+        """apply the new rows (see new_rows) of value chain data, returns the (updated) knowledge base"""
+        new = self.new_rows(vc)
+        if verbose:
+            print(f"applying: {len(new)} new value chain rows (of {len(vc)})")
+        if len(new) == 0:
+            return self.kb
+
+        if self._kb is None:
+            self.recent_vc = most_recent_value_chain(new)
+            self._kb = flip_value_chain_to_suppliers(self.recent_vc)
+        else:
+            self._apply(new)
+
+        # the rows applied at the latest fetch_time
+        fetch_time = pd.to_datetime(new["fetch_time"])
+        last_fetch_time = fetch_time.max() if self.last_fetch_time is None \
+            else max(self.last_fetch_time, fetch_time.max())
+        if last_fetch_time != self.last_fetch_time:
+            self.boundary_counts = {}
+        self.last_fetch_time = last_fetch_time
+        for h in self._row_hashes(new.loc[(fetch_time == last_fetch_time).values]):
+            self.boundary_counts[h] = self.boundary_counts.get(h, 0) + 1
+        return self.kb
+
+    def _apply(self, new):
+        # value chain groups with new rows - combine with their current most recent rows
+        new_keys = pd.MultiIndex.from_frame(new[VC_KEY])
+        recent_keys = pd.MultiIndex.from_frame(self.recent_vc[VC_KEY])
+        in_new = recent_keys.isin(new_keys)
+        changed_vc = most_recent_value_chain(pd.concat([self.recent_vc.loc[in_new], new]))
+
+        # replace those groups, keeping the order of a full rebuild (sorted by group, then by row order)
+        self.recent_vc = pd.concat([self.recent_vc.loc[~in_new], changed_vc])
+        self.recent_vc = self.recent_vc.sort_values(VC_KEY, kind="mergesort").reset_index(drop=True)
+
+        # knowledge base entries affected: (entity1, entity2) for suppliers, (entity2, entity1) for customers
+        affected = self._kb_keys(changed_vc)
+        vc_kb_keys = self._kb_keys(self.recent_vc)
+        changed_kb = flip_value_chain_to_suppliers(self.recent_vc.loc[vc_kb_keys.isin(affected)])
+
+        kb_keys = pd.MultiIndex.from_frame(self._kb[KB_KEY])
+        kb = pd.concat([self._kb.loc[~kb_keys.isin(affected)], changed_kb])
+        # index as from a full rebuild: position before dropping self supplying entries
+        self._kb = kb.sort_values(KB_KEY, kind="mergesort").reset_index(drop=True)
+
+    @staticmethod
+    def _kb_keys(vc):
+        # the knowledge base key (entity1, entity2, rel) each value chain row contributes to
+        is_customer = (vc["Relationship"] == "Customer").values
+        return pd.MultiIndex.from_arrays([vc["Company Name"].where(is_customer, vc["Parent Name"]),
+                                          vc["Parent Name"].where(is_customer, vc["Company Name"]),
+                                          vc["Relationship"].where(~is_customer, "Supplier")])
+
+    def save(self, path):
+        pd.to_pickle({"recent_vc": self.recent_vc,
+                      "kb": self._kb,
+                      "last_fetch_time": self.last_fetch_time,
+                      "boundary_counts": self.boundary_counts}, path)
+
+    @classmethod
+    def load(cls, path):
+        """load from file, if path does not exist returns an empty knowledge base"""
+        ikb = cls()
+        if os.path.exists(path):
+            state = pd.read_pickle(path)
+            ikb.recent_vc = state["recent_vc"]
+            ikb._kb = state["kb"]
+            ikb.last_fetch_time = state["last_fetch_time"]
+            ikb.boundary_counts = state.get("boundary_counts", {})
+        return ikb
+
+
+if __name__ == "__main__":
+
+    assert len(sys.argv) >= 2, \
+        "usage: python -m supply_chain_extract.knowledge_base <state_file> [<value_chain.csv>]"
+
+    state_file = sys.argv[1]
+    vc = pd.read_csv(sys.argv[2] if len(sys.argv) > 2 else get_data_path("KB.csv"))
+
+    ikb = IncrementalKnowledgeBase.load(state_file)
+    print(f"last fetch_time applied: {ikb.last_fetch_time}")
+
+    t0 = time.perf_counter()
+    kb = ikb.update(vc)
+    t1 = time.perf_counter()
+    ikb.save(state_file)
+    print(f"knowledge base has: {len(kb)} entries, updated in: {t1 - t0:.2f}s")
+
+    # ---
+    # check against a full rebuild
+    # ---
+
+    t0 = time.perf_counter()
+    full = get_knowledge_base_from_value_chain_data(vc, verbose=False)
+    t1 = time.perf_counter()
+    pd.testing.assert_frame_equal(kb, full)
+    print(f"same as full rebuild (which took: {t1 - t0:.2f}s)")
@@ -0,0 +1,175 @@
+# labeling functions (LFs) for weak labels - declared as specs and applied column wise
+# - RegexLF: label if a pattern is found at least min_count times in the text (non overlapping, as re.findall)
+# - ThresholdLF: label if a (numeric) column compares (==, >=, ...) to a value
+# - apply_lfs gives the same label matrix as snorkel's PandasLFApplier with the equivalent python LFs,
+#   but without calling a python function for each LF on each row:
+#   - the texts are joined (with a separator) once and each pattern is scanned once over the joined text,
+#     matches are mapped back to rows with np.searchsorted and counted with np.bincount
+#   - patterns with lookarounds (which could see the separator) are counted text by text instead,
+#     patterns with anchors (^, $) are not supported
+#   - threshold LFs are a single numpy comparison
+# - specs are also callable on a row (i.e. x.text, x['col']), so can be wrapped as snorkel LabelingFunctions
+#   (see to_snorkel_lfs) - and have a .name so can be passed to snorkel's LFAnalysis
+#
+# see examples/weak_labels.py, and examples/weak_labels_benchmark.py for a comparison with PandasLFApplier
+
+import operator
+import re
+from collections import namedtuple
+
+import numpy as np
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # python < 3.11
+    import sre_parse
+    import sre_constants
+
+
+ABSTAIN = -1
+
+# separator used when joining texts - patterns should not be able to match it
+TEXT_SEP = "\0"
+
+COMPARISONS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">=": operator.ge,
+    ">": operator.gt,
+    "<=": operator.le,
+    "<": operator.lt,
+}
+
+# anchors (^, $, \A, \Z) - in the joined text these only match at the start / end of the first / last text
+# (or around newlines, with re.M) so give wrong counts - \b, \B are fine as sep is not a word character
+ANCHORS = {sre_constants.AT_BEGINNING, sre_constants.AT_BEGINNING_LINE, sre_constants.AT_BEGINNING_STRING,
+           sre_constants.AT_END, sre_constants.AT_END_LINE, sre_constants.AT_END_STRING}
+
+
+class RegexLF(namedtuple("RegexLF", ["name", "pattern", "label", "min_count", "flags"],
+                         defaults=[1, 0])):
+    """label if pattern is found at least min_count times in the text, otherwise ABSTAIN
+    with min_count=1 this is the same as: label if re.search(pattern, text, flags) else ABSTAIN
+
+    with apply_lfs the pattern must not use anchors (^, $, \\A, \\Z) or match across texts (i.e. the "\\0"
+    separator) - these raise ValueError. patterns with lookarounds ((?=...), (?<!...), ...) give the same
+    labels, but are slower as they are counted text by text, see regex_counts"""
+    __slots__ = ()
+
+    def __call__(self, x, text_col="text"):
+        text = x[text_col]
+        return self.label if len(re.findall(self.pattern, text, self.flags)) >= self.min_count else ABSTAIN
+
+
+class ThresholdLF(namedtuple("ThresholdLF", ["name", "column", "op", "value", "label"])):
+    """label if x[column] <op> value, i.e. op='>=' -> x[column] >= value, otherwise ABSTAIN"""
+    __slots__ = ()
+
+    def __call__(self, x):
+        return self.label if COMPARISONS[self.op](x[self.column], self.value) else ABSTAIN
+
+
+def join_texts(texts, sep=TEXT_SEP):
+    """texts joined with sep, with the start and length of each text in the joined text"""
+    texts = [str(t) for t in texts]
+    lens = np.array([len(t) for t in texts], dtype=np.int64)
+    starts = np.zeros(len(texts), dtype=np.int64)
+    np.cumsum(lens[:-1] + len(sep), out=starts[1:])
+
+    joined = sep.join(texts)
+    if joined.count(sep) != max(len(texts) - 1, 0):
+        raise ValueError(f"sep: {sep!r} found in texts, use a different sep")
+    return joined, starts, lens
+
+
+def _has_op(parsed, found):
+    """True if found(op, av) for any item of a parsed pattern (or any group / branch in it)"""
+    for op, av in parsed:
+        if found(op, av):
+            return True
+        for a in (av if isinstance(av, (tuple, list)) else [av]):
+            if isinstance(a, sre_parse.SubPattern) and _has_op(a, found):
+                return True
+            if isinstance(a, (tuple, list)) and \
+                    any(isinstance(b, sre_parse.SubPattern) and _has_op(b, found) for b in a):
+                return True
+    return False
+
+
+def _uses_anchors(parsed):
+    return _has_op(parsed, lambda op, av: op is sre_constants.AT and av in ANCHORS)
+
+
+def _uses_lookarounds(parsed):
+    # lookahead / lookbehind (positive or negative) - can see past the end / start of a text in the joined text
+    return _has_op(parsed, lambda op, av: op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT))
+
+
+def regex_counts(texts, pattern, flags=0, sep=TEXT_SEP):
+    """number of (non overlapping) matches of pattern in each of texts - as len(re.findall(...)) for each
+    but with one scan over all the texts (joined with sep)
+
+    texts: list / array of str, or the output of join_texts (to count several patterns on the same texts)
+    pattern: str or compiled regex - should not match sep. anchors (^, $, \\A, \\Z) are not allowed
+    (they would only match at the start / end of the joined text) and raise ValueError.
+    patterns with lookarounds could see sep (or the neighbouring text), so are counted text by text
+
+    returns int64 array, same length as texts
+    """
+    joined, starts, lens = texts if isinstance(texts, tuple) else join_texts(texts, sep)
+
+    regex = pattern if isinstance(pattern, re.Pattern) else re.compile(pattern, flags)
+    parsed = sre_parse.parse(regex.pattern, regex.flags)
+    if _uses_anchors(parsed):
+        raise ValueError(f"pattern: {regex.pattern!r} uses anchors (^, $, \\A, \\Z), these are not supported")
+    if _uses_lookarounds(parsed):
+        # sliced, as a lookbehind can see before pos in regex.findall(joined, pos, endpos)
+        return np.array([len(regex.findall(joined[s:s + n])) for s, n in zip(starts.tolist(), lens.tolist())],
+                        dtype=np.int64)
+    spans = np.array([m.span() for m in regex.finditer(joined)], dtype=np.int64).reshape(-1, 2)
+
+    # the text each match starts in - and check the match ends in the same text
+    row = np.searchsorted(starts, spans[:, 0], side="right") - 1
+    if (spans[:, 1] > starts[row] + lens[row]).any():
+        raise ValueError(f"pattern: {regex.pattern!r} matched across texts, it should not match the separator")
+
+    return np.bincount(row, minlength=len(starts))
+
+
+def apply_lfs(df, lfs, text_col="text"):
+    """apply labeling functions (RegexLF, ThresholdLF) to each row of df
+
+    returns int8 array (len(df), len(lfs)) - the label from each lf, or ABSTAIN (-1)
+    - the same as snorkel's PandasLFApplier(lfs=to_snorkel_lfs(lfs)).apply(df), for the patterns
+      regex_counts supports (others raise ValueError, see RegexLF)
+    """
+    L = np.full((len(df), len(lfs)), ABSTAIN, dtype=np.int8)
+    if len(df) == 0:
+        return L
+
+    texts = None
+    counts = {}
+    for j, lf in enumerate(lfs):
+        if isinstance(lf, RegexLF):
+            if texts is None:
+                texts = join_texts(df[text_col].values)
+            # the same pattern (and flags) need only be counted once
+            key = (lf.pattern, lf.flags)
+            if key not in counts:
+                counts[key] = regex_counts(texts, lf.pattern, lf.flags)
+            hit = counts[key] >= lf.min_count
+        elif isinstance(lf, ThresholdLF):
+            hit = COMPARISONS[lf.op](df[lf.column].to_numpy(), lf.value)
+        else:
+            raise TypeError(f"lf: {lf!r} is not a RegexLF or ThresholdLF")
+        L[hit, j] = lf.label
+    return L
+
+
+def to_snorkel_lfs(lfs, text_col="text"):
+    """lfs as snorkel LabelingFunctions - i.e. for use with PandasLFApplier"""
+    from snorkel.labeling import LabelingFunction
+
+    return [LabelingFunction(name=lf.name, f=lf, resources={"text_col": text_col})
+            if isinstance(lf, RegexLF) else LabelingFunction(name=lf.name, f=lf)
+            for lf in lfs]
@@ -0,0 +1,252 @@
+# multi-pattern (Aho-Corasick) matching of company names in text
+# - built once from the list of (knowledge base) company names
+# - a single left to right pass over an article finds every occurrence of every name
+# - replaces searching with large "|".join(names) regular expressions, see make_reg_tree in utils
+# - LongToShortNameRewriter replaces (long) company names and their aliases with the shortest name, in a
+#   single pass of one compiled (trie shaped) regular expression - also giving where each replacement moved to
+#   in the rewritten text
+
+import re
+
+import numpy as np
+
+
+class CompanyNameMatcher:
+    """find all occurrences of many company names in text with a single pass
+
+    names are matched literally (i.e. are not treated as regular expressions)
+    and case sensitive, overlapping matches are all reported
+    e.g. both 'Exxon Mobil Corp' and 'Mobil Corp' are found in '... Exxon Mobil Corp ...'
+
+    example:
+        matcher = CompanyNameMatcher(["Apple Inc", "Foxconn"])
+        matcher.names_in_text(text)  # -> ["Apple Inc"]
+        matcher.find_spans(text)     # -> {"Apple Inc": [(10, 19)]}
+    """
+
+    def __init__(self, names):
+
+        # keep names in the order given - drop duplicates and empty strings
+        self.names = list(dict.fromkeys(n for n in names if isinstance(n, str) and len(n) > 0))
+        self._name_len = [len(n) for n in self.names]
+
+        # trie: goto[node] is a dict of char -> child node, node 0 is the root
+        self._goto = [{}]
+        # the name index ending at a given node (-1 if none)
+        self._out = [-1]
+
+        for idx, name in enumerate(self.names):
+            node = 0
+            for ch in name:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._out.append(-1)
+                node = nxt
+            self._out[node] = idx
+
+        self._build_links()
+
+    def _build_links(self):
+        """set the failure links (longest proper suffix that is also in the trie)
+        and the output links (nearest node along failure links that ends a name)"""
+
+        n_nodes = len(self._goto)
+        self._fail = [0] * n_nodes
+        self._out_link = [-1] * n_nodes
+
+        # breadth first - so the failure link of a parent is set before its children
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                f = self._goto[f].get(ch, 0)
+                # children of the root fail back to the root
+                self._fail[child] = f if f != child else 0
+
+                f = self._fail[child]
+                self._out_link[child] = f if self._out[f] >= 0 else self._out_link[f]
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getstate__(self):
+        # only the names are needed to rebuild - much smaller to pickle (i.e. to send to other processes)
+        return {"names": self.names}
+
+    def __setstate__(self, state):
+        self.__init__(state["names"])
+
+    def iter_matches(self, text):
+        """yield (name index, start, end) for every occurrence of a name in text,
+        ordered by end position - text[start:end] is the name"""
+
+        goto, fail, out, out_link, name_len = self._goto, self._fail, self._out, self._out_link, self._name_len
+
+        node = 0
+        for i, ch in enumerate(text):
+            nxt = goto[node].get(ch)
+            while nxt is None and node:
+                node = fail[node]
+                nxt = goto[node].get(ch)
+            node = 0 if nxt is None else nxt
+
+            # report the name ending here (if any) and those that are suffixes of it
+            o = node if out[node] >= 0 else out_link[node]
+            while o > 0:
+                idx = out[o]
+                yield idx, i + 1 - name_len[idx], i + 1
+                o = out_link[o]
+
+    def find_spans(self, text):
+        """return a dict of name -> list of (start, end) character spans, for the names found in text"""
+        spans = {}
+        for idx, start, end in self.iter_matches(text):
+            spans.setdefault(self.names[idx], []).append((start, end))
+        return spans
+
+    def names_in_text(self, text):
+        """return a list of the names found in text - in the same order as they were given"""
+        found = {idx for idx, _, _ in self.iter_matches(text)}
+        return [self.names[idx] for idx in sorted(found)]
+
+
+def make_name_regex(names):
+    """compile a regular expression matching any of names (literally) - longest name first at each position
+
+    the names are put in a trie, so the expression shares common prefixes, i.e.
+    ["Apple", "Apple Inc", "Applied Materials"] -> Appl(?:e(?: Inc)?|ied Materials) (spaces are escaped)
+    """
+    trie = {}
+    for name in names:
+        node = trie
+        for ch in name:
+            node = node.setdefault(ch, {})
+        # marks the end of a name
+        node[""] = {}
+
+    def to_regex(node):
+        alts = []
+        for ch, child in sorted(node.items()):
+            if ch == "":
+                continue
+            # collapse chains of single children into one literal
+            lit = ch
+            while len(child) == 1 and "" not in child:
+                (ch, child), = child.items()
+                lit += ch
+            alts.append(re.escape(lit) + to_regex(child))
+        if len(alts) == 0:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        # a name ends here - but try to match a longer one first (greedy)
+        return f"(?:{body})?" if "" in node else body
+
+    return re.compile(to_regex(trie)) if len(trie) else None
+
+
+class LongToShortNameRewriter:
+    """replace company names (and their aliases) in text with the shortest name, in a single pass
+
+    built from a long to short name map: long name -> list of short names, shortest last
+    i.e. {"Exxon Mobil Corp": ["Exxon Mobil", "Exxon"]} - the long name and each (longer) short name are
+    replaced with the shortest. long names without short names are not changed (but are reported as found)
+
+    names are matched literally (not as regular expressions, so 'AT&T Inc.' or 'S.A.' are fine) with one
+    compiled expression, scanning left to right and taking the longest name at each position
+    - text that has been replaced is not matched again
+
+    example:
+        rewriter = LongToShortNameRewriter({"Exxon Mobil Corp": ["Exxon"], "Mobil Corp": ["Mobil"]})
+        text, long_to_short, spans = rewriter.rewrite("Exxon Mobil Corp and Mobil Corp")
+        # text: "Exxon and Mobil", long_to_short: {"Exxon Mobil Corp": "Exxon", "Mobil Corp": "Mobil"}
+    """
+
+    def __init__(self, short_name_map):
+        self.short_name = {ln: ([ln] + list(sn))[-1] for ln, sn in short_name_map.items()}
+
+        # the names to match for each long name: itself and any short names longer than the shortest
+        # - and the reverse: the long names each name is replaced for, longest long name first
+        self._owners = {}
+        for ln in sorted(short_name_map, key=lambda x: (-len(x), x)):
+            for n in ([ln] + list(short_name_map[ln]))[:-1] or [ln]:
+                self._owners.setdefault(n, []).append(ln)
+
+        self.regex = make_name_regex(self._owners)
+        # names that are prefixes of each name (including itself), longest first
+        # - if the longest name at a position is not to be replaced, a shorter one might be
+        self._prefixes = {n: [n[:k] for k in range(len(n), 0, -1) if n[:k] in self._owners] for n in self._owners}
+
+    def find_replacements(self, text, names=None):
+        """the (non overlapping) replacements to make: list of (start, end, long name), in text order
+
+        names: the long names to replace (i.e. those found in the text), if None all long names are used
+        """
+        if self.regex is None:
+            return []
+        active = None if names is None else set(names)
+
+        out = []
+        pos = 0
+        while pos is not None:
+            restart = None
+            for m in self.regex.finditer(text, pos):
+                # the longest name here that belongs to a long name being replaced
+                # - usually the name matched, but could be a shorter one (a prefix of it)
+                found = None
+                for n in self._prefixes[m.group(0)]:
+                    for ln in self._owners[n]:
+                        if (active is None) or (ln in active):
+                            found = (n, ln)
+                            break
+                    if found is not None:
+                        break
+
+                if found is None:
+                    # another name may start inside this one - continue searching from the next character
+                    restart = m.start() + 1
+                    break
+                out.append((m.start(), m.start() + len(found[0]), found[1]))
+                if len(found[0]) < len(m.group(0)):
+                    restart = m.start() + len(found[0])
+                    break
+            pos = restart
+        return out
+
+    def rewrite(self, text, names=None):
+        """replace long names (and aliases) in text with the shortest name
+
+        names: the long names to replace, if None all long names are used
+        returns:
+        - the rewritten text
+        - dict of long name -> shortest name, for the long names found (as themselves) in the text
+        - (n, 4) array of [start, end, new start, new end]: each replacement's span in the original and
+          rewritten text
+        """
+        pieces = []
+        long_to_short = {}
+        spans = []
+        prev = 0
+        shift = 0
+        for start, end, long_name in self.find_replacements(text, names):
+            short = self.short_name[long_name]
+            # the long name itself was found
+            if end - start == len(long_name) and text[start:end] == long_name:
+                long_to_short[long_name] = short
+            pieces.append(text[prev:start])
+            pieces.append(short)
+            spans.append((start, end, start + shift, start + shift + len(short)))
+            shift += len(short) - (end - start)
+            prev = end
+        pieces.append(text[prev:])
+
+        return "".join(pieces), long_to_short, np.array(spans, dtype=np.int64).reshape(-1, 4)
@@ -8,12 +8,15 @@ import os
 import sys
 import logging
 import hashlib
+import atexit
 import pandas as pd
 import numpy as np
 import datetime
 
+# the crawler module is imported first: in newer versions of newsplease the extractor module imports it,
+# and importing the extractor first fails with a circular import
+import newsplease.crawler.commoncrawl_crawler
 from newsplease.crawler.commoncrawl_extractor import CommonCrawlExtractor
-from newsplease.crawler.commoncrawl_crawler import __start_commoncrawl_extractor
 
 # remove this, use pip install -e .
 try:
@@ -28,7 +31,19 @@ except NameError:
 
 
 from supply_chain_extract import get_parent_path, get_configs_path
-from supply_chain_extract.utils import get_database, get_config
+from supply_chain_extract.utils import get_database, get_config, get_company_names, get_set_name
+from supply_chain_extract.name_matcher import CompanyNameMatcher
+from supply_chain_extract.article_store import ArticleStoreWriter
+from supply_chain_extract.warc_queue import MongoWarcQueue, SQLiteWarcQueue, LeaseHeartbeat, get_worker_id
+from supply_chain_extract.warc_pipeline import run_warc_pipeline, get_local_warc_path
+from supply_chain_extract.warc_cache import WarcCache, get_expected_warc_sizes
+from supply_chain_extract.warc_stream import extract_from_warc_stream
+from supply_chain_extract.warc_index import get_index_path
+from supply_chain_extract.crawl_metrics import CrawlMetrics
+
+
+# base_url = 'https://commoncrawl.s3.amazonaws.com/'
+CC_BASE_URL = 'https://data.commoncrawl.org/'
 
 
 def __setup__():
@@ -39,19 +54,76 @@ def __setup__():
     os.makedirs(my_local_download_dir_article, exist_ok=True)
 
 
-def callback_on_warc_completed(*args, **kwargs):
+# counters for the warc file being extracted (in this process) - see __start_warc_metrics
+__warc_counts = None
+__host_counts = {}
+
+
+def callback_on_warc_completed(warc_path, counter_article_passed, counter_article_discarded,
+                               counter_article_error, counter_article_total, *args, **kwargs):
     """
-    This function will be invoked for each WARC file that was processed completely. Parameters represent total values,
-    i.e., cumulated over all all previously processed WARC files.
+    This function will be invoked for each WARC file that was processed completely. The counters are for that
+    WARC file only - they are kept to be returned (with timings) by extract_warc / stream_extract_warc.
     :param warc_path:
     :param counter_article_passed:
     :param counter_article_discarded:
     :param counter_article_error:
     :param counter_article_total:
-    :param counter_warc_processed:
     :return:
     """
-    pass
+    global __warc_counts
+    __warc_counts = {"passed": counter_article_passed,
+                     "discarded": counter_article_discarded,
+                     "error": counter_article_error,
+                     "total": counter_article_total}
+
+
+def __start_warc_metrics():
+    # reset the counters before extracting a warc file, returns the start time
+    global __warc_counts, __host_counts
+    __warc_counts = None
+    __host_counts = {}
+    return time.perf_counter()
+
+
+def __get_warc_metrics(t0, nbytes=None):
+    # metrics for the warc file just extracted - returned to the main process, see crawl_metrics.py
+    return {"extraction_seconds": time.perf_counter() - t0,
+            "bytes": nbytes,
+            **({} if __warc_counts is None else __warc_counts),
+            "hosts": dict(__host_counts)}
+
+
+# writer for the (packed) article store - one per process, created when first needed
+__article_store_writer = None
+
+
+def __get_article_store_writer():
+    global __article_store_writer
+    # extraction may run in forked processes - each needs it's own writer (segment files)
+    if (__article_store_writer is None) or (__article_store_writer.pid != os.getpid()):
+        __article_store_writer = ArticleStoreWriter(my_local_download_dir_article)
+        # write any buffered articles on exit (extraction processes flush after each warc file,
+        # see __flush_article_store - they may not run exit handlers)
+        atexit.register(__article_store_writer.close)
+    return __article_store_writer
+
+
+def __flush_article_store():
+    # write the articles (buffered in blocks) extracted from a warc file - before it is marked as complete
+    if (__article_store_writer is not None) and (__article_store_writer.pid == os.getpid()):
+        __article_store_writer.flush()
+
+
+# company name matcher - one per process, created when first needed from my_company_names
+__name_matcher = None
+
+
+def __get_name_matcher():
+    global __name_matcher
+    if __name_matcher is None:
+        __name_matcher = CompanyNameMatcher(my_company_names)
+    return __name_matcher
 
 
 def __get_pretty_filepath(path, article):
@@ -74,7 +146,26 @@ def on_valid_article_extracted(article):
     :param article:
     :return:
     """
+    # search for (knowledge base) company names while the article is in memory
+    # - keep only articles with at least one name, along with the names found and the set name searched with
+    # - add_articles_to_mongo will use these names instead of searching the article again
+    if my_company_names is not None:
+        names_in_text = __get_name_matcher().names_in_text(article.maintext or "")
+        if len(names_in_text) == 0:
+            return
+        article.names_in_text = names_in_text
+        article.set_name = my_set_name
+
+    # articles kept, by host
+    __host_counts[article.source_domain] = __host_counts.get(article.source_domain, 0) + 1
+
     # do whatever you need to do with the article (e.g., save it to disk, store it in ElasticSearch, etc.)
+    if my_article_store == "packed":
+        # append to the article store, using the same name as the json file would have
+        json_file = hashlib.sha256(article.filename.encode()).hexdigest() + '.json'
+        __get_article_store_writer().write(article.__dict__, json_file=json_file, domain=article.source_domain)
+        return
+
     with open(__get_pretty_filepath(my_local_download_dir_article, article), 'w', encoding='utf-8') as outfile:
         if my_json_export_style == 0:
             json.dump(article.__dict__, outfile, default=str, separators=(',', ':'), ensure_ascii=False)
@@ -84,6 +175,89 @@ def on_valid_article_extracted(article):
 
 
 
+def init_extraction_process(config):
+    """set the configuration (my_* variables) in an extraction process"""
+    globals().update(config)
+
+
+# cache of downloaded warc files (in my_local_download_dir_warc) - used in the main (download) process only
+__warc_cache = None
+
+
+def download_warc(warc_file):
+    """download a warc file to my_local_download_dir_warc, returns (local path, downloaded)
+    an existing file is only used if it is complete (then downloaded is False), see warc_cache.py"""
+    warc_download_url = my_warc_base_url + warc_file
+    local_path = get_local_warc_path(warc_download_url, my_local_download_dir_warc)
+    if (not my_reuse_previously_downloaded_files) and os.path.isfile(local_path):
+        os.remove(local_path)
+    return __warc_cache.get(warc_download_url, local_path, name=warc_file)
+
+
+def release_warc(warc_file):
+    """allow a (downloaded) warc file to be removed from the cache"""
+    __warc_cache.release(get_local_warc_path(my_warc_base_url + warc_file, my_local_download_dir_warc))
+
+
+def get_warc_source(warc_file):
+    """the url to read a warc file from - used in place of download_warc when streaming"""
+    return my_warc_base_url + warc_file
+
+
+def stream_extract_warc(warc_file, source):
+    """extract articles from a warc file, reading it as a stream (not saved to disk)
+    source can also be a local path - i.e. of a downloaded warc file
+    returns metrics (timings and counts) for the warc file"""
+    t0 = __start_warc_metrics()
+    # write an index of the records in the warc file - used for re-extraction, see warc_index.py
+    index_path = None if my_warc_index_dir is None else get_index_path(my_warc_index_dir, warc_file)
+    counts = extract_from_warc_stream(source,
+                             callback_on_article_extracted=on_valid_article_extracted,
+                             callback_on_warc_completed=callback_on_warc_completed,
+                             index_path=index_path,
+                             valid_hosts=my_filter_valid_hosts,
+                             start_date=my_filter_start_date,
+                             end_date=my_filter_end_date,
+                             strict_date=my_filter_strict_date,
+                             continue_after_error=my_continue_after_error,
+                             fetch_images=my_fetch_images)
+    __flush_article_store()
+    return __get_warc_metrics(t0, nbytes=counts["bytes"])
+
+
+def extract_warc(warc_file, local_path):
+    """extract articles from a (downloaded) warc file, returns metrics (timings and counts) for the warc file"""
+    # newsplease's extractor does not provide record offsets - so to write an index read the file as a stream
+    if my_warc_index_dir is not None:
+        metrics = stream_extract_warc(warc_file, local_path)
+        if my_delete_warc_after_extraction:
+            os.remove(local_path)
+        return metrics
+
+    t0 = __start_warc_metrics()
+    nbytes = os.path.getsize(local_path)
+    warc_download_url = my_warc_base_url + warc_file
+    # use the (public) extractor class directly - a new instance per file, as its settings are set per call
+    CommonCrawlExtractor().extract_from_commoncrawl(warc_download_url,
+                                                    on_valid_article_extracted,
+                                                    callback_on_warc_completed=callback_on_warc_completed,
+                                                    valid_hosts=my_filter_valid_hosts,
+                                                    start_date=my_filter_start_date,
+                                                    end_date=my_filter_end_date,
+                                                    strict_date=my_filter_strict_date,
+                                                    # the file has already been downloaded (to local_path)
+                                                    reuse_previously_downloaded_files=True,
+                                                    local_download_dir_warc=os.path.dirname(local_path),
+                                                    continue_after_error=my_continue_after_error,
+                                                    show_download_progress=my_show_download_progress,
+                                                    log_level=my_log_level,
+                                                    delete_warc_after_extraction=my_delete_warc_after_extraction,
+                                                    log_pathname_fully_extracted_warcs=None,
+                                                    fetch_images=my_fetch_images)
+    __flush_article_store()
+    return __get_warc_metrics(t0, nbytes=nbytes)
+
+
 def get_unfetched_commoncrawl_files(art_db, use_dates=None):
     filter = {}
     projection = {"name": 1, "fetched": 1, "date": 1}
@@ -153,6 +327,20 @@ if __name__ == "__main__":
     vc = pd.DataFrame(list(client["knowledge_base"]["KB"].find(filter={})))
     t1 = time.time()
 
+    # ----
+    # company names to search for during extraction (optional)
+    # ----
+
+    # if True, articles are searched for company names (as in add_articles_to_mongo) as they are extracted
+    # and only those with at least one name are kept
+    if cc_config.get("match_names_in_extraction", False):
+        my_company_names = get_company_names(vc, parents_only=cc_config.get("parents_only", False)).tolist()
+        my_set_name = get_set_name(art_db, my_company_names)
+        print(f"will search articles for: {len(my_company_names)} company names (set: {my_set_name})")
+    else:
+        my_company_names = None
+        my_set_name = None
+
     # ----
     # filter dates to fetch - i.e. get update_dates
     # ----
@@ -173,219 +361,181 @@ if __name__ == "__main__":
         update_dates = None
 
     # ----
-    # get commoncrawl files that can be downloaded
+    # work queue of commoncrawl files that can be downloaded
     # ----
 
-    # get the commoncrawl files that have not been fetched
-    ccf = get_unfetched_commoncrawl_files(art_db, use_dates=update_dates)
-
-    # # remove the previously fetched dates
-    # fetched_dates = list(["fetched_dates"].find())
-    # fetched_dates = [f["date"] for f in fetched_dates]
-    # fetched_dates = np.array(fetched_dates).astype("datetime64[ns]")
-    #
-    # if len(fetched_dates) == 0:
-    #     print("no dates previously fetched")
-
-    # remove previously fetched
-    # update_dates = update_dates[~np.in1d(update_dates, fetched_dates)]
-
-    counter = 0
-    max_count = len(ccf)
-    # TODO: this can be tidied up
-    while len(ccf) > 0:
-        counter += 1
-
-        # get the current date
-        todays_date = datetime.datetime.now().strftime("%Y-%m-%d")
-
-        # pick a random date - to reduce chances of two people fetching same
-        # date at same time
-
-        # ---
-        # convert date to fetched to datetime
-        # ---
-        #
-        # if update_dates is None:
-        #     ran_date = np.random.choice(ccf['date'].values, 1)
-        # else:
-        #     ran_date = np.random.choice(update_dates, 1)
-        # # TODO: get stackoverflow ref
-        # start_date = datetime.datetime.utcfromtimestamp(int(ran_date)/1e9)
-        #
-        # date_str = pd.to_datetime(update_dates[0]).strftime("%Y-%m-%d")
-        #
-        # # --
-        # # add / update document for this date specifying started, but did not finish
-        # # --
-        # # TODO: include the names/websites which were searched/filtered for?
-        # doc = {"date": date_str, "started": True, "finished": False}
-        # client["news_articles"]["fetched_dates"].update_one(filter={"date": date_str},
-        #                                                     update={"$set": doc},
-        #                                                     upsert=True)
-
-        # this was taken from new-please repo: news-please/newsplease/examples/commoncrawl_crawler.py
-        # TODO: have the below parameters specified in a config
-        ############ YOUR CONFIG ############
-        # download dir for warc files
-        my_local_download_dir_warc = cc_config["my_local_download_dir_warc"]
-        os.makedirs(my_local_download_dir_warc, exist_ok=True)
-
-        # download dir for articles
-        my_local_download_dir_article = cc_config["my_local_download_dir_article"]
-        os.makedirs(my_local_download_dir_warc, exist_ok=True)
-
-        # hosts (if None or empty list, any host is OK)
-        my_filter_valid_hosts = cc_config.get("my_filter_valid_hosts",
-                                              ["www.reuters.com", "uk.reuters.com"])
-        print("using my_filter_valid_hosts")
-        print(my_filter_valid_hosts)
-
-        # start date (if None, any date is OK as start date), as datetime
-        my_filter_start_date = None # datetime.datetime(2016, 1, 1)
-
-        # end date (if None, any date is OK as end date), as datetime
-        my_filter_end_date = None  # datetime.datetime(2016, 12, 31)
-
-        # Only .warc files published within [my_warc_files_start_date, my_warc_files_end_date) will be downloaded.
-        # Note that the date a warc file has been published does not imply it contains only news
-        # articles from that date. Instead, you must assume that the warc file can contain articles
-        # from ANY time before the warc file was published, e.g., a warc file published in August 2020
-        # may contain news articles from December 2016.
-        # my_warc_files_start_date = start_date  # example: datetime.datetime(2020, 3, 1)
-        # my_warc_files_end_date = start_date + datetime.timedelta(1) # example: datetime.datetime(2020, 3, 2)
-        # if date filtering is strict and news-please could not detect the date of an article, the article will be discarded
-        my_filter_strict_date = cc_config.get("my_filter_strict_date", True)
-        # if True, the script checks whether a file has been downloaded already and uses that file instead of downloading
-        # again. Note that there is no check whether the file has been downloaded completely or is valid!
-        my_reuse_previously_downloaded_files = cc_config.get("my_reuse_previously_downloaded_files", True)
-        # continue after error
-        my_continue_after_error = cc_config.get("my_continue_after_error", True)
-        # show the progress of downloading the WARC files
-        my_show_download_progress = cc_config.get("my_show_download_progress", True)
-        # log_level
-        my_log_level = logging.INFO
-        # json export style
-        my_json_export_style = cc_config.get("my_json_export_style", 1)  # 0 (minimize), 1 (pretty)
-        # number of extraction processes
-        my_number_of_extraction_processes = cc_config.get("my_number_of_extraction_processes", 1)
-        # if True, the WARC file will be deleted after all articles have been extracted from it
-        my_delete_warc_after_extraction = cc_config.get("my_delete_warc_after_extraction", True)
-        # if True, will continue extraction from the latest fully downloaded but not fully extracted WARC files and then
-        # crawling new WARC files. This assumes that the filter criteria have not been changed since the previous run!
-        my_continue_process = cc_config.get("my_continue_process", True)
-        # if True, will crawl and extract main image of each article. Note that the WARC files
-        # do not contain any images, so that news-please will crawl the current image from
-        # the articles online webpage, if this option is enabled.
-        my_fetch_images = cc_config.get("my_fetch_images", False)
-        ############ END YOUR CONFIG #########
-
-
-        # take from newsplease/examples
-        # __setup__()
-        # try:
-        #     commoncrawl_crawler.crawl_from_commoncrawl(on_valid_article_extracted,
-        #                                                callback_on_warc_completed=callback_on_warc_completed,
-        #                                                valid_hosts=my_filter_valid_hosts,
-        #                                                start_date=my_filter_start_date,
-        #                                                end_date=my_filter_end_date,
-        #                                                warc_files_start_date=my_warc_files_start_date,
-        #                                                warc_files_end_date=my_warc_files_end_date,
-        #                                                strict_date=my_filter_strict_date,
-        #                                                reuse_previously_downloaded_files=my_reuse_previously_downloaded_files,
-        #                                                local_download_dir_warc=my_local_download_dir_warc,
-        #                                                continue_after_error=my_continue_after_error,
-        #                                                show_download_progress=my_show_download_progress,
-        #                                                number_of_extraction_processes=my_number_of_extraction_processes,
-        #                                                log_level=my_log_level,
-        #                                                delete_warc_after_extraction=my_delete_warc_after_extraction,
-        #                                                continue_process=my_continue_process,
-        #                                                fetch_images=my_fetch_images)
-        # except FileNotFoundError:
-        #     print("bad date?")
-        #     print(start_date)
-        #     doc["error_message"] = "FileNotFoundError"
-
-
-        # select a random(?) warc file
-        warc_file = np.random.choice(ccf["name"].values, 1)[0]
-        base_url = 'https://commoncrawl.s3.amazonaws.com/'
-        base_url = 'https://data.commoncrawl.org/'
-        warc_download_url = base_url + warc_file
-
-        # write to mongo this warc file has* been fetched
-        art_db["common_crawl_files"].update_one(filter={"name": warc_file},
-                                                update={"$set": {"fetched": True}})
-
-        try:
-            __log_pathname_fully_extracted_warcs = None
-            extractor_cls=CommonCrawlExtractor
-            # for warc_download_url in warc_download_urls:
-
-            __start_commoncrawl_extractor(warc_download_url,
-                                          callback_on_article_extracted=on_valid_article_extracted,
-                                          callback_on_warc_completed=callback_on_warc_completed,
-                                          valid_hosts=my_filter_valid_hosts,
-                                          start_date=my_filter_start_date,
-                                          end_date=my_filter_end_date,
-                                          strict_date=my_filter_strict_date,
-                                          reuse_previously_downloaded_files=my_reuse_previously_downloaded_files,
-                                          local_download_dir_warc=my_local_download_dir_warc,
-                                          continue_after_error=my_continue_after_error,
-                                          show_download_progress=my_show_download_progress,
-                                          log_level=my_log_level,
-                                          delete_warc_after_extraction=my_delete_warc_after_extraction,
-                                          log_pathname_fully_extracted_warcs=__log_pathname_fully_extracted_warcs,
-                                          extractor_cls=extractor_cls,
-                                          fetch_images=my_fetch_images)
-
-            # add the date fetched
-            art_db["common_crawl_files"].update_one(filter={"name": warc_file},
-                                                    update={"$set": {"fetched_date": todays_date}})
-
-        except Exception as e:
-            print("-"*50)
-            print("-"*50)
-
-            print(f"error occured\n will state current warc_file: {warc_file} fetched=False")
-            print(e)
-
-            # write to mongo this warc file has* been fetched
-            art_db["common_crawl_files"].update_one(filter={"name": warc_file},
-                                                    update={"$set": {"fetched": False}})
-
-            # assert False, "broke on purpose (remove this line)"
+    # lease based: a warc file is claimed atomically, so multiple workers (processes / machines)
+    # can work through common_crawl_files without fetching the same file twice
+    # - if a worker dies, the lease on it's warc file expires and it can be claimed again
+    lease_seconds = cc_config.get("work_queue_lease_seconds", 600)
 
-        # -----
-        # update doc in database indicating finished searching for that date
-        # -----
-
-        # update
-        # art_db["common_crawl_files"].update_one(filter={"_id": doc["_id"]},
-        #                                         update={"$set": {"fetched": True}})
-
-
-        # # TODO: add the in
-        # doc["finished"] = True
-        # client["news_articles"]["fetched_dates"].update_one(filter={"date": date_str},
-        #                                                    update={"$set": doc},
-        #                                                    upsert=True)
-
-        # # remove the previously fetched dates
-        # fetched_dates = list(client["news_articles"]["fetched_dates"].find())
-        # fetched_dates = [f["date"] for f in fetched_dates]
-        # fetched_dates = np.array(fetched_dates).astype("datetime64[ns]")
-        #
-        # # remove previously fetched
-        # update_dates = update_dates[~np.in1d(update_dates, fetched_dates)]
-
-        # get the commoncrawl files that have not been fetched
+    # if using a subset of dates, only claim the files for those dates
+    if update_dates is not None:
         ccf = get_unfetched_commoncrawl_files(art_db, use_dates=update_dates)
+        queue_names = ccf["name"].tolist()
+    else:
+        queue_names = None
 
-        # if counter happens to exceed max count then set ccf to [] - which will end loop
-        if counter >= max_count:
-            ccf = []
-
+    if cc_config.get("work_queue", "mongo") == "sqlite":
+        # local stand-in - see warc_queue.py for populating
+        queue = SQLiteWarcQueue(cc_config["work_queue_sqlite_file"],
+                                lease_seconds=lease_seconds,
+                                names=queue_names)
+    else:
+        queue = MongoWarcQueue(art_db["common_crawl_files"],
+                               lease_seconds=lease_seconds,
+                               names=queue_names)
+
+    worker_id = get_worker_id()
+    print(f"worker_id: {worker_id}, warc files available: {queue.count_remaining()}")
+
+    # this was taken from new-please repo: news-please/newsplease/examples/commoncrawl_crawler.py
+    ############ YOUR CONFIG ############
+    # download dir for warc files
+    my_local_download_dir_warc = cc_config["my_local_download_dir_warc"]
+    os.makedirs(my_local_download_dir_warc, exist_ok=True)
+
+    # download dir for articles
+    my_local_download_dir_article = cc_config["my_local_download_dir_article"]
+    os.makedirs(my_local_download_dir_warc, exist_ok=True)
+
+    # hosts (if None or empty list, any host is OK)
+    my_filter_valid_hosts = cc_config.get("my_filter_valid_hosts",
+                                          ["www.reuters.com", "uk.reuters.com"])
+    print("using my_filter_valid_hosts")
+    print(my_filter_valid_hosts)
+
+    # start date (if None, any date is OK as start date), as datetime
+    my_filter_start_date = None # datetime.datetime(2016, 1, 1)
+
+    # end date (if None, any date is OK as end date), as datetime
+    my_filter_end_date = None  # datetime.datetime(2016, 12, 31)
+
+    # if date filtering is strict and news-please could not detect the date of an article, the article will be discarded
+    my_filter_strict_date = cc_config.get("my_filter_strict_date", True)
+    # if True, the script checks whether a file has been downloaded already and uses that file instead of downloading
+    # again. Files are checked to be complete (size and gzip trailer), see warc_cache.py
+    my_reuse_previously_downloaded_files = cc_config.get("my_reuse_previously_downloaded_files", True)
+    # continue after error
+    my_continue_after_error = cc_config.get("my_continue_after_error", True)
+    # show the progress of downloading the WARC files
+    my_show_download_progress = cc_config.get("my_show_download_progress", True)
+    # log_level
+    my_log_level = logging.INFO
+    # json export style
+    my_json_export_style = cc_config.get("my_json_export_style", 1)  # 0 (minimize), 1 (pretty)
+    # how articles are stored: "json" (one file per article) or "packed" (see article_store.py)
+    my_article_store = cc_config.get("my_article_store", "json")
+    # number of extraction processes
+    my_number_of_extraction_processes = cc_config.get("my_number_of_extraction_processes", 1)
+    # number of warc files to download ahead (prefetch) of extraction - each ~1.1GB on disk
+    my_download_queue_depth = cc_config.get("my_download_queue_depth", 1)
+    # number of warc files downloaded at the same time
+    my_number_of_download_threads = cc_config.get("my_number_of_download_threads", 1)
+    # if True warc files are read as a stream (record by record) and are not saved to my_local_download_dir_warc
+    my_streaming_extraction = cc_config.get("my_streaming_extraction", False)
+    # where to get warc files from - a file:// url can be used for (offline) local copies
+    my_warc_base_url = cc_config.get("my_warc_base_url", CC_BASE_URL)
+    # if set, an index of the records (host, uri, offset, length) in each warc file is written to this directory
+    # - allows re-extracting articles for other hosts by reading only the records needed, see warc_index.py
+    my_warc_index_dir = cc_config.get("my_warc_index_dir", None)
+    # if True, the WARC file will be deleted after all articles have been extracted from it
+    my_delete_warc_after_extraction = cc_config.get("my_delete_warc_after_extraction", True)
+    # if set, downloaded warc files are kept (up to this size, in GB) and the least recently used are removed
+    # to make room - instead of deleting each after extraction
+    my_warc_cache_max_gb = cc_config.get("my_warc_cache_max_gb", None)
+    if my_warc_cache_max_gb is not None:
+        my_delete_warc_after_extraction = False
+    # if True, will continue extraction from the latest fully downloaded but not fully extracted WARC files and then
+    # crawling new WARC files. This assumes that the filter criteria have not been changed since the previous run!
+    my_continue_process = cc_config.get("my_continue_process", True)
+    # if True, will crawl and extract main image of each article. Note that the WARC files
+    # do not contain any images, so that news-please will crawl the current image from
+    # the articles online webpage, if this option is enabled.
+    my_fetch_images = cc_config.get("my_fetch_images", False)
+    ############ END YOUR CONFIG #########
+
+    # configuration needed in extraction processes
+    my_config = {k: v for k, v in globals().items() if k.startswith("my_")}
+
+    # expected sizes of warc files are used to check downloads are complete
+    __warc_cache = WarcCache(my_local_download_dir_warc,
+                             max_bytes=None if my_warc_cache_max_gb is None else int(my_warc_cache_max_gb * 2**30),
+                             expected_sizes=get_expected_warc_sizes(cc_config.get("warc_list_file", None)))
+
+    # per warc file metrics: written to metrics_file (jsonl) and metrics_prom_file (prometheus textfile), if set
+    metrics = CrawlMetrics(jsonl_path=cc_config.get("metrics_file", None),
+                           prom_path=cc_config.get("metrics_prom_file", None),
+                           window=cc_config.get("metrics_window", 20))
+    # warc_file -> (download seconds, bytes downloaded) - set by download threads
+    download_stats = {}
+
+    def download(warc_file):
+        if my_streaming_extraction:
+            # nothing to download - the warc file is read as it's extracted
+            return get_warc_source(warc_file)
+        t0 = time.perf_counter()
+        # a complete file already on disk will not be downloaded again - only record actual downloads
+        local_path, downloaded = download_warc(warc_file)
+        if downloaded:
+            download_stats[warc_file] = (time.perf_counter() - t0, os.path.getsize(local_path))
+        return local_path
+
+    # renew the lease of the warc files being worked on in the background
+    with LeaseHeartbeat(queue, worker_id) as heartbeat:
+
+        def claim():
+            # claim the next warc file - None if there are none left
+            warc_file = queue.claim(worker_id)
+            if warc_file is not None:
+                heartbeat.add(warc_file)
+            return warc_file
+
+        def on_complete(warc_file, extraction_metrics):
+            # mark as fetched - and add the date fetched
+            # - if the lease was lost while extracting, another worker has claimed the file and will mark it
+            if not queue.complete(warc_file, worker_id):
+                print(f"lease on: {warc_file} was lost before extraction finished, "
+                      f"it may be extracted again by another worker")
+            heartbeat.discard(warc_file)
+            release_warc(warc_file)
+            download_seconds, download_bytes = download_stats.pop(warc_file, (None, None))
+            metrics.record(warc_file, extraction_metrics,
+                           download_seconds=download_seconds, download_bytes=download_bytes)
+
+        def on_error(warc_file, e):
+            print("-"*50)
+            print(f"error occured\n will release warc_file: {warc_file}, so it can be fetched again")
+            print(e)
+            queue.release(warc_file, worker_id, error=e)
+            heartbeat.discard(warc_file)
+            release_warc(warc_file)
+            download_stats.pop(warc_file, None)
+            metrics.record_error(warc_file, e)
+
+        def on_dropped(warc_file):
+            # the lease was lost (expired and claimed by another worker) - leave the file to that worker
+            print(f"lease on: {warc_file} was lost, will not extract it")
+            heartbeat.discard(warc_file)
+            release_warc(warc_file)
+            download_stats.pop(warc_file, None)
+
+        # download (prefetch) and extract warc files in overlapping stages
+        # - when streaming there is nothing to download first, extraction reads straight from the source
+        counts = run_warc_pipeline(claim=claim,
+                                   download=download,
+                                   extract=stream_extract_warc if my_streaming_extraction else extract_warc,
+                                   on_complete=on_complete,
+                                   on_error=on_error,
+                                   is_dropped=heartbeat.is_lost,
+                                   on_dropped=on_dropped,
+                                   download_queue_depth=my_download_queue_depth,
+                                   download_threads=my_number_of_download_threads,
+                                   extraction_processes=my_number_of_extraction_processes,
+                                   extraction_initializer=init_extraction_process,
+                                   extraction_initargs=(my_config,))
+
+    print(f"warc files extracted: {counts['complete']}, errors: {counts['error']}, "
+          f"dropped (lease lost): {counts['dropped']}")
     print("FINSIHED!")
     client.close()
-
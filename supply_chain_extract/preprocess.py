@@ -0,0 +1,106 @@
+# preprocessing of extracted (full) sentences - as columnar transforms on the sentence DataFrame
+# - sentence 'id's: from article, date, source and (abbreviated) entity names and the sentence range
+# - dropping sentences with a non unique id, and overlapping sentences (those starting at the same sentence)
+# - cleaning the sentence text and adding some metrics (number of characters / tokens)
+# - names are abbreviated once per unique name, string columns use pandas string methods,
+#   and per group selections use groupby().transform - rather than row wise apply
+# - text cleaning is a single (fused) function per sentence
+#
+# see examples/preprocess_sentences.py, and examples/preprocess_sentences_benchmark.py for a comparison with
+# the row wise implementation
+
+import re
+
+import numpy as np
+import pandas as pd
+
+
+# anything between () and/or {}, including the brackets
+_BRACKETS = re.compile(r"[\{\(].*?[\}\)]")
+
+
+def abbreviate_name(name, abbrv_char=4):
+    """condensed name: the first abbrv_char characters of each word, i.e. 'Apple Inc' -> 'AppleInc'
+    NOTE: some companies may map to the same abbreviated name"""
+    return "".join([i[:abbrv_char] for i in name.split(" ") if len(i) > 0])
+
+
+def abbreviate_names(names, abbrv_char=4):
+    """abbreviate_name for each of names (a Series) - computed once for each unique name"""
+    uniq = pd.unique(names)
+    return names.map(dict(zip(uniq, [abbreviate_name(n, abbrv_char) for n in uniq])))
+
+
+def add_sentence_ids(fs, abbrv_char=4):
+    """add columns to full sentences (from extract_sentences_from_articles):
+    - e1, e2: abbreviated entity1_full, entity2_full
+    - sentence_range: 'start_sent|end_sent'
+    - id_: article, date_publish, source_domain, e1, e2 - joined with '_', with ' ', ':', '-' removed
+    - id: id_ + '_' + sentence_range
+    """
+    fs = fs.copy()
+    fs["e1"] = abbreviate_names(fs["entity1_full"], abbrv_char)
+    fs["e2"] = abbreviate_names(fs["entity2_full"], abbrv_char)
+    fs["sentence_range"] = fs["start_sent"].astype(str) + "|" + fs["end_sent"].astype(str)
+
+    # for a given article - source - date - entity pair
+    id_ = fs["article"].astype(str)
+    for c in ["date_publish", "source_domain", "e1", "e2"]:
+        id_ = id_ + "_" + fs[c].astype(str)
+    fs["id_"] = id_.str.replace("[ :-]", "", regex=True)
+    fs["id"] = fs["id_"] + "_" + fs["sentence_range"].str.replace("[ :-]", "", regex=True)
+    return fs
+
+
+def drop_non_unique_ids(fs, verbose=True):
+    """drop sentences whose id is shared with another sentence"""
+    id_count = fs.groupby("id")["full_sentence"].transform("count")
+    if verbose:
+        n_ids = fs["id"].nunique()
+        print(f"there are {fs.loc[id_count > 1, 'id'].nunique()} / {n_ids} 'id's "
+              f"that have more than one sentence")
+        print("These will be dropped for now")
+    return fs.loc[~(id_count > 1)]
+
+
+def keep_non_overlapping(fs, aggfunc="min"):
+    """for each id_ and start_sent keep the sentence with the min (or max) end_sent
+    i.e. with 'min' the shortest text that starts at start_sent for the given id_ (article, source, date, pair)
+
+    returns sentences sorted by id_ then start_sent, with the columns: id_, start_sent, end_sent then the others
+    """
+    # group on (sorted) integer codes of id_ - rather than the strings
+    codes = pd.factorize(fs["id_"], sort=True)[0]
+    start_sent = fs["start_sent"].values
+    end_sent = fs["end_sent"].groupby([codes, start_sent]).transform(aggfunc)
+    keep = (fs["end_sent"] == end_sent).values
+
+    # stable sort: by id_ then start_sent - selecting and sorting the rows in one take
+    order = np.lexsort((start_sent[keep], codes[keep]))
+    fs = fs.iloc[np.flatnonzero(keep)[order]]
+    cols = ["id_", "start_sent", "end_sent"]
+    return fs[cols + [c for c in fs.columns if c not in cols]].reset_index(drop=True)
+
+
+def short_text(sentences):
+    """the first character of each word (split on ' '), i.e. 'Apple buys chips' -> 'Abc'"""
+    return pd.Series(["".join([w[:1] for w in s.split(" ")]) for s in sentences.values],
+                     index=sentences.index, dtype=sentences.dtype)
+
+
+def clean_sentence(text):
+    """drop everything between () and/or {} (including the brackets), standardise quotes
+    and replace double spaces"""
+    return _BRACKETS.sub("", text).replace("’", "'").replace("”", '"').replace("  ", " ")
+
+
+def clean_sentences(us):
+    """clean full_sentence (see clean_sentence) and add metrics: num_chars and num_tokens (approximate)"""
+    us = us.copy()
+    us["full_sentence"] = [clean_sentence(s) for s in us["full_sentence"].values]
+
+    # number of characters
+    us["num_chars"] = us["full_sentence"].str.len()
+    # (approximate) number of tokens
+    us["num_tokens"] = us["full_sentence"].str.count(" ") + 1
+    return us
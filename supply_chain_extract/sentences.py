@@ -0,0 +1,439 @@
+# sentence segmentation of (article) texts - two backends with the same interface (see get_sentence_splitter)
+# - 'spacy': spacy pipelines loaded with only the components needed to find sentence boundaries
+#   (i.e. for en_core_web_sm: the parser and the tok2vec it listens to - no tagger, lemmatizer, ner)
+#   texts are processed in batches with nlp.pipe (optionally with multiple processes)
+# - 'regex': rule based splitter tuned for (reuters) news text - tickers ({AAPL.O}, (GLW.N)),
+#   abbreviations (U.S., Inc., Jan.) and bullet ('* ') lines - much faster, no model needed
+# - for each text the sentence start and end (character) offsets are returned as arrays
+# - new lines: the regex splitter uses them (paragraphs, bullets), for spacy they are replaced with spaces
+#   (keep_newlines) - either way the text segmented has the same length, so offsets are for the text given
+# - CachedSentenceSplitter stores the offsets (sqlite, i.e. data/sentence_cache.sqlite) keyed by a hash of the
+#   text and the splitter's cache_key (backend, model and version) - so unchanged texts are not re-segmented
+# - map_sentence_offsets moves offsets into a rewritten text (i.e. long names replaced with short ones, see
+#   LongToShortNameRewriter) - so the original text can be segmented (and cached) instead
+# - entity_pair_windows maps all the (alternating) mentions of an entity pair in a text to the sentences
+#   spanning them, with array operations (np.searchsorted over the sentence ends)
+#
+# to compare the backends (speed and boundary agreement) on data/example_inputs.tsv:
+#   python -m supply_chain_extract.sentences [spacy_model]
+
+import os
+import re
+import sys
+import time
+import sqlite3
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from supply_chain_extract import get_data_path
+
+try:
+    import spacy
+except ImportError:
+    # only needed for the spacy backend
+    spacy = None
+
+
+def load_sentence_segmenter(model="en_core_web_sm", use_senter=False):
+    """load a spacy pipeline, with everything not needed for sentence boundaries disabled
+
+    use_senter: if False sentences come from the dependency parser - the same as the full pipeline
+    - if True the (faster) statistical sentence recognizer 'senter' is used instead of the parser,
+      sentence boundaries can differ slightly
+    if the pipeline has neither a parser nor senter (i.e. spacy.blank("en")) a rule based 'sentencizer' is added
+    """
+    nlp = spacy.load(model) if isinstance(model, str) else model
+
+    if use_senter and ("senter" in nlp.component_names):
+        # senter is disabled by default in the core models
+        nlp.enable_pipe("senter")
+        keep = ["senter"]
+    elif "parser" in nlp.component_names:
+        # the parser may listen to a shared tok2vec / transformer
+        keep = ["parser"] + [p for p in ["tok2vec", "transformer"] if p in nlp.component_names]
+    else:
+        if "sentencizer" not in nlp.component_names:
+            nlp.add_pipe("sentencizer")
+        keep = ["sentencizer"]
+
+    nlp.select_pipes(enable=keep)
+    return nlp
+
+
+def get_sentence_offsets(texts, nlp=None, batch_size=64, n_process=1):
+    """yield (sent_start, sent_end) for each text: arrays of the start and end character offsets of the sentences
+
+    texts: iterable of str
+    nlp: pipeline from load_sentence_segmenter, if None will load en_core_web_sm
+    batch_size, n_process: passed to nlp.pipe
+    """
+    if nlp is None:
+        nlp = load_sentence_segmenter()
+
+    for doc in nlp.pipe(texts, batch_size=batch_size, n_process=n_process):
+        offsets = np.array([(s.start_char, s.end_char) for s in doc.sents], dtype=np.int64).reshape(-1, 2)
+        yield offsets[:, 0], offsets[:, 1]
+
+
+# abbreviations that (almost) never end a sentence
+NON_BREAKING_ABBREVIATIONS = {
+    "Mr", "Mrs", "Ms", "Dr", "Prof", "Sen", "Rep", "Gov", "Gen", "Col", "Lt", "Capt", "Sgt", "Rev", "St", "Mt",
+    "Jan", "Feb", "Mar", "Apr", "Jun", "Jul", "Aug", "Sep", "Sept", "Oct", "Nov", "Dec",
+    "No", "Nos", "vs", "approx", "est", "Fig", "Vol", "Ave", "Dept", "e.g", "i.e", "etc", "cf"}
+
+# abbreviations that can end a sentence (i.e. '... Apple Inc. The company ...') - only a boundary if the
+# next word is a common sentence start
+AMBIGUOUS_ABBREVIATIONS = {"Inc", "Corp", "Co", "Ltd", "Plc", "PLC", "LLC", "Bros", "Jr", "Sr"}
+SENTENCE_STARTERS = {
+    "The", "A", "An", "It", "Its", "He", "She", "We", "They", "I", "This", "That", "These", "Those", "There",
+    "In", "On", "At", "But", "And", "However", "Shares", "Analysts", "Reuters", "Last", "Earlier", "Separately"}
+
+
+# change if the regex splitter's rules change - so cached sentence offsets are not used
+REGEX_SPLITTER_VERSION = 1
+
+
+class RegexSentenceSplitter:
+    """rule based sentence splitter, same interface as SpacySentenceSplitter
+
+    - new lines always end a sentence (reuters paragraphs, bullet '* ' lines)
+    - otherwise a sentence ends at . ! or ? (and any closing quotes / brackets) followed by white space and
+      a capital letter, digit, opening quote / bracket or bullet
+    - except after abbreviations and initials (J. Smith) and inside tickers: {AAPL.O;-PCTCHNG:2}, (GLW.N)
+
+    keep_newlines: if False new lines are replaced with spaces first (so the new line rules don't apply)
+    """
+
+    # candidate sentence ends: punctuation, optional closing quotes / brackets - followed by the next sentence start
+    _candidate = re.compile(r"""[.!?]+["'\u201d\u2019)\]]*(?=\s+["'\u201c\u2018(\[*]?\s?[A-Z0-9])""")
+    # the word (without trailing punctuation) ending at a candidate
+    _word_before = re.compile(r"""(\S+?)[.!?]+["'\u201d\u2019)\]]*$""")
+    _word_after = re.compile(r"""\s+["'\u201c\u2018(\[*]?\s?([A-Za-z0-9]+)""")
+    # tickers / codes in brackets - no boundaries inside
+    _tickers = re.compile(r"\{[^{}\n]*\}|\([A-Z0-9^.=-]+\.[A-Za-z]+\)")
+    _acronym = re.compile(r"^(?:[A-Za-z]\.)+[A-Za-z]?$")
+    _paragraph = re.compile(r"\n+")
+    _content = re.compile(r"\S(?:.*\S)?", re.DOTALL)
+
+    def __init__(self, keep_newlines=True):
+        self.keep_newlines = keep_newlines
+
+    @property
+    def cache_key(self):
+        return f"regex:{REGEX_SPLITTER_VERSION}:{'newlines' if self.keep_newlines else 'no_newlines'}"
+
+    def _is_boundary(self, text, m):
+        word = self._word_before.search(text, max(0, m.start() - 40), m.end())
+        word = "" if word is None else word.group(1).lstrip("\"'(\u201c\u2018[")
+        if text[m.start()] != ".":
+            return True
+        if (word in NON_BREAKING_ABBREVIATIONS) or (len(word) == 1 and word.isupper()):
+            return False
+        if (word in AMBIGUOUS_ABBREVIATIONS) or self._acronym.match(word):
+            nxt = self._word_after.match(text, m.end())
+            return (nxt is not None) and (nxt.group(1) in SENTENCE_STARTERS)
+        return True
+
+    def split(self, text):
+        """returns (sent_start, sent_end): arrays of the start and end character offsets of the sentences"""
+        if not self.keep_newlines:
+            text = text.replace("\n", " ")
+        masked = [(t.start(), t.end()) for t in self._tickers.finditer(text)]
+
+        cuts = [p.start() for p in self._paragraph.finditer(text)]
+        for m in self._candidate.finditer(text):
+            if any(s <= m.start() < e for s, e in masked):
+                continue
+            if self._is_boundary(text, m):
+                cuts.append(m.end())
+        cuts = sorted(set(cuts)) + [len(text)]
+
+        # sentences are the (white space stripped) text between cuts
+        offsets = []
+        prev = 0
+        for c in cuts:
+            s = self._content.search(text, prev, c)
+            if s is not None:
+                offsets.append((s.start(), s.end()))
+            prev = c
+        offsets = np.array(offsets, dtype=np.int64).reshape(-1, 2)
+        return offsets[:, 0], offsets[:, 1]
+
+    def pipe(self, texts, batch_size=None, n_process=1):
+        """yield (sent_start, sent_end) for each text"""
+        for text in texts:
+            yield self.split(text)
+
+
+class SpacySentenceSplitter:
+    """sentence splitter using a spacy pipeline - see load_sentence_segmenter
+
+    keep_newlines: if False (default) new lines are replaced with spaces before segmenting
+    - the parser treats them as (white space) tokens, giving poor boundaries
+    """
+
+    def __init__(self, model="en_core_web_sm", use_senter=False, batch_size=64, n_process=1, keep_newlines=False):
+        self.nlp = load_sentence_segmenter(model, use_senter=use_senter)
+        self.batch_size = batch_size
+        self.n_process = n_process
+        self.keep_newlines = keep_newlines
+
+    @property
+    def cache_key(self):
+        """identifies the segmentation: spacy version, model (name and version) and the components run"""
+        meta = self.nlp.meta
+        return f"spacy:{spacy.__version__}:{meta.get('lang')}_{meta.get('name')}:{meta.get('version')}:" \
+               f"{','.join(self.nlp.pipe_names)}:{'newlines' if self.keep_newlines else 'no_newlines'}"
+
+    def split(self, text):
+        return next(self.pipe([text], batch_size=1, n_process=1))
+
+    def pipe(self, texts, batch_size=None, n_process=None):
+        if not self.keep_newlines:
+            texts = (t.replace("\n", " ") for t in texts)
+        return get_sentence_offsets(texts, self.nlp,
+                                    batch_size=self.batch_size if batch_size is None else batch_size,
+                                    n_process=self.n_process if n_process is None else n_process)
+
+
+class CachedSentenceSplitter:
+    """wraps a sentence splitter, storing the sentence offsets of each text in a sqlite database
+
+    texts are keyed by a hash of the text and the splitter's cache_key, so a text is only segmented again if
+    it (or the splitter) changes. offsets are for the exact text given - any normalisation the splitter does
+    (i.e. replacing new lines) is included in it's cache_key
+
+    splitter: RegexSentenceSplitter or SpacySentenceSplitter
+    cache_path: sqlite database file, default: data/sentence_cache.sqlite
+    commit_every: number of newly segmented texts to write to the database at a time
+    """
+
+    def __init__(self, splitter, cache_path=None, commit_every=1000):
+        self.splitter = splitter
+        self.cache_path = get_data_path("sentence_cache.sqlite") if cache_path is None else cache_path
+        self.commit_every = commit_every
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+        self.con = sqlite3.connect(self.cache_path)
+        self.con.execute("CREATE TABLE IF NOT EXISTS sentence_offsets (key TEXT PRIMARY KEY, offsets BLOB)")
+        self.con.commit()
+
+    @property
+    def cache_key(self):
+        return self.splitter.cache_key
+
+    def text_key(self, text):
+        return hashlib.sha256(f"{self.cache_key}\n{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys, chunk_size=500):
+        """cached offsets for keys (those found) - dict of key -> (sent_start, sent_end)"""
+        keys = list(set(keys))
+        out = {}
+        for i in range(0, len(keys), chunk_size):
+            chunk = keys[i:i + chunk_size]
+            rows = self.con.execute("SELECT key, offsets FROM sentence_offsets WHERE key IN "
+                                    f"({','.join('?' * len(chunk))})", chunk)
+            for k, b in rows:
+                offsets = np.frombuffer(b, dtype=np.int32).astype(np.int64).reshape(2, -1)
+                out[k] = (offsets[0], offsets[1])
+        return out
+
+    def put_many(self, items):
+        """store (key, (sent_start, sent_end)) items"""
+        self.con.executemany("INSERT OR REPLACE INTO sentence_offsets (key, offsets) VALUES (?, ?)",
+                             [(k, np.stack([s, e]).astype(np.int32).tobytes()) for k, (s, e) in items])
+        self.con.commit()
+
+    def split(self, text):
+        return next(self.pipe([text]))
+
+    def pipe(self, texts, **kwargs):
+        """yield (sent_start, sent_end) for each text - only texts not in the cache are passed to the splitter
+        (in a single pipe call, so spacy's batching / multiple processes are used as before)
+        kwargs are passed to the splitter's pipe"""
+        texts = list(texts)
+        keys = [self.text_key(t) for t in texts]
+        cached = self.get_many(keys)
+
+        # texts to segment - each only once, in the order first needed
+        todo = {k: t for t, k in zip(texts, keys) if k not in cached}
+        computed = self.splitter.pipe(iter(todo.values()), **kwargs)
+        # newly segmented texts not yet written to the database
+        pending = []
+        try:
+            for k in keys:
+                if k not in cached:
+                    self.misses += 1
+                    cached[k] = next(computed)
+                    pending.append((k, cached[k]))
+                    if len(pending) >= self.commit_every:
+                        self.put_many(pending)
+                        pending = []
+                else:
+                    self.hits += 1
+                yield cached[k]
+        finally:
+            self.put_many(pending)
+
+    def close(self):
+        self.con.close()
+
+
+def _map_positions(pos, spans, inside="start"):
+    # positions in a text moved to a rewritten text, spans: (n, 4) [start, end, new start, new end]
+    pos = np.asarray(pos, dtype=np.int64)
+    spans = np.asarray(spans, dtype=np.int64).reshape(-1, 4)
+    if len(spans) == 0:
+        return pos.copy()
+    start, end, new_start, new_end = spans.T
+
+    # the change in length from all the replacements ending at or before each position
+    k = np.searchsorted(end, pos, side="right")
+    shift = np.concatenate([[0], np.cumsum((new_end - new_start) - (end - start))])
+    out = pos + shift[k]
+
+    # positions strictly inside a replacement are moved to it's new start (or end)
+    kk = np.minimum(k, len(spans) - 1)
+    within = (k < len(spans)) & (start[kk] < pos)
+    out[within] = (new_start if inside == "start" else new_end)[kk[within]]
+    return out
+
+
+def map_sentence_offsets(sent_start, sent_end, spans):
+    """sentence offsets in a text mapped to the text after replacements (i.e. LongToShortNameRewriter.rewrite)
+
+    spans: (n, 4) array of [start, end, new start, new end] for each replacement, in text order
+    - a sentence starting (ending) inside a replacement will start (end) with the replaced text
+
+    returns (sent_start, sent_end)
+    """
+    return _map_positions(sent_start, spans, inside="start"), _map_positions(sent_end, spans, inside="end")
+
+
+def alternating_mentions(a, b):
+    """consecutive mentions of two different entities
+
+    a, b: (character) offsets of the mentions of entity a and b - no offset can be in both
+    returns (pts, a_first): pts - (n, 2) array of consecutive offsets (in sorted order) where the entity changes
+    i.e. a a b a -> (a2, b1), (b1, a3); a_first - bool array, True if the first of the pair is a mention of a
+    """
+    a = np.asarray(a).ravel()
+    b = np.asarray(b).ravel()
+    assert len(np.intersect1d(a, b)) == 0, f"some elements found in both 'a' and 'b'"
+
+    c = np.concatenate([a, b])
+    is_a = np.concatenate([np.ones(len(a), dtype=bool), np.zeros(len(b), dtype=bool)])
+    order = np.argsort(c, kind="stable")
+    c, is_a = c[order], is_a[order]
+
+    # where one entity's run of mentions ends and the other's starts
+    change = np.flatnonzero(is_a[:-1] != is_a[1:])
+    return np.stack([c[change], c[change + 1]], axis=1), is_a[change]
+
+
+def sentence_index(offsets, sent_end):
+    """index of the sentence each (character) offset is in - the first sentence ending after it
+    offsets after the end of the last sentence (i.e. trailing white space) are put in the last sentence"""
+    idx = np.searchsorted(sent_end, offsets, side="right")
+    return np.minimum(idx, len(sent_end) - 1)
+
+
+def entity_pair_windows(a, b, sent_start, sent_end):
+    """the sentences spanning each consecutive mention of two entities in a text
+
+    a, b: (n, 2) arrays of the (start, end) character offsets of the mentions of entity a and b
+    sent_start, sent_end: sentence offsets of the text, i.e. from a sentence splitter
+    returns dict of arrays, one entry per (alternating) pair of mentions:
+    - start, end: (n, 2) start and end offsets of the (first, second) mention
+    - a_first: True if the first mention is of entity a
+    - start_sent, end_sent: sentence index of the first and second mention (by their start)
+    - start_char, end_char: the character window: start of start_sent to end of end_sent
+    raises AssertionError if a and b share an offset, or the mention starts and ends do not alternate the same
+    """
+    a = np.asarray(a).reshape(-1, 2)
+    b = np.asarray(b).reshape(-1, 2)
+    start, a_first = alternating_mentions(a[:, 0], b[:, 0])
+    end, _ = alternating_mentions(a[:, 1], b[:, 1])
+    assert len(start) == len(end), "starting points and end points not as expected (overlapping mentions?)"
+
+    start_sent = sentence_index(start[:, 0], sent_end)
+    end_sent = sentence_index(start[:, 1], sent_end)
+    return {"start": start,
+            "end": end,
+            "a_first": a_first,
+            "start_sent": start_sent,
+            "end_sent": end_sent,
+            "start_char": np.asarray(sent_start)[start_sent],
+            "end_char": np.asarray(sent_end)[end_sent]}
+
+
+def get_sentence_splitter(backend="spacy", cache_path=None, **kwargs):
+    """get a sentence splitter: backend 'spacy' or 'regex', kwargs are passed to the splitter
+    both have: split(text) and pipe(texts) - returning / yielding (sent_start, sent_end) offset arrays
+    cache_path: if provided the splitter is wrapped in a CachedSentenceSplitter using this (sqlite) file"""
+    if backend == "spacy":
+        splitter = SpacySentenceSplitter(**kwargs)
+    elif backend == "regex":
+        splitter = RegexSentenceSplitter(**kwargs)
+    else:
+        raise ValueError(f"backend: {backend} not understood, expected 'spacy' or 'regex'")
+    if cache_path is not None:
+        splitter = CachedSentenceSplitter(splitter, cache_path=cache_path)
+    return splitter
+
+
+def _content_starts(text, sent_start, sent_end):
+    # start of the first non white space character of each sentence, excluding the first and empty sentences
+    starts = [s + len(text[s:e]) - len(text[s:e].lstrip()) for s, e in zip(sent_start, sent_end)]
+    return {s for s, e in zip(starts, sent_end) if s < e} - {min(starts, default=0)}
+
+
+def boundary_agreement(texts, reference, predicted):
+    """compare sentence boundaries of two segmentations of the same texts
+    reference, predicted: lists of (sent_start, sent_end)
+    boundaries are the sentence starts (excluding the first) moved past any leading white space - spacy can
+    include white space / new lines at the start of a sentence, the regex splitter does not
+    returns dict of precision, recall, f1 and the fraction of texts segmented identically"""
+    tp = fp = fn = same = 0
+    for text, (r_start, r_end), (p_start, p_end) in zip(texts, reference, predicted):
+        r = _content_starts(text, r_start, r_end)
+        p = _content_starts(text, p_start, p_end)
+        tp += len(r & p)
+        fp += len(p - r)
+        fn += len(r - p)
+        same += r == p
+    precision = tp / max(tp + fp, 1)
+    recall = tp / max(tp + fn, 1)
+    return {"precision": precision,
+            "recall": recall,
+            "f1": 2 * precision * recall / max(precision + recall, 1e-12),
+            "same_segmentation": same / max(len(reference), 1)}
+
+
+if __name__ == "__main__":
+
+    spacy_model = sys.argv[1] if len(sys.argv) > 1 else "en_core_web_sm"
+
+    # texts: left + entity1 + middle + entity2 + right
+    df = pd.read_csv(get_data_path("example_inputs.tsv"), sep="\t", keep_default_na=False)
+    texts = (df["left"] + df["entity1"] + df["middle"] + df["entity2"] + df["right"]).tolist()
+    # texts are given as they are (with new lines) - as in extract_sentences_from_articles each splitter
+    # handles new lines itself: kept by the regex splitter, replaced with spaces for spacy
+    print(f"segmenting: {len(texts)} texts")
+
+    results = {}
+    for backend, kwargs in [("regex", {}), ("spacy", {"model": spacy_model})]:
+        splitter = get_sentence_splitter(backend, **kwargs)
+        t0 = time.perf_counter()
+        results[backend] = list(splitter.pipe(texts))
+        t1 = time.perf_counter()
+        num_sents = sum(len(s) for s, _ in results[backend])
+        print(f"{backend}: {num_sents} sentences in {t1 - t0:.2f}s - {num_sents / (t1 - t0):.0f} sentences/second")
+
+    agreement = boundary_agreement(texts, results["spacy"], results["regex"])
+    print("regex boundaries vs spacy:")
+    print(pd.Series(agreement).round(3).to_string())
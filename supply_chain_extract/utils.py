@@ -9,6 +9,7 @@ import json
 import re
 from OpenPermID import OpenPermID
 from supply_chain_extract import get_configs_path
+from supply_chain_extract.name_matcher import CompanyNameMatcher
 
 
 def get_database(host=None, username=None, password=None, clustername=None, **kwargs):
@@ -104,10 +105,19 @@ def make_reg_tree(c, cur_node=1, max_node=1):
 
 
 def get_list_from_tree(text, rtree, out=None):
+    """get the (candidate) company names found in text
+
+    rtree can be either a 'regular expression tree' from make_reg_tree
+    or a CompanyNameMatcher, in which case only the names actually found in text are returned
+    """
 
     if out is None:
         out = []
 
+    if isinstance(rtree, CompanyNameMatcher):
+        out += rtree.names_in_text(text)
+        return out
+
     for k, v in rtree.items():
         if isinstance(v, dict):
             if re.search(k, text):
@@ -118,63 +128,72 @@ def get_list_from_tree(text, rtree, out=None):
     return out
 
 
-def remove_suffix(name, suffixes):
-    """helper function for niave_long_to_short_name"""
-    for s in suffixes:
-        # regex: space, word, space then any character to end
-        # or
-        name = re.sub(f" {s} .*$| {s}$", "", name)
-    return name
-
-
-def niave_long_to_short_name(all_names):
+# TODO: short_name_map needs to be reviewed!, preferable to use some NLP package (spacy?)
+# This is pretty hard coded list of company name 'suffixes'
+# - some of these were taken by counting suffixes occrances, removing those and repeating
+# - others were just a gues
+NAME_SUFFIXES = ['Inc', 'Corp', 'Ltd', 'Co', 'PLC', 'SA', 'AG', 'LLC', 'NV', 'SE',
+                 'ASA', 'Bhd', 'SpA', 'Association', 'Aerospace', 'AB', 'Oyj', "Plc"] + \
+                ['Holdings', 'Group', 'Technologies', 'International',
+                 'Systems', 'Energy', 'Communications', 'Airlines', 'Motor',
+                 'Technology', 'Oil', 'Motors', 'Industries', 'Steel',
+                 'Holding', 'Airways', 'Aviation', 'Automotive', 'Networks',
+                 'Electronics', 'Digital', 'BP', 'Electric', 'Aircraft',
+                 'US', 'Mobile', 'Software', 'Broadcom', 'Brands',
+                 'Service', 'Semiconductor', 'Petroleum'] + \
+                ['Platforms', 'Precision', 'Industry', 'AeroSystems', 'Media', 'Petrochemical']
+
+# compiled suffix expressions, by suffixes
+_suffix_regex = {}
+
+
+def make_suffix_regex(suffixes=None):
+    """compile a single regular expression finding the first suffix (as a whole word, after a space) in a name
+    suffixes: list of suffixes (taken literally), default NAME_SUFFIXES"""
+    key = tuple(NAME_SUFFIXES if suffixes is None else suffixes)
+    if key not in _suffix_regex:
+        # longest first - though the lookahead means the order does not change the match
+        alts = sorted(set(key), key=lambda x: (-len(x), x))
+        _suffix_regex[key] = re.compile(" (?:" + "|".join(re.escape(a) for a in alts) + ")(?= |$)")
+    return _suffix_regex[key]
+
+
+def remove_suffix(name, suffixes=None):
+    """helper function for niave_long_to_short_name
+    drop everything from the first suffix (a word after a space) onwards, i.e.
+    'Exxon Mobil Corp' -> 'Exxon Mobil', 'Samsung Electronics Co Ltd' -> 'Samsung'
+    suffixes: list of suffixes (default NAME_SUFFIXES) or a regex from make_suffix_regex"""
+    regex = suffixes if isinstance(suffixes, re.Pattern) else make_suffix_regex(suffixes)
+    m = regex.search(name)
+    return name if m is None else name[:m.start()]
+
+
+def niave_long_to_short_name(all_names, suffixes=None):
     """return a dictionary mapping long name to a short name
-    using a rules based approach"""
-
-    # TODO: short_name_map needs to be reviewed!, preferable to use some NLP package (spacy?)
-    # This is pretty hard coded list of company name 'suffixes'
-    # - some of these were taken by counting suffixes occrances, removing those and repeating
-    # - others were just a gues
-    suffixes = ['Inc', 'Corp', 'Ltd', 'Co', 'PLC', 'SA', 'AG', 'LLC', 'NV', 'SE',
-                'ASA', 'Bhd', 'SpA', 'Association', 'Aerospace', 'AB', 'Oyj', "Plc"] + \
-               ['Co', 'Holdings', 'Group', 'Technologies', 'International',
-                'Systems', 'Energy', 'Communications', 'Airlines', 'Motor',
-                'Technology', 'Oil', 'Motors', 'Corp', 'Industries', 'Steel',
-                'Holding', 'Airways', 'Aviation', 'Automotive', 'Networks',
-                'Electronics', 'Digital', 'BP', 'Electric', 'Aircraft',
-                'US', 'Mobile', 'Software', 'Broadcom', 'Brands',
-                'Service', 'Semiconductor', 'Petroleum'] + \
-               ['Platforms', 'Precision', 'Industry', 'AeroSystems', 'Media', 'Petrochemical']
-
-
+    using a rules based approach - removing suffixes (see remove_suffix)
+    the dictionary is ordered by the length of the short name, longest first"""
 
     #  'International Business Machines Corp' -> 'IBM'
     # 'News Corp' -> 'News Corp'
     # NOTE: if it starts with air it needs two words
-    short_name = pd.DataFrame([(n, remove_suffix(n, suffixes)) for n in all_names],
-                              columns=["name", "short"])
-    # look at longer names
-    short_name["len"] = [len(n) for n in short_name["short"]]
-    short_name.sort_values("len", ascending=False, inplace=True)
+    regex = make_suffix_regex(suffixes)
+    names = list(all_names)
+    short = [remove_suffix(n, regex) for n in names]
 
-    # making a mapping dictionary
-    short_name_map = {i[0]: i[1] for i in zip(short_name["name"], short_name["short"])}
+    # making a mapping dictionary - look at longer names first
+    order = np.argsort([-len(n) for n in short], kind="stable")
+    short_name_map = {names[i]: short[i] for i in order}
 
     return short_name_map
 
 
-def get_knowledge_base_from_value_chain_data(vc, verbose=True):
-
-    if verbose:
-        print("generating knowledge base ")
-    # NOTE: there can be duplicates in value chain data - a given pair may have multiple entries
-    # - but for difference dates
-    # here will only take the most recent
+KB_VALUE_CHAIN_COLUMNS = ["Parent Name", "Company Name", "Relationship", "Confidence Score (%)"]
 
-    relevant_cols = ["Parent Name", "Company Name", "Relationship", "Confidence Score (%)"]
 
-    if verbose:
-        print("taking most recent entries")
+def most_recent_value_chain(vc):
+    """for each (Parent Name, Company Name, Relationship) keep the entries with the most recent Last Update Date
+    - result is sorted by those columns"""
+    relevant_cols = KB_VALUE_CHAIN_COLUMNS
 
     # for each pair get the Last Update Date
     recent = pd.pivot_table(vc[relevant_cols + ["Last Update Date"]],
@@ -185,11 +204,16 @@ def get_knowledge_base_from_value_chain_data(vc, verbose=True):
     vc = recent.merge(vc[relevant_cols + ["Last Update Date"]],
                       on=["Parent Name", "Company Name", "Relationship", "Last Update Date"],
                       how="left")
+    return vc
+
+
+def flip_value_chain_to_suppliers(vc):
+    """make knowledge base (entity1, entity2, rel) entries from (most recent) value chain data
+    all Relationship = 'Customer' are 'flipped' to 'Supplier', returns the most recent entry for each
+    (entity1, entity2, rel) - including any where a company supplies itself"""
 
-    if verbose:
-        print("'flipping' value chain: all Relationship = 'Customer' -> 'Supplier' ")
     # select a subset of value chain data to make knowledge base
-    kb = vc[relevant_cols + ["Last Update Date"]].copy(True)
+    kb = vc[KB_VALUE_CHAIN_COLUMNS + ["Last Update Date"]].copy(True)
     kb.rename(columns={"Parent Name": "entity1", "Company Name": "entity2", "Relationship": "rel"},
               inplace=True)
     # select just customers
@@ -216,67 +240,73 @@ def get_knowledge_base_from_value_chain_data(vc, verbose=True):
     kb = kb_recent.merge(kb,
                          on=["entity1", "entity2", "rel", "Last Update Date"],
                          how="left")
-
-    # drop any entries where company supplies self
-    kb = kb.loc[kb["entity1"] != kb["entity2"]]
-
     return kb
 
 
-def get_bidirectional_suppliers(kb, verbose=True):
-    """given the knowledge base extract the entity pairs that 'go both ways'
-    i.e. (A supplies B) AND (B supplies A)"""
+def get_knowledge_base_from_value_chain_data(vc, verbose=True):
 
     if verbose:
-        print("getting companies that have bi-directional supplier relationship")
-
-    e1s = kb["entity1"].values
-    e2s = kb["entity2"].values
-
-    # get the unique entities 1
-    e1s_u = np.unique(e1s)
-
-    bi_dir = []
+        print("generating knowledge base ")
+    # NOTE: there can be duplicates in value chain data - a given pair may have multiple entries
+    # - but for difference dates
+    # here will only take the most recent
+    # see knowledge_base.IncrementalKnowledgeBase for (re)building from only new value chain data
 
-    # for each entity1 - get all the entity 2
-    # - then for each of those entity2 see if when
-    # - it's entity1 does it contain the other (org e1)
-    for i, e1 in enumerate(np.unique(e1s_u)):
-        if (i % 100 == 0) & verbose:
-            print(f"{i}/{len(e1s_u)}")
+    if verbose:
+        print("taking most recent entries")
+    vc = most_recent_value_chain(vc)
 
-        # all of e1's e2s
-        e1_e2s = e2s[e1s==e1]
+    if verbose:
+        print("'flipping' value chain: all Relationship = 'Customer' -> 'Supplier' ")
+    kb = flip_value_chain_to_suppliers(vc)
 
-        # for each of the entity2, check if / when it's e1
-        for e1_e2 in e1_e2s:
-            #
-            if e1 in e2s[e1s == e1_e2]:
-                # print((e1, e1_e2))
-                bi_dir.append((e1, e1_e2))
+    # drop any entries where company supplies self
+    kb = kb.loc[kb["entity1"] != kb["entity2"]]
 
-    # for each bi-directional entity pair
-    out = []
-    for bd in bi_dir:
-        e1, e2 = bd
+    return kb
 
-        # b1 = ((kb["entity1"] == e1) & (kb["entity2"] == e2)).values.any()
-        # b2 = ((kb["entity1"] == e2) & (kb["entity2"] == e1)).values.any()
 
-        b1 = ((e1s == e1) & (e2s == e2)).any()
-        b2 = ((e1s == e2) & (e2s == e1)).any()
+def get_bidirectional_suppliers(kb, verbose=True):
+    """given the knowledge base extract the entity pairs that 'go both ways'
+    i.e. (A supplies B) AND (B supplies A)
 
-        assert b1 & b2, "expected both"
+    returns the rows of kb for both directions of each pair, duplicates dropped
+    - ordered as before: by (sorted) entity1 of the pair, then (A, B) rows followed by (B, A) rows
+    """
 
-        k1 = kb.loc[(kb["entity1"] == e1) & (kb["entity2"] == e2)]
-        k2 = kb.loc[(kb["entity1"] == e2) & (kb["entity2"] == e1)]
+    if verbose:
+        print("getting companies that have bi-directional supplier relationship")
 
-        out.append(pd.concat([k1, k2]))
+    # integer encode entities - codes are in sorted order of the entity names
+    _, codes = np.unique(np.concatenate([kb["entity1"].values, kb["entity2"].values]),
+                         return_inverse=True)
+    codes = codes.astype(np.int64)
+    n = len(kb)
+    c1, c2 = codes[:n], codes[n:]
 
-    res = pd.concat(out)
+    # a pair is bi-directional if the reverse (entity2, entity1) is also a key - single hash lookup per row
+    num_entities = codes.max() + 1 if n > 0 else 0
+    keys = c1 * num_entities + c2
+    rev_keys = c2 * num_entities + c1
+    bi = pd.Index(keys).isin(rev_keys)
 
-    # due to bi-directional nature there will be duplicates
-    # - drop those!
+    if verbose:
+        print(f"found: {bi.sum()} rows in bi-directional pairs")
+
+    # order rows as the pairs were found: for each entity1 (sorted) it's entity2 in order of first appearance
+    # - each pair is found first at the lower of it's entities, rows in that direction come first
+    pos = np.flatnonzero(bi)
+    lo = np.minimum(c1[pos], c2[pos])
+    hi = np.maximum(c1[pos], c2[pos])
+    reverse = (c1[pos] != lo).astype(np.int8)
+    pair_keys = lo * num_entities + hi
+    # first appearance of the (lo, hi) direction of each pair
+    first_pos = pd.Series(np.where(reverse == 0, pos, n)).groupby(pair_keys).transform("min").values
+
+    order = np.lexsort((pos, reverse, first_pos, lo))
+    res = kb.iloc[pos[order]]
+
+    # drop any duplicate entries
     res = res.drop_duplicates()
 
     return res
@@ -318,6 +348,57 @@ def get_most_confidence_bidirectional_pair(bi_dir):
     return bd
 
 
+def get_company_names(vc, parents_only=False):
+    """get the (unique) company names to search for in articles from the value chain data"""
+
+    if parents_only:
+        company_names = vc["Parent Name"].unique()
+    else:
+        # TODO: remove confidence score
+        company_names = np.concatenate([vc["Parent Name"].unique(),
+                                        vc.loc[vc['Confidence Score (%)'] > 0.9, "Company Name"].unique()])
+        # there are some nans in the data, on the Company Name side?
+        company_names = company_names[~pd.isnull(company_names)]
+        company_names = np.unique(company_names)
+
+    return company_names
+
+
+def get_set_name(art_db, company_names, verbose=True):
+    """get the 'set name' for a set of company names, from the 'setnames' document
+    in the articles_searched collection. if the set has not been used before it is added
+
+    will store company names belonging to a set in a single document and then
+    refer to the 'set name' searched in article
+    - to avoid storing many long arrays in database which can slow things down
+    """
+
+    set_names = art_db["articles_searched"].find_one(filter={"docname": "setnames"})
+    # determine if the current set of names matches exactly another set previously used
+    # to search files
+    for k, v in set_names["sets"].items():
+        # TODO: double check this logic, could use interest1d or union1d and then check size
+        if np.in1d(company_names, v).all() & (len(company_names) == len(v)):
+            if verbose:
+                print(f"current name set matched exactly: {k}")
+            return k
+
+    # get the largest number in set name
+    largest_set_name = max([int(re.sub("\D", "", k)) for k in set_names["sets"].keys()])
+    setname = f"set_names{largest_set_name+1}"
+
+    # add the names in the current set to the 'setnames' doc
+    set_names['sets'][setname] = np.asarray(company_names).tolist()
+    doc_filter = {"docname": "setnames"}
+    if verbose:
+        print(f"adding: {setname} to document containing:\n{json.dumps(doc_filter, indent=4)}\nunder 'sets'")
+    # TODO: is there are more efficient way to update a nest field, than setting entire document? probably
+    art_db["articles_searched"].update_one(filter={"docname": "setnames"},
+                                           update={"$set": set_names},
+                                           upsert=True)
+    return setname
+
+
 def get_config(sysargv, argpos=1, default="commoncrawl.json", verbose=True):
     """allow config to be passed in as argument to script"""
 
@@ -399,3 +480,16 @@ if __name__ == "__main__":
     # aim is to get a reduced set of company names to search
     # - as it can be very slow to search for each company one by one
     short_list = get_list_from_tree(text, rtree)
+
+    # ---
+    # searching for (many) names in text - using a CompanyNameMatcher (single pass over text)
+    # ---
+
+    matcher = CompanyNameMatcher(c)
+
+    # all names found along with their (start, end) character locations
+    spans = matcher.find_spans(text)
+    print(spans)
+
+    # can be used in place of a regular expression tree
+    names_found = get_list_from_tree(text, matcher)
@@ -0,0 +1,236 @@
+# on-disk cache of (common crawl) warc files with a byte budget
+# - files are only added once downloaded completely: size (vs Content-Length / expected size)
+#   and the gzip trailer of the last record are checked
+# - files already on disk are checked the same way before being reused, incomplete files are removed
+# - when adding a file would go over the budget the least recently used files are removed
+#   (a file's modification time is set when it is used, so the cache is shared by processes / runs)
+# - files in use (pinned) are never removed
+#
+# to check the files in a cache directory (and remove incomplete ones):
+#   python -m supply_chain_extract.warc_cache <warc_dir> [<warc_list.csv>]
+
+import os
+import sys
+import zlib
+import shutil
+import threading
+import urllib.parse
+import urllib.request
+
+import pandas as pd
+
+from supply_chain_extract import get_data_path
+
+
+GZIP_MAGIC = b"\x1f\x8b\x08"
+
+
+def get_expected_warc_sizes(warc_list=None):
+    """dict of warc file name -> size (bytes), from a list of warc files (csv with name and size columns)
+    returns an empty dict if the file does not exist"""
+    if warc_list is None:
+        warc_list = get_data_path("common_crawl_news_warc_gz_list.csv")
+    if not os.path.exists(warc_list):
+        return {}
+    ccf = pd.read_csv(warc_list, usecols=["name", "size"])
+    return dict(zip(ccf["name"], ccf["size"].astype(int)))
+
+
+def has_complete_gzip_trailer(path, tail_bytes=2**20):
+    """check the last gzip member of a (multi-member) gzip file is complete
+    - warc.gz files have one gzip member per record, so only the tail of the file needs to be read
+    - the member is decompressed, which checks it's crc32 and (uncompressed) size in the trailer"""
+    size = os.path.getsize(path)
+    if size < 18:
+        return False
+    with open(path, "rb") as f:
+        f.seek(max(0, size - tail_bytes))
+        tail = f.read()
+
+    # search backwards for the start of the last member - the magic bytes can also
+    # appear inside compressed data, so try each candidate until one decompresses to the end of the file
+    start = tail.rfind(GZIP_MAGIC)
+    while start >= 0:
+        d = zlib.decompressobj(wbits=31)
+        try:
+            d.decompress(tail[start:])
+            if d.eof and (len(d.unused_data) == 0):
+                return True
+        except zlib.error:
+            pass
+        start = tail.rfind(GZIP_MAGIC, 0, start)
+    return False
+
+
+def is_complete_warc(path, expected_size=None):
+    """check a (local) warc.gz file was downloaded completely"""
+    if not os.path.isfile(path):
+        return False
+    if (expected_size is not None) and (os.path.getsize(path) != expected_size):
+        return False
+    return has_complete_gzip_trailer(path)
+
+
+class WarcCache:
+    """cache of warc files in a directory, limited to max_bytes (None: no limit)
+
+    expected_sizes: dict of warc file (or url) -> size in bytes, used to check files are complete
+    - see get_expected_warc_sizes
+
+    example:
+        cache = WarcCache(warc_dir, max_bytes=10 * 2**30)
+        local_path, downloaded = cache.get(url, local_path)   # download (or reuse), pinned until released
+        ...
+        cache.release(local_path)
+    """
+
+    def __init__(self, cache_dir, max_bytes=None, expected_sizes=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.expected_sizes = {} if expected_sizes is None else expected_sizes
+        # local path -> number of times in use
+        self._pinned = {}
+        # bytes being downloaded (by threads of this process) - not yet in the cache
+        self._pending = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _expected_size(self, name):
+        return self.expected_sizes.get(name)
+
+    def _cached_files(self):
+        # (last used, size, path) of files in the cache - excluding partial downloads
+        files = []
+        for f in os.listdir(self.cache_dir):
+            if f.endswith(".part"):
+                continue
+            path = os.path.join(self.cache_dir, f)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                # removed by another process
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+        return files
+
+    def size(self):
+        """total size (bytes) of files in the cache"""
+        return sum(s for _, s, _ in self._cached_files())
+
+    def _make_room(self, nbytes):
+        # remove least recently used (unpinned) files until nbytes can be added within budget
+        if self.max_bytes is None:
+            return
+        files = self._cached_files()
+        total = sum(s for _, s, _ in files) + self._pending
+        for _, s, path in sorted(files):
+            if total + nbytes <= self.max_bytes:
+                break
+            if path in self._pinned:
+                continue
+            try:
+                os.remove(path)
+                print(f"warc cache: removed (least recently used) {path}")
+            except FileNotFoundError:
+                pass
+            total -= s
+        if total + nbytes > self.max_bytes:
+            print(f"warc cache: can't make room for {nbytes} bytes without removing files in use, "
+                  f"cache will be {total + nbytes} bytes (max_bytes: {self.max_bytes})")
+
+    def _pin(self, path):
+        self._pinned[path] = self._pinned.get(path, 0) + 1
+        # mark as (most recently) used
+        os.utime(path)
+
+    def _download(self, url, local_path, expected_size=None, chunk_size=2**20):
+        # download to a temporary (.part) file, checking it's complete before moving into the cache
+        tmp_path = local_path + ".part"
+        with urllib.request.urlopen(url) as response, open(tmp_path, "wb") as f:
+            content_length = response.headers.get("Content-Length")
+            shutil.copyfileobj(response, f, length=chunk_size)
+        if expected_size is None and content_length is not None:
+            expected_size = int(content_length)
+        if not is_complete_warc(tmp_path, expected_size):
+            os.remove(tmp_path)
+            raise IOError(f"download of:\n{url}\nis incomplete (expected size: {expected_size})")
+        os.replace(tmp_path, local_path)
+        return local_path
+
+    def get(self, url, local_path, name=None):
+        """get a warc file: the cached copy at local_path if complete, otherwise download it
+        name: used to look up the expected size, defaults to url
+        the file is pinned (won't be removed) until release is called
+        returns (local_path, downloaded) - downloaded is False if the cached copy was used"""
+        expected_size = self._expected_size(url if name is None else name)
+
+        with self._lock:
+            if os.path.isfile(local_path):
+                if is_complete_warc(local_path, expected_size):
+                    self._pin(local_path)
+                    return local_path, False
+                print(f"warc cache: {local_path} is incomplete, removing")
+                os.remove(local_path)
+            # make room for the download (roughly 1.1GB if size is not known)
+            nbytes = 1200 * 2**20 if expected_size is None else expected_size
+            self._make_room(nbytes)
+            self._pending += nbytes
+
+        # download outside of the lock - so other files can be downloaded at the same time
+        try:
+            self._download(url, local_path, expected_size)
+        finally:
+            with self._lock:
+                self._pending -= nbytes
+
+        with self._lock:
+            self._pin(local_path)
+            # the actual size may differ from that expected
+            self._make_room(0)
+        return local_path, True
+
+    def release(self, local_path):
+        """unpin a file - so it can be removed from the cache"""
+        with self._lock:
+            n = self._pinned.get(local_path, 0) - 1
+            if n > 0:
+                self._pinned[local_path] = n
+            else:
+                self._pinned.pop(local_path, None)
+
+    def remove_incomplete(self, names=None):
+        """remove incomplete files (and partial downloads) from the cache, returns the paths removed
+        names: dict of local path -> warc file name, to check sizes against expected_sizes"""
+        names = {} if names is None else names
+        removed = []
+        with self._lock:
+            for f in os.listdir(self.cache_dir):
+                path = os.path.join(self.cache_dir, f)
+                if path in self._pinned:
+                    continue
+                if f.endswith(".part") or \
+                        not is_complete_warc(path, self._expected_size(names.get(path, path))):
+                    os.remove(path)
+                    removed.append(path)
+        return removed
+
+
+if __name__ == "__main__":
+
+    assert len(sys.argv) >= 2, "usage: python -m supply_chain_extract.warc_cache <warc_dir> [<warc_list.csv>]"
+
+    warc_dir = sys.argv[1]
+    expected_sizes = get_expected_warc_sizes(sys.argv[2] if len(sys.argv) > 2 else None)
+
+    # local files are named by (quoted) url - match to warc file names by the end of the url
+    cache = WarcCache(warc_dir, expected_sizes=expected_sizes)
+    names = {}
+    for f in os.listdir(warc_dir):
+        url = urllib.parse.unquote_plus(f)
+        for n in expected_sizes.keys():
+            if url.endswith(n):
+                names[os.path.join(warc_dir, f)] = n
+                break
+
+    removed = cache.remove_incomplete(names)
+    print(f"removed: {len(removed)} incomplete files, cache size: {cache.size() / 2**30:.2f}GB")
@@ -0,0 +1,178 @@
+# index of the (response) records in a warc file: host, uri, (compressed) offset and length, dates
+# - written while a warc file is extracted (see warc_stream.extract_from_warc_stream)
+# - allows articles to be re-extracted (i.e. after changing the valid hosts) by reading only
+#   the byte ranges of the records needed - from a local copy of the warc file, or with http range requests
+#
+# one index file per warc file: <index_dir>/<quote_plus(warc file name)>.tsv.gz
+#
+# to re-extract articles for the hosts in a (commoncrawl) config, using the indexes in my_warc_index_dir:
+#   python -m supply_chain_extract.warc_index <path_to_config> [--hosts host1 host2 ...]
+
+import io
+import os
+import re
+import sys
+import gzip
+import argparse
+import urllib.parse
+import urllib.request
+
+import pandas as pd
+from warcio.archiveiterator import ArchiveIterator
+
+
+INDEX_SUFFIX = ".tsv.gz"
+INDEX_COLUMNS = ["host", "uri", "offset", "length", "warc_date", "date_publish", "extracted"]
+
+
+def get_index_path(index_dir, warc_file):
+    return os.path.join(index_dir, urllib.parse.quote_plus(warc_file) + INDEX_SUFFIX)
+
+
+def get_warc_file_from_index_path(index_path):
+    return urllib.parse.unquote_plus(re.sub(f"{re.escape(INDEX_SUFFIX)}$", "", os.path.basename(index_path)))
+
+
+class WarcIndexWriter:
+    """write an index of the records in a warc file
+    - the index is written to a temporary file, which is renamed on close, so an index is always complete"""
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+        self._tmp_path = index_path + ".part"
+        self._f = gzip.open(self._tmp_path, "wt", encoding="utf-8")
+        self._f.write("\t".join(INDEX_COLUMNS) + "\n")
+
+    def add(self, record, article, offset, length):
+        """add a record - article is the extracted article (None if the record was not extracted)"""
+        uri = record.rec_headers.get_header('WARC-Target-URI') or ""
+        host = urllib.parse.urlsplit(uri).hostname or ""
+        date_publish = "" if article is None else str(getattr(article, "date_publish", "") or "")
+        row = [host, uri, str(offset), str(length),
+               record.rec_headers.get_header('WARC-Date') or "",
+               date_publish, str(int(article is not None))]
+        # tabs / new lines in uris would break the file
+        self._f.write("\t".join(re.sub("[\t\n]", " ", r) for r in row) + "\n")
+
+    def close(self):
+        self._f.close()
+        os.replace(self._tmp_path, self.index_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        # only keep the index if the warc file was read completely
+        if exc_type is None:
+            self.close()
+        else:
+            self._f.close()
+            os.remove(self._tmp_path)
+
+
+def read_warc_index(index_path):
+    """read in a warc index as a DataFrame"""
+    return pd.read_csv(index_path, sep="\t", dtype={"host": str, "uri": str, "warc_date": str, "date_publish": str},
+                       keep_default_na=False, quoting=3)
+
+
+def merge_byte_ranges(offsets, lengths, max_gap=2**16):
+    """combine (sorted) byte ranges that are close together - so fewer reads / requests are needed
+    returns a list of (start, end, [(offset, length), ...])"""
+    merged = []
+    for o, l in sorted(zip(offsets, lengths)):
+        if merged and (o - merged[-1][1] <= max_gap):
+            merged[-1][1] = max(merged[-1][1], o + l)
+            merged[-1][2].append((o, l))
+        else:
+            merged.append([o, o + l, [(o, l)]])
+    return [tuple(m) for m in merged]
+
+
+def read_byte_range(source, start, end):
+    """read bytes [start, end) from a local file or a http(s):// / file:// url (using a range request)"""
+    scheme = urllib.parse.urlsplit(source).scheme
+    if scheme in ("http", "https"):
+        req = urllib.request.Request(source, headers={"Range": f"bytes={start}-{end - 1}"})
+        with urllib.request.urlopen(req) as response:
+            data = response.read()
+        assert response.status == 206, f"expected partial content (206) for range request, got: {response.status}"
+        return data
+    path = urllib.request.url2pathname(urllib.parse.urlsplit(source).path) if scheme == "file" else source
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+def iter_indexed_records(source, offsets, lengths, max_gap=2**16):
+    """yield the warc records at the given (compressed) offsets and lengths, reading only those byte ranges"""
+    for start, end, members in merge_byte_ranges(offsets, lengths, max_gap=max_gap):
+        data = read_byte_range(source, start, end)
+        for o, l in members:
+            for record in ArchiveIterator(io.BytesIO(data[o - start: o - start + l])):
+                yield record
+
+
+if __name__ == "__main__":
+
+    # re-extract articles from previously indexed warc files, for the hosts required
+    # - imported here as news_please sets up the article callbacks (and their configuration)
+    from supply_chain_extract import news_please
+    from supply_chain_extract.utils import get_config
+    from supply_chain_extract.warc_pipeline import get_local_warc_path
+    from supply_chain_extract.warc_stream import extract_from_warc_records
+
+    parser = argparse.ArgumentParser(description="re-extract articles from indexed warc files")
+    parser.add_argument("config", nargs="?", default=None,
+                        help="commoncrawl config (json), if not provided will use configs/commoncrawl.json")
+    parser.add_argument("--hosts", nargs="*", default=None,
+                        help="hosts to extract articles for, default: my_filter_valid_hosts from config")
+    args = parser.parse_args()
+
+    cc_config = get_config(sysargv=sys.argv[:1] + ([args.config] if args.config else []),
+                           argpos=1, verbose=True)
+
+    hosts = args.hosts if args.hosts else cc_config.get("my_filter_valid_hosts",
+                                                        ["www.reuters.com", "uk.reuters.com"])
+    print(f"re-extracting articles for hosts:\n{hosts}")
+
+    index_dir = cc_config["my_warc_index_dir"]
+    warc_dir = cc_config["my_local_download_dir_warc"]
+    base_url = cc_config.get("my_warc_base_url", news_please.CC_BASE_URL)
+
+    news_please.init_extraction_process({
+        "my_local_download_dir_article": cc_config["my_local_download_dir_article"],
+        "my_json_export_style": cc_config.get("my_json_export_style", 1),
+        "my_article_store": cc_config.get("my_article_store", "json"),
+        # company names are not searched for when re-extracting
+        "my_company_names": None,
+        "my_set_name": None
+    })
+
+    index_files = sorted([f for f in os.listdir(index_dir) if f.endswith(INDEX_SUFFIX)])
+    print(f"there are: {len(index_files)} warc indexes in\n{index_dir}")
+
+    total = {"passed": 0, "discarded": 0, "error": 0, "total": 0}
+    for i, f in enumerate(index_files):
+        warc_file = get_warc_file_from_index_path(f)
+        idx = read_warc_index(os.path.join(index_dir, f))
+        idx = idx.loc[idx["host"].isin(hosts)]
+        if len(idx) == 0:
+            continue
+
+        # use a local copy of the warc file if there is one, otherwise read byte ranges from remote
+        source = get_local_warc_path(base_url + warc_file, warc_dir)
+        if not os.path.isfile(source):
+            source = base_url + warc_file
+
+        print(f"{i}/{len(index_files)} - reading: {len(idx)} records from\n{source}")
+        counts = extract_from_warc_records(iter_indexed_records(source, idx["offset"].values, idx["length"].values),
+                                           callback_on_article_extracted=news_please.on_valid_article_extracted,
+                                           valid_hosts=hosts,
+                                           strict_date=cc_config.get("my_filter_strict_date", True),
+                                           continue_after_error=cc_config.get("my_continue_after_error", True))
+        for k in total.keys():
+            total[k] += counts[k]
+
+    print(f"articles extracted: {total['passed']}, discarded: {total['discarded']}, errors: {total['error']}")
@@ -0,0 +1,115 @@
+# pipeline for fetching (common crawl) warc files: download and extraction run as separate stages
+# - downloads (network / disk bound) run in a thread pool, prefetching up to download_queue_depth files
+# - extraction (cpu bound) runs in a process pool, on files already downloaded
+# - so while files are being extracted the next ones are being downloaded
+# - items can be dropped between stages (i.e. if the lease on a warc file was lost), see is_dropped
+
+import os
+import urllib.parse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+
+def get_local_warc_path(warc_download_url, local_download_dir_warc):
+    """local file path for a warc file - the same as used by newsplease's CommonCrawlExtractor
+    so the extractor will use the downloaded file instead of downloading again"""
+    return os.path.join(local_download_dir_warc, urllib.parse.quote_plus(warc_download_url))
+
+
+def run_warc_pipeline(claim, download, extract,
+                      on_complete=None, on_error=None, is_dropped=None, on_dropped=None,
+                      download_queue_depth=2, download_threads=1, extraction_processes=1,
+                      extraction_initializer=None, extraction_initargs=(),
+                      verbose=True):
+    """run download and extraction of warc files as overlapping stages
+
+    claim: function returning the next item (i.e. warc file name) to work on, or None if there are none left
+    download: function(item) -> local path, run in a thread
+    extract: function(item, local_path), run in a process - must be picklable (i.e. defined at module level)
+    on_complete: function(item, result), called (in this thread) after an item has been extracted
+    - result is the value returned by extract
+    on_error: function(item, exception), called (in this thread) if downloading or extracting failed
+    is_dropped: function(item) -> True if the item should no longer be worked on (i.e. it's lease was lost),
+    checked after it's downloaded and before it's extracted - an extraction already running is not stopped
+    on_dropped: function(item), called (in this thread) for items dropped
+    download_queue_depth: max number of items downloading or downloaded but waiting to be extracted
+    download_threads: number of concurrent downloads
+    extraction_processes: number of extraction processes
+    extraction_initializer, extraction_initargs: passed to the extraction process pool
+    - i.e. to set configuration in each process
+    """
+
+    # futures for each stage -> item
+    downloading = {}
+    extracting = {}
+    # downloaded items, waiting for an extraction process: (item, local_path)
+    downloaded = deque()
+
+    no_more_items = False
+    counts = {"complete": 0, "error": 0, "dropped": 0}
+
+    def dropped(item):
+        if (is_dropped is None) or (not is_dropped(item)):
+            return False
+        counts["dropped"] += 1
+        if verbose:
+            print(f"dropping: {item}")
+        if on_dropped is not None:
+            on_dropped(item)
+        return True
+
+    with ThreadPoolExecutor(max_workers=download_threads) as download_pool, \
+            ProcessPoolExecutor(max_workers=extraction_processes,
+                                initializer=extraction_initializer,
+                                initargs=extraction_initargs) as extraction_pool:
+
+        while True:
+
+            # prefetch: keep the download queue full
+            while (not no_more_items) and (len(downloading) + len(downloaded) < download_queue_depth):
+                item = claim()
+                if item is None:
+                    no_more_items = True
+                    break
+                if verbose:
+                    print(f"downloading: {item}")
+                downloading[download_pool.submit(download, item)] = item
+
+            # hand downloaded files to any free extraction processes
+            while (len(downloaded) > 0) and (len(extracting) < extraction_processes):
+                item, local_path = downloaded.popleft()
+                if dropped(item):
+                    continue
+                if verbose:
+                    print(f"extracting: {item}")
+                extracting[extraction_pool.submit(extract, item, local_path)] = item
+
+            if (len(downloading) == 0) and (len(extracting) == 0) and (len(downloaded) == 0):
+                break
+
+            # wait for any download or extraction to finish
+            done, _ = wait(list(downloading.keys()) + list(extracting.keys()),
+                           return_when=FIRST_COMPLETED)
+
+            for f in done:
+                is_download = f in downloading
+                item = downloading.pop(f) if is_download else extracting.pop(f)
+                try:
+                    res = f.result()
+                except Exception as e:
+                    counts["error"] += 1
+                    if verbose:
+                        print(f"{'download' if is_download else 'extraction'} failed for: {item}\n{e}")
+                    if on_error is not None:
+                        on_error(item, e)
+                    continue
+
+                if is_download:
+                    if not dropped(item):
+                        downloaded.append((item, res))
+                else:
+                    counts["complete"] += 1
+                    if on_complete is not None:
+                        on_complete(item, res)
+
+    return counts
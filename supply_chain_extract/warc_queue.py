@@ -0,0 +1,279 @@
+# work queue for (common crawl) warc files to be fetched - i.e. the 'common_crawl_files' collection
+# - a warc file is 'claimed' atomically by a worker with a lease (which expires)
+# - while working on a file the worker renews the lease with a heartbeat (see LeaseHeartbeat)
+# - if a worker dies it's lease expires and the file can be claimed by another worker
+# - once extracted a file is marked as fetched, on error the lease is released so it can be tried again
+# - a worker whose lease was lost (expired and claimed by another worker) should drop the file,
+#   complete() only marks a file as fetched by the worker holding the lease
+#
+# documents / rows have the fields: name, date, fetched, fetched_date
+# and while claimed: lease_owner, lease_expires, as well as attempts (number of times claimed)
+#
+# MongoWarcQueue uses the 'common_crawl_files' collection, SQLiteWarcQueue is a local stand-in,
+# which can be populated from data/common_crawl_news_warc_gz_list.csv:
+#   python -m supply_chain_extract.warc_queue <sqlite_file> [<warc_list.csv>]
+
+import os
+import sys
+import time
+import uuid
+import socket
+import sqlite3
+import datetime
+import threading
+from contextlib import closing
+
+import pandas as pd
+
+from pymongo import ReturnDocument
+
+from supply_chain_extract import get_data_path
+
+
+def get_worker_id():
+    """an id for a worker, unique across processes and machines"""
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+class MongoWarcQueue:
+    """work queue using the (mongodb) 'common_crawl_files' collection
+
+    names: if provided only these warc files (names) will be claimed
+    """
+
+    def __init__(self, collection, lease_seconds=600, max_attempts=3, names=None):
+        self.collection = collection
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.names = None if names is None else list(names)
+
+    def _claimable(self, now):
+        filter = {"fetched": False,
+                  "$and": [
+                      # lease_expires: None matches missing or null
+                      {"$or": [{"lease_expires": None}, {"lease_expires": {"$lt": now}}]},
+                      {"$or": [{"attempts": None}, {"attempts": {"$lt": self.max_attempts}}]}
+                  ]}
+        if self.names is not None:
+            filter["name"] = {"$in": self.names}
+        return filter
+
+    def claim(self, worker_id):
+        """claim the next available warc file, returns it's name or None if there are none left"""
+        now = datetime.datetime.utcnow()
+        doc = self.collection.find_one_and_update(
+            filter=self._claimable(now),
+            update={"$set": {"lease_owner": worker_id,
+                             "lease_expires": now + datetime.timedelta(seconds=self.lease_seconds)},
+                    "$inc": {"attempts": 1}},
+            projection={"name": 1},
+            sort=[("name", 1)],
+            return_document=ReturnDocument.AFTER)
+        return None if doc is None else doc["name"]
+
+    def heartbeat(self, name, worker_id):
+        """renew the lease on a warc file, returns False if the lease is no longer held by worker_id"""
+        now = datetime.datetime.utcnow()
+        res = self.collection.update_one(
+            filter={"name": name, "lease_owner": worker_id},
+            update={"$set": {"lease_expires": now + datetime.timedelta(seconds=self.lease_seconds)}})
+        return res.matched_count > 0
+
+    def complete(self, name, worker_id, fetched_date=None):
+        """mark a warc file as fetched, if the lease is still held by worker_id
+        returns False if the lease was lost (i.e. the file was claimed by another worker) - nothing is updated"""
+        if fetched_date is None:
+            fetched_date = datetime.datetime.now().strftime("%Y-%m-%d")
+        res = self.collection.update_one(
+            filter={"name": name, "lease_owner": worker_id},
+            update={"$set": {"fetched": True, "fetched_date": fetched_date, "fetched_by": worker_id},
+                    "$unset": {"lease_owner": "", "lease_expires": ""}})
+        return res.matched_count > 0
+
+    def release(self, name, worker_id, error=None):
+        """release the lease on a warc file (i.e. after an error) so it can be claimed again"""
+        update = {"$set": {"fetched": False},
+                  "$unset": {"lease_owner": "", "lease_expires": ""}}
+        if error is not None:
+            update["$set"]["error_message"] = str(error)
+        self.collection.update_one(filter={"name": name, "lease_owner": worker_id},
+                                   update=update)
+
+    def count_remaining(self):
+        """number of warc files that can be claimed now"""
+        return self.collection.count_documents(self._claimable(datetime.datetime.utcnow()))
+
+
+class SQLiteWarcQueue:
+    """work queue using a (local) sqlite database - a stand-in for MongoWarcQueue
+
+    a new connection is used for each operation, so can be shared by threads and processes
+    names: if provided only these warc files (names) will be claimed
+    """
+
+    def __init__(self, path, lease_seconds=600, max_attempts=3, names=None):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.names = None if names is None else set(names)
+
+        with closing(self._connect()) as con:
+            con.execute("CREATE TABLE IF NOT EXISTS common_crawl_files ("
+                        "name TEXT PRIMARY KEY, date TEXT, fetched INTEGER NOT NULL DEFAULT 0, "
+                        "fetched_date TEXT, fetched_by TEXT, lease_owner TEXT, lease_expires REAL, "
+                        "attempts INTEGER NOT NULL DEFAULT 0, error_message TEXT)")
+
+    def _connect(self):
+        # isolation_level=None: transactions are managed explicitly (BEGIN IMMEDIATE in claim)
+        return sqlite3.connect(self.path, timeout=60, isolation_level=None)
+
+    def add_files(self, files):
+        """add warc files (dicts with 'name' and 'date') to the queue, those already present are ignored"""
+        with closing(self._connect()) as con:
+            con.executemany("INSERT OR IGNORE INTO common_crawl_files (name, date) VALUES (?, ?)",
+                            [(f["name"], str(f.get("date"))) for f in files])
+
+    def claim(self, worker_id):
+        """claim the next available warc file, returns it's name or None if there are none left"""
+        now = time.time()
+        con = self._connect()
+        try:
+            # take the write lock before reading - so no other worker can claim the same file
+            con.execute("BEGIN IMMEDIATE")
+            rows = con.execute("SELECT name FROM common_crawl_files "
+                               "WHERE fetched = 0 AND (lease_expires IS NULL OR lease_expires < ?) "
+                               "AND attempts < ? ORDER BY name",
+                               (now, self.max_attempts))
+            name = None
+            for (n,) in rows:
+                if (self.names is None) or (n in self.names):
+                    name = n
+                    break
+            if name is not None:
+                con.execute("UPDATE common_crawl_files "
+                            "SET lease_owner = ?, lease_expires = ?, attempts = attempts + 1 WHERE name = ?",
+                            (worker_id, now + self.lease_seconds, name))
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+        finally:
+            con.close()
+        return name
+
+    def heartbeat(self, name, worker_id):
+        """renew the lease on a warc file, returns False if the lease is no longer held by worker_id"""
+        with closing(self._connect()) as con:
+            cur = con.execute("UPDATE common_crawl_files SET lease_expires = ? WHERE name = ? AND lease_owner = ?",
+                              (time.time() + self.lease_seconds, name, worker_id))
+        return cur.rowcount > 0
+
+    def complete(self, name, worker_id, fetched_date=None):
+        """mark a warc file as fetched, if the lease is still held by worker_id
+        returns False if the lease was lost (i.e. the file was claimed by another worker) - nothing is updated"""
+        if fetched_date is None:
+            fetched_date = datetime.datetime.now().strftime("%Y-%m-%d")
+        with closing(self._connect()) as con:
+            cur = con.execute("UPDATE common_crawl_files SET fetched = 1, fetched_date = ?, fetched_by = ?, "
+                              "lease_owner = NULL, lease_expires = NULL WHERE name = ? AND lease_owner = ?",
+                              (fetched_date, worker_id, name, worker_id))
+        return cur.rowcount > 0
+
+    def release(self, name, worker_id, error=None):
+        """release the lease on a warc file (i.e. after an error) so it can be claimed again"""
+        with closing(self._connect()) as con:
+            con.execute("UPDATE common_crawl_files SET lease_owner = NULL, lease_expires = NULL, "
+                        "error_message = COALESCE(?, error_message) WHERE name = ? AND lease_owner = ?",
+                        (None if error is None else str(error), name, worker_id))
+
+    def count_remaining(self):
+        """number of warc files that can be claimed now"""
+        with closing(self._connect()) as con:
+            rows = con.execute("SELECT name FROM common_crawl_files "
+                               "WHERE fetched = 0 AND (lease_expires IS NULL OR lease_expires < ?) "
+                               "AND attempts < ?",
+                               (time.time(), self.max_attempts)).fetchall()
+        return sum((self.names is None) or (n in self.names) for (n,) in rows)
+
+
+class LeaseHeartbeat(threading.Thread):
+    """background thread renewing the leases of warc files being worked on
+
+    example:
+        with LeaseHeartbeat(queue, worker_id) as hb:
+            hb.add(name)
+            ...
+            hb.discard(name)
+
+    names whose lease could not be renewed (i.e. expired and claimed by another worker) are added to .lost
+    (until they are added again, i.e. claimed again by this worker)
+    """
+
+    def __init__(self, queue, worker_id, names=None, interval=None):
+        super().__init__(daemon=True)
+        self.queue = queue
+        self.worker_id = worker_id
+        # by default renew three times per lease
+        self.interval = queue.lease_seconds / 3 if interval is None else interval
+        self.names = set() if names is None else set(names)
+        self.lost = set()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def add(self, name):
+        with self._lock:
+            self.names.add(name)
+            # name may have been lost on an earlier claim - this is a new lease
+            self.lost.discard(name)
+
+    def discard(self, name):
+        with self._lock:
+            self.names.discard(name)
+
+    def is_lost(self, name):
+        """True if the lease on name could not be renewed - the file should be dropped"""
+        with self._lock:
+            return name in self.lost
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            with self._lock:
+                names = list(self.names)
+            for name in names:
+                try:
+                    ok = self.queue.heartbeat(name, self.worker_id)
+                except Exception as e:
+                    # e.g. a network issue - try again next interval
+                    print(f"heartbeat for: {name} failed\n{e}")
+                    continue
+                if not ok:
+                    with self._lock:
+                        self.lost.add(name)
+                        self.names.discard(name)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+        self.join()
+
+
+if __name__ == "__main__":
+
+    # create / populate a local (sqlite) queue from a list of warc files
+    assert len(sys.argv) >= 2, "usage: python -m supply_chain_extract.warc_queue <sqlite_file> [<warc_list.csv>]"
+
+    sqlite_file = sys.argv[1]
+    warc_list = sys.argv[2] if len(sys.argv) > 2 else get_data_path("common_crawl_news_warc_gz_list.csv")
+
+    ccf = pd.read_csv(warc_list)
+
+    queue = SQLiteWarcQueue(sqlite_file)
+    queue.add_files(ccf[["name", "date"]].to_dict("records"))
+
+    print(f"there are: {queue.count_remaining()} warc files in:\n{sqlite_file}")
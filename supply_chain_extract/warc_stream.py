@@ -0,0 +1,180 @@
+# streaming extraction of articles from (common crawl) warc files - without saving the warc file to disk
+# - records are read one by one (gzip member by member) straight from the http response or a local file
+# - the host of each record (from WARC-Target-URI) is checked against valid_hosts before any html is parsed
+# - articles passing the filters are handed straight to the callback
+# - optionally an index of the records is written, see warc_index.py
+#
+# to time extraction from a single warc file (e.g. a local copy, for offline benchmarking):
+#   python -m supply_chain_extract.warc_stream file:///path/to/CC-NEWS-20200101000000-00000.warc.gz [host ...]
+
+import sys
+import time
+import urllib.parse
+import urllib.request
+
+from dateutil import parser
+from warcio.archiveiterator import ArchiveIterator
+from newsplease import NewsPlease, EmptyResponseError
+
+from supply_chain_extract.warc_index import WarcIndexWriter
+
+
+def open_warc_source(source):
+    """open a warc file for reading as a stream: source can be an http(s):// or file:// url, or a local path"""
+    if urllib.parse.urlsplit(source).scheme in ("http", "https", "file"):
+        return urllib.request.urlopen(source)
+    return open(source, "rb")
+
+
+def get_record_host(record):
+    """the host name of a warc record's WARC-Target-URI (None if not available)"""
+    url = record.rec_headers.get_header('WARC-Target-URI')
+    if url is None:
+        return None
+    return urllib.parse.urlsplit(url).hostname
+
+
+def get_publishing_date(article):
+    if getattr(article, "date_publish", None) is None:
+        return None
+    return parser.parse(article.date_publish) if isinstance(article.date_publish, str) else article.date_publish
+
+
+def extract_from_warc_records(records, callback_on_article_extracted,
+                              valid_hosts=None,
+                              start_date=None, end_date=None, strict_date=True,
+                              continue_after_error=True, ignore_unicode_errors=False, fetch_images=False,
+                              callback_on_record=None):
+    """extract articles from warc records (i.e. from an ArchiveIterator)
+
+    callback_on_article_extracted: function(article), for each article passing the filters
+    valid_hosts: if None or empty any host is OK, otherwise a record's host must be in valid_hosts
+    - NOTE: the host must match exactly, newsplease checks if a valid host is contained in the url
+    start_date, end_date, strict_date: filter on article publish date, as in newsplease
+    callback_on_record: function(record, article), called for every response record
+    - article is None if the record was not extracted (i.e. filtered on host)
+
+    returns dict of counters: passed, discarded, error, total
+    """
+
+    valid_hosts = set(valid_hosts) if valid_hosts else None
+    decode_errors = "replace" if ignore_unicode_errors else "strict"
+
+    counter_article_total = 0
+    counter_article_passed = 0
+    counter_article_discarded = 0
+    counter_article_error = 0
+
+    for record in records:
+        if record.rec_type != 'response':
+            continue
+        counter_article_total += 1
+        article = None
+
+        try:
+            # filter by host first - before any parsing of the html
+            if (valid_hosts is not None) and (get_record_host(record) not in valid_hosts):
+                counter_article_discarded += 1
+                continue
+
+            try:
+                article = NewsPlease.from_warc(record, decode_errors=decode_errors, fetch_images=fetch_images)
+            except (UnicodeDecodeError, EmptyResponseError):
+                counter_article_discarded += 1
+                continue
+
+            # filter by date
+            if start_date or end_date:
+                publishing_date = get_publishing_date(article)
+                if publishing_date is None:
+                    if strict_date:
+                        counter_article_discarded += 1
+                        continue
+                elif (start_date and publishing_date < start_date) or \
+                        (end_date and publishing_date > end_date):
+                    counter_article_discarded += 1
+                    continue
+
+            counter_article_passed += 1
+            callback_on_article_extracted(article)
+
+        except Exception as e:
+            if not continue_after_error:
+                raise
+            print(f"error extracting: {record.rec_headers.get_header('WARC-Target-URI')}\n{e}")
+            counter_article_error += 1
+
+        finally:
+            if callback_on_record is not None:
+                callback_on_record(record, article)
+
+    return {"passed": counter_article_passed,
+            "discarded": counter_article_discarded,
+            "error": counter_article_error,
+            "total": counter_article_total}
+
+
+def extract_from_warc_stream(source, callback_on_article_extracted,
+                             callback_on_warc_completed=None,
+                             index_path=None,
+                             **kwargs):
+    """extract articles from a warc file, reading records from a stream
+
+    source: http(s):// or file:// url, or local path of a (gzipped) warc file
+    callback_on_article_extracted: function(article), for each article passing the filters
+    callback_on_warc_completed: function(source, passed, discarded, error, total)
+    - same arguments as newsplease's CommonCrawlExtractor
+    index_path: if provided will write an index of the records in the warc file (see warc_index.py)
+    kwargs: passed to extract_from_warc_records, i.e. valid_hosts, start_date, end_date
+
+    returns dict of counters: passed, discarded, error, total - and bytes (compressed) read
+    """
+
+    with open_warc_source(source) as stream:
+        archive_iterator = ArchiveIterator(stream)
+
+        if index_path is None:
+            counts = extract_from_warc_records(archive_iterator, callback_on_article_extracted, **kwargs)
+        else:
+            with WarcIndexWriter(index_path) as index:
+
+                def add_to_index(record, article):
+                    # the (compressed) offset and length of the current record
+                    index.add(record, article,
+                              offset=archive_iterator.get_record_offset(),
+                              length=archive_iterator.get_record_length())
+
+                counts = extract_from_warc_records(archive_iterator, callback_on_article_extracted,
+                                                   callback_on_record=add_to_index, **kwargs)
+
+        # offset of the end of the last record read
+        counts["bytes"] = archive_iterator.offset
+
+    if callback_on_warc_completed is not None:
+        callback_on_warc_completed(source, counts["passed"], counts["discarded"],
+                                   counts["error"], counts["total"])
+
+    return counts
+
+
+if __name__ == "__main__":
+
+    assert len(sys.argv) >= 2, "usage: python -m supply_chain_extract.warc_stream <source> [host ...]"
+
+    source = sys.argv[1]
+    hosts = sys.argv[2:] if len(sys.argv) > 2 else ["www.reuters.com", "uk.reuters.com"]
+
+    t0 = time.perf_counter()
+    first_article = []
+
+    def on_article(article):
+        if len(first_article) == 0:
+            first_article.append(time.perf_counter() - t0)
+
+    counts = extract_from_warc_stream(source, on_article, valid_hosts=hosts)
+    t1 = time.perf_counter()
+
+    print(f"records: {counts['total']}, articles: {counts['passed']}, errors: {counts['error']}")
+    print(f"time to first article: {first_article[0] if first_article else float('nan'):.2f}s, "
+          f"total time: {t1 - t0:.2f}s, "
+          f"records per second: {counts['total'] / (t1 - t0):.1f}")